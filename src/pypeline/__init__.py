@@ -1 +1,8 @@
+from pathlib import Path
+
 __version__ = "1.36.0"
+
+
+def package_version_file() -> Path:
+    """File holding the package version, used as step input so that steps run again after a pypeline update."""
+    return Path(__file__)
@@ -0,0 +1,234 @@
+import hashlib
+import json
+import os
+import platform
+import posixpath
+import shutil
+import sys
+import tarfile
+import tempfile
+import threading
+import urllib.error
+import urllib.request
+from abc import ABC, abstractmethod
+from pathlib import Path, PurePosixPath, PureWindowsPath
+from typing import Any, Dict, List, Optional
+
+from py_app_dev.core.exceptions import UserNotificationException
+from py_app_dev.core.logging import logger
+
+from . import __version__
+from .domain.pipeline import PipelineStep
+
+#: Name of the archive member listing the archived outputs (project-relative POSIX paths).
+OUTPUTS_MANIFEST = ".pypeline-outputs.json"
+
+
+class ArtifactCacheBackend(ABC):
+    """Storage for step output archives, addressed by cache key. Implement it to plug in another store."""
+
+    @abstractmethod
+    def fetch(self, key: str, target_file: Path) -> bool:
+        """Download the archive stored under ``key`` to ``target_file``. Return False if there is none."""
+
+    @abstractmethod
+    def publish(self, key: str, archive_file: Path) -> None:
+        """Store ``archive_file`` under ``key``."""
+
+
+class LocalDirectoryBackend(ArtifactCacheBackend):
+    """Archives stored in a directory, e.g. on a disk or network share used by all agents."""
+
+    def __init__(self, root_dir: Path) -> None:
+        self.root_dir = root_dir
+
+    def _archive_file(self, key: str) -> Path:
+        return self.root_dir / key[:2] / f"{key}.tar.gz"
+
+    def fetch(self, key: str, target_file: Path) -> bool:
+        archive_file = self._archive_file(key)
+        if not archive_file.is_file():
+            return False
+        shutil.copyfile(archive_file, target_file)
+        return True
+
+    def publish(self, key: str, archive_file: Path) -> None:
+        target_file = self._archive_file(key)
+        target_file.parent.mkdir(parents=True, exist_ok=True)
+        # Copy next to the target and rename, so concurrent readers never see a partial archive
+        tmp_file = target_file.with_name(f"{target_file.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        shutil.copyfile(archive_file, tmp_file)
+        os.replace(tmp_file, target_file)
+
+
+class HttpBackend(ArtifactCacheBackend):
+    """Archives stored on an HTTP server accepting ``GET`` and ``PUT`` of ``<base_url>/<key>.tar.gz`` (e.g. a WebDAV share or an object store)."""
+
+    def __init__(self, base_url: str, headers: Optional[Dict[str, str]] = None, timeout: float = 60) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.headers = headers or {}
+        self.timeout = timeout
+
+    def _url(self, key: str) -> str:
+        return f"{self.base_url}/{key}.tar.gz"
+
+    def fetch(self, key: str, target_file: Path) -> bool:
+        request = urllib.request.Request(self._url(key), headers=self.headers)  # noqa: S310
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response, open(target_file, "wb") as file:  # noqa: S310
+                shutil.copyfileobj(response, file)
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                return False
+            raise
+        return True
+
+    def publish(self, key: str, archive_file: Path) -> None:
+        with open(archive_file, "rb") as file:
+            headers = {**self.headers, "Content-Type": "application/gzip", "Content-Length": str(archive_file.stat().st_size)}
+            request = urllib.request.Request(self._url(key), data=file, headers=headers, method="PUT")  # noqa: S310
+            with urllib.request.urlopen(request, timeout=self.timeout):  # noqa: S310
+                pass
+
+
+def create_artifact_cache_backend(location: str) -> ArtifactCacheBackend:
+    """Create the backend for a cache location: an ``http(s)://`` URL or a local directory (path or ``file://`` URL)."""
+    if location.startswith(("http://", "https://")):
+        headers = {}
+        # The token is read from the environment so it never ends up in a command line or log
+        token = os.environ.get("PYPELINE_ARTIFACT_CACHE_TOKEN")
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        return HttpBackend(location, headers)
+    if location.startswith("file://"):
+        return LocalDirectoryBackend(Path(urllib.request.url2pathname(location[len("file://") :])))
+    if "://" in location:
+        raise UserNotificationException(f"Unsupported artifact cache location '{location}'. Use a directory or an http(s):// URL.")
+    return LocalDirectoryBackend(Path(location))
+
+
+class ArtifactCache:
+    """
+    Content-addressed cache of step outputs shared between workspaces.
+
+    After a step ran, the outputs it declares with :meth:`PipelineStep.get_cache_outputs` are archived under a key
+    derived from the step id and class, its configuration, the content of its inputs, the pypeline version, the
+    platform and the project directory. A step that must run but whose key is found is restored instead.
+    Cache errors are logged and never fail the pipeline: the worst case is running the step.
+
+    The project directory is part of the key because installed outputs (virtual environments, generated
+    configuration) usually embed absolute paths; agents share entries when they build in the same directory.
+    """
+
+    def __init__(self, backend: ArtifactCacheBackend, read_only: bool = False) -> None:
+        self.backend = backend
+        self.read_only = read_only
+
+    def create_key(self, step: PipelineStep[Any], input_hashes: Dict[str, str]) -> str:
+        """Cache key of a step. ``input_hashes`` maps each input path to its content hash."""
+        inputs = []
+        for path_str, input_hash in input_hashes.items():
+            path = Path(path_str)
+            # Inputs outside the project (e.g. the installed pypeline package) are identified by name: their location differs between agents
+            inputs.append((path.relative_to(step.project_root_dir).as_posix() if path.is_relative_to(step.project_root_dir) else path.name, input_hash))
+        key_data = {
+            "step": step.get_id(),
+            "class": f"{step.__class__.__module__}.{step.__class__.__qualname__}",
+            "config": step.get_config(),
+            "inputs": sorted(inputs),
+            "pypeline": __version__,
+            "platform": f"{sys.platform}-{platform.machine()}",
+            "project": step.project_root_dir.as_posix(),
+        }
+        return hashlib.sha256(json.dumps(key_data, sort_keys=True).encode()).hexdigest()
+
+    def restore(self, step: PipelineStep[Any], key: str) -> Optional[List[Path]]:
+        """Restore the step outputs stored under ``key``. Return the restored outputs or None on a cache miss."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            archive_file = Path(tmp_dir) / "outputs.tar.gz"
+            try:
+                if not self.backend.fetch(key, archive_file):
+                    return None
+                return self._extract(archive_file, step.project_root_dir)
+            except Exception as e:
+                logger.warning(f"Could not restore '{step.get_name()}' from the artifact cache: {e}")
+                return None
+
+    def store(self, step: PipelineStep[Any], key: str) -> None:
+        if self.read_only:
+            return
+        outputs = step.get_cache_outputs()
+        if not outputs:
+            return
+        outside = [path for path in outputs if not path.is_relative_to(step.project_root_dir)]
+        if outside:
+            logger.info(f"Outputs of '{step.get_name()}' are not cached: {', '.join(map(str, outside))} is outside the project directory.")
+            return
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            archive_file = Path(tmp_dir) / "outputs.tar.gz"
+            try:
+                self._create_archive(archive_file, [path for path in outputs if path.exists()], step.project_root_dir)
+                self.backend.publish(key, archive_file)
+                logger.info(f"Stored the outputs of '{step.get_name()}' in the artifact cache ({archive_file.stat().st_size} bytes).")
+            except Exception as e:
+                logger.warning(f"Could not store '{step.get_name()}' in the artifact cache: {e}")
+
+    @staticmethod
+    def _create_archive(archive_file: Path, outputs: List[Path], project_root_dir: Path) -> None:
+        relative_outputs = [path.relative_to(project_root_dir).as_posix() for path in outputs]
+        manifest_file = archive_file.with_name(OUTPUTS_MANIFEST)
+        manifest_file.write_text(json.dumps(relative_outputs))
+        # Outputs are mostly binaries and sources: a fast compression level keeps archiving cheap
+        with tarfile.open(archive_file, "w:gz", compresslevel=1) as tar:
+            tar.add(manifest_file, OUTPUTS_MANIFEST)
+            for path, relative_path in zip(outputs, relative_outputs):
+                tar.add(path, relative_path)
+
+    @staticmethod
+    def _extract(archive_file: Path, project_root_dir: Path) -> List[Path]:
+        with tarfile.open(archive_file, "r:gz") as tar:
+            manifest = tar.extractfile(OUTPUTS_MANIFEST)
+            if manifest is None:
+                raise ValueError(f"{OUTPUTS_MANIFEST} is missing in the archive")
+            relative_paths = [Path(relative_path) for relative_path in json.loads(manifest.read())]
+            if any(path.is_absolute() or ".." in path.parts for path in relative_paths):
+                raise ValueError("archived outputs must be inside the project directory")
+            outputs = [project_root_dir / relative_path for relative_path in relative_paths]
+            # Replace the outputs instead of merging into them, so files deleted since are not left behind
+            for path in outputs:
+                if path.is_dir() and not path.is_symlink():
+                    shutil.rmtree(path)
+                elif path.exists() or path.is_symlink():
+                    path.unlink()
+            members = [member for member in tar.getmembers() if member.name != OUTPUTS_MANIFEST]
+            # Also without the extraction filters of newer Python versions, a tampered archive must not write elsewhere
+            ArtifactCache._check_members(members, [path.as_posix() for path in relative_paths])
+            if hasattr(tarfile, "tar_filter"):
+                # Rejects absolute and '..' member names, while keeping symlinks and permissions
+                tar.extractall(project_root_dir, members=members, filter="tar")
+            else:
+                tar.extractall(project_root_dir, members=members)  # noqa: S202
+        return outputs
+
+    @staticmethod
+    def _check_members(members: List[tarfile.TarInfo], outputs: List[str]) -> None:
+        """Reject members which are not files, directories or links inside the outputs, and links pointing out of them."""
+
+        def is_in_outputs(name: str) -> bool:
+            path = PurePosixPath(name)
+            if path.is_absolute() or PureWindowsPath(name).anchor or ".." in path.parts:
+                return False
+            return any(path == PurePosixPath(output) or path.is_relative_to(output) for output in outputs)
+
+        for member in members:
+            if not is_in_outputs(member.name):
+                raise ValueError(f"archive member {member.name!r} is not inside the archived outputs")
+            if member.issym():
+                # The target of a symbolic link is relative to its directory, the one of a hard link to the archive root
+                if not is_in_outputs(posixpath.normpath(posixpath.join(posixpath.dirname(member.name), member.linkname))):
+                    raise ValueError(f"archive member {member.name!r} links to {member.linkname!r}, outside the archived outputs")
+            elif member.islnk():
+                if not is_in_outputs(member.linkname):
+                    raise ValueError(f"archive member {member.name!r} links to {member.linkname!r}, outside the archived outputs")
+            elif not (member.isfile() or member.isdir()):
+                raise ValueError(f"archive member {member.name!r} is not a file, directory or link")
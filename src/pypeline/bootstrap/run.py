@@ -7,15 +7,18 @@ import logging
 import os
 import re
 import shutil
+import stat
 import subprocess  # nosec
 import sys
+import time
 import venv
 from abc import ABC, abstractmethod
+from collections import deque
 from dataclasses import dataclass, field
 from enum import Enum
 from functools import total_ordering
 from pathlib import Path
-from typing import Any, List, Optional, Sequence, Tuple
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
 from urllib.parse import urlparse
 
 logging.basicConfig(level=logging.INFO)
@@ -26,6 +29,9 @@ DEFAULT_PACKAGE_MANAGER = "poetry>=2.1.0"
 DEFAULT_BOOTSTRAP_PACKAGES = ["pip-system-certs>=4.0,<5.0"]
 BOOTSTRAP_COMPLETE_MARKER = ".bootstrap-complete"
 VENV_PYTHON_VERSION_MARKER = ".python_version"
+HASH_CHUNK_SIZE = 1024 * 1024
+# A file modified this recently is not cached: a change within the same mtime tick would go unnoticed
+RACY_MTIME_WINDOW_NS = 2_000_000_000
 
 
 def get_bootstrap_script() -> Path:
@@ -208,6 +214,60 @@ class RunInfoStatus(Enum):
         self.message = message
 
 
+class FileHashCache:
+    """
+    Persistent cache of file hashes (path -> size, mtime_ns, inode, hash).
+
+    A file whose stat() signature is unchanged since it was last hashed is not read again.
+    The cache serves one runnable: the entries of the files it did not look up are dropped when it is saved.
+    """
+
+    def __init__(self, cache_file: Path) -> None:
+        self.cache_file = cache_file
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.used: Set[str] = set()
+        self.modified = False
+        if cache_file.is_file():
+            try:
+                self.entries = json.loads(cache_file.read_text())
+            except (OSError, ValueError):
+                logger.debug(f"Ignoring unreadable file hash cache {cache_file}")
+
+    def get_hash(self, path: Path) -> Optional[str]:
+        """Return the hash of a regular file or None if it does not exist."""
+        try:
+            file_stat = path.stat()
+        except OSError:
+            return None
+        if not stat.S_ISREG(file_stat.st_mode):
+            return None
+        signature = {"size": file_stat.st_size, "mtime_ns": file_stat.st_mtime_ns, "inode": file_stat.st_ino}
+        self.used.add(str(path))
+        entry = self.entries.get(str(path))
+        if entry and all(entry.get(key) == value for key, value in signature.items()):
+            return entry["hash"]
+        file_hash = hashlib.sha256()
+        with open(path, "rb") as file:
+            while chunk := file.read(HASH_CHUNK_SIZE):
+                file_hash.update(chunk)
+        if time.time_ns() - file_stat.st_mtime_ns > RACY_MTIME_WINDOW_NS:
+            self.entries[str(path)] = {**signature, "hash": file_hash.hexdigest()}
+            self.modified = True
+        return file_hash.hexdigest()
+
+    def save(self) -> None:
+        unused = set(self.entries) - self.used
+        for key in unused:
+            del self.entries[key]
+        if not (self.modified or unused):
+            return
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.cache_file.with_suffix(".tmp")
+        tmp_file.write_text(json.dumps(self.entries, indent=1))
+        os.replace(tmp_file, self.cache_file)
+        self.modified = False
+
+
 class Executor:
     """
     Accepts Runnable objects and executes them.
@@ -216,27 +276,23 @@ class Executor:
     and stores the inputs and outputs with their hashes.
     If the file exists, it checks the hashes of the inputs and outputs
     and if they match, it skips the execution.
+    File hashes are cached next to the run info files, so unchanged files are not read again.
     """
 
     RUN_INFO_FILE_EXTENSION = ".deps.json"
+    HASH_CACHE_FILE = "file_hashes.json"
 
     def __init__(self, cache_dir: Path) -> None:
         self.cache_dir = cache_dir
+        self.hash_cache = FileHashCache(cache_dir / self.HASH_CACHE_FILE)
 
-    @staticmethod
-    def get_file_hash(path: Path) -> str:
+    def get_file_hash(self, path: Path) -> str:
         """
         Get the hash of a file.
 
         Returns an empty string if the file does not exist.
         """
-        if path.is_file():
-            with open(path, "rb") as file:
-                bytes = file.read()
-                readable_hash = hashlib.sha256(bytes).hexdigest()
-                return readable_hash
-        else:
-            return ""
+        return self.hash_cache.get_hash(path) or ""
 
     def store_run_info(self, runnable: Runnable) -> None:
         file_info = {
@@ -276,13 +332,16 @@ class Executor:
         return RunInfoStatus.MATCH
 
     def execute(self, runnable: Runnable) -> int:
-        run_info_status = self.previous_run_info_matches(runnable)
-        if run_info_status.should_run:
-            logger.info(f"Executing '{runnable.get_name()}': {run_info_status.message}")
-            exit_code = runnable.run()
-            self.store_run_info(runnable)
-            return exit_code
-        logger.info(f"Skipping '{runnable.get_name()}': {run_info_status.message}")
+        try:
+            run_info_status = self.previous_run_info_matches(runnable)
+            if run_info_status.should_run:
+                logger.info(f"Executing '{runnable.get_name()}': {run_info_status.message}")
+                exit_code = runnable.run()
+                self.store_run_info(runnable)
+                return exit_code
+            logger.info(f"Skipping '{runnable.get_name()}': {run_info_status.message}")
+        finally:
+            self.hash_cache.save()
 
         return 0
 
@@ -292,32 +351,53 @@ class UserNotificationException(Exception):
 
 
 class SubprocessExecutor:
+    """
+    Run a command, streaming its output line by line to the logger.
+
+    stderr is merged into stdout. Only the last ``tail_lines`` lines are kept in memory to report a failure,
+    so commands with a lot of output (e.g. a package manager on a cold cache) do not grow the memory usage.
+    """
+
     def __init__(
         self,
         command: Sequence[str | Path],
         cwd: Optional[Path] = None,
         capture_output: bool = True,
+        tail_lines: int = 100,
     ):
         self.command = " ".join([str(cmd) for cmd in command])
         self.current_working_directory = cwd
         self.capture_output = capture_output
+        self.tail_lines = tail_lines
 
     def execute(self) -> None:
-        result = None
-        try:
-            current_dir = (self.current_working_directory or Path.cwd()).as_posix()
-            logger.info(f"Running command: {self.command} in {current_dir}")
-            # print all virtual environment variables
-            logger.debug(json.dumps(dict(os.environ), indent=4))
-            result = subprocess.run(
-                self.command.split(),  # noqa: S603
-                cwd=current_dir,
-                capture_output=self.capture_output,
-                text=True,  # to get stdout and stderr as strings instead of bytes
-            )
-            result.check_returncode()
-        except subprocess.CalledProcessError as e:
-            raise UserNotificationException(f"Command '{self.command}' failed with:\n{result.stdout if result else ''}\n{result.stderr if result else e}") from e
+        current_dir = (self.current_working_directory or Path.cwd()).as_posix()
+        logger.info(f"Running command: {self.command} in {current_dir}")
+        # print all virtual environment variables
+        logger.debug(json.dumps(dict(os.environ), indent=4))
+        if not self.capture_output:
+            result = subprocess.run(self.command.split(), cwd=current_dir)  # noqa: S603
+            if result.returncode != 0:
+                raise UserNotificationException(f"Command '{self.command}' failed with return code {result.returncode}")
+            return
+        tail: deque[str] = deque(maxlen=self.tail_lines)
+        with subprocess.Popen(  # noqa: S603
+            self.command.split(),
+            cwd=current_dir,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            errors="replace",
+            bufsize=1,
+        ) as process:
+            assert process.stdout  # noqa: S101
+            for line in process.stdout:
+                line = line.rstrip()
+                logger.info(line)
+                tail.append(line)
+        if process.returncode != 0:
+            output = "\n".join(tail)
+            raise UserNotificationException(f"Command '{self.command}' failed with return code {process.returncode}. Last output lines:\n{output}")
 
 
 class VirtualEnvironment(ABC):
@@ -0,0 +1,212 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess  # nosec
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, cast
+
+from py_app_dev.core.exceptions import UserNotificationException
+from py_app_dev.core.logging import logger
+
+from .process_executor import StreamingSubprocessExecutor
+
+#: A reference younger than this is live even if its link does not exist yet: the link is being created.
+REF_GRACE_PERIOD = 3600
+
+
+class CheckoutStore:
+    """
+    Machine-wide store of git checkouts, addressed by repository URL and commit.
+
+    A workspace does not hold its own copy of a dependency but a symbolic link to the store entry, so every workspace
+    on the machine checking out the same commit of the same repository shares one checkout. Layout::
+
+        <root>/<url hash>/<commit>/            the checkout
+        <root>/<url hash>/<commit>.json        url, commit and size; its mtime is the last use
+        <root>/<url hash>/<commit>.refs/<id>   one file per link, holding the link path
+
+    The references are counted by checking that each recorded link still points to the entry, so deleting a workspace
+    releases its entries without telling the store. Entries are never modified after they were added and several
+    processes may use the store concurrently: entries and metadata are created next to their target and renamed.
+
+    The git commands run as the other subprocesses of a step: they get the remaining time of the step as timeout and
+    are killed when the step times out or is cancelled.
+    """
+
+    def __init__(self, root_dir: Path) -> None:
+        self.root_dir = root_dir.absolute()
+
+    def _entry_dir(self, url: str, commit: str) -> Path:
+        return self.root_dir / hashlib.sha256(url.encode()).hexdigest()[:16] / commit
+
+    @staticmethod
+    def _metadata_file(entry_dir: Path) -> Path:
+        return entry_dir.with_name(f"{entry_dir.name}.json")
+
+    @staticmethod
+    def _refs_dir(entry_dir: Path) -> Path:
+        return entry_dir.with_name(f"{entry_dir.name}.refs")
+
+    @staticmethod
+    def _tmp_path(path: Path) -> Path:
+        return path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+    def find(self, url: str, commit: str) -> Optional[Path]:
+        """Return the entry of the commit or None if it is not in the store."""
+        entry_dir = self._entry_dir(url, commit)
+        # The metadata is written last: without it the entry is incomplete
+        return entry_dir if self._metadata_file(entry_dir).is_file() and entry_dir.is_dir() else None
+
+    def add(self, url: str, commit: str, checkout_dir: Path) -> Path:
+        """Move the checkout into the store and return its entry. If the store has the commit already, the checkout is deleted."""
+        entry_dir = self._entry_dir(url, commit)
+        if self.find(url, commit) is None:
+            entry_dir.parent.mkdir(parents=True, exist_ok=True)
+            tmp_dir = self._tmp_path(entry_dir)
+            shutil.move(checkout_dir, tmp_dir)
+            try:
+                os.replace(tmp_dir, entry_dir)
+            except OSError:
+                # Another process added the commit in the meantime
+                shutil.rmtree(tmp_dir)
+            size = _get_size(entry_dir)
+            tmp_file = self._tmp_path(self._metadata_file(entry_dir))
+            tmp_file.write_text(json.dumps({"url": url, "commit": commit, "size": size}))
+            os.replace(tmp_file, self._metadata_file(entry_dir))
+            logger.info(f"Added {url}@{commit} to the checkout store ({size / 1e6:.1f} MB)")
+        if checkout_dir.exists():
+            shutil.rmtree(checkout_dir)
+        return entry_dir
+
+    def link(self, entry_dir: Path, link_path: Path) -> None:
+        """Make ``link_path`` a symbolic link to the entry. A checkout or link at ``link_path`` is replaced."""
+        link_path = link_path.absolute()
+        self.unlink(link_path)
+        if link_path.is_symlink():
+            link_path.unlink()
+        elif link_path.is_dir():
+            shutil.rmtree(link_path)
+        refs_dir = self._refs_dir(entry_dir)
+        refs_dir.mkdir(parents=True, exist_ok=True)
+        # The reference comes first, so that the entry is never collected while it is linked
+        (refs_dir / _ref_id(link_path)).write_text(str(link_path))
+        link_path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.symlink(entry_dir, link_path, target_is_directory=True)
+        except OSError as e:
+            raise UserNotificationException(f"Could not link {link_path} to the checkout store: {e}. On Windows, creating symbolic links requires the developer mode.") from e
+        os.utime(self._metadata_file(entry_dir))
+
+    def unlink(self, link_path: Path) -> None:
+        """Remove ``link_path`` if it is a link to a store entry, and its reference."""
+        link_path = link_path.absolute()
+        if not link_path.is_symlink():
+            return
+        entry_dir = Path(os.readlink(link_path))
+        if entry_dir.is_relative_to(self.root_dir):
+            (self._refs_dir(entry_dir) / _ref_id(link_path)).unlink(missing_ok=True)
+            link_path.unlink()
+
+    def get_ref_count(self, entry_dir: Path) -> int:
+        """Number of links to the entry. References of links which were removed or point elsewhere are deleted."""
+        refs_dir = self._refs_dir(entry_dir)
+        if not refs_dir.is_dir():
+            return 0
+        count = 0
+        for ref_file in refs_dir.iterdir():
+            link_path = Path(ref_file.read_text())
+            if link_path.is_symlink() and Path(os.readlink(link_path)) == entry_dir:
+                count += 1
+            elif time.time() - ref_file.stat().st_mtime < REF_GRACE_PERIOD:
+                count += 1
+            else:
+                ref_file.unlink(missing_ok=True)
+        return count
+
+    def get_entries(self) -> List[Path]:
+        if not self.root_dir.is_dir():
+            return []
+        return [metadata_file.with_suffix("") for metadata_file in self.root_dir.glob("*/*.json") if metadata_file.with_suffix("").is_dir()]
+
+    def collect_garbage(self, max_size: int) -> List[Path]:
+        """
+        Delete unreferenced entries, least recently used first, until the store is not larger than ``max_size`` bytes.
+
+        Referenced entries are never deleted, even if they alone exceed the size. Return the deleted entries.
+        """
+        sizes: Dict[Path, int] = {}
+        last_used: Dict[Path, float] = {}
+        for entry_dir in self.get_entries():
+            metadata_file = self._metadata_file(entry_dir)
+            sizes[entry_dir] = json.loads(metadata_file.read_text()).get("size", 0)
+            last_used[entry_dir] = metadata_file.stat().st_mtime
+        total_size = sum(sizes.values())
+        deleted: List[Path] = []
+        for entry_dir in sorted(sizes, key=lambda entry: last_used[entry]):
+            if total_size <= max_size:
+                break
+            if self.get_ref_count(entry_dir):
+                continue
+            # Incomplete first (find() no longer returns it), then renamed away, so no process sees a partial entry
+            self._metadata_file(entry_dir).unlink(missing_ok=True)
+            tmp_dir = self._tmp_path(entry_dir)
+            os.replace(entry_dir, tmp_dir)
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            shutil.rmtree(self._refs_dir(entry_dir), ignore_errors=True)
+            total_size -= sizes[entry_dir]
+            deleted.append(entry_dir)
+            logger.info(f"Removed {entry_dir} from the checkout store ({sizes[entry_dir] / 1e6:.1f} MB)")
+        return deleted
+
+    @staticmethod
+    def resolve_commit(url: str, revision: str) -> Optional[str]:
+        """Commit the revision (commit, tag or branch) of the repository points to, or None if it cannot be resolved."""
+        if is_commit(revision):
+            return revision
+        result = _run_git(["ls-remote", "--", url, revision, f"{revision}^{{}}"])
+        if result.returncode != 0:
+            logger.warning(f"Could not resolve {url}@{revision}: {result.stdout.strip()}")
+            return None
+        refs: Dict[str, str] = {}
+        for line in result.stdout.splitlines():
+            commit, _, ref = line.partition("\t")
+            refs[ref] = commit
+        # A peeled annotated tag (<ref>^{}) is the commit, the tag itself is a tag object
+        for ref in (f"refs/tags/{revision}^{{}}", f"refs/tags/{revision}", f"refs/heads/{revision}", revision):
+            if ref in refs:
+                return refs[ref]
+        return None
+
+    @staticmethod
+    def get_commit(checkout_dir: Path) -> str:
+        result = _run_git(["rev-parse", "HEAD"], checkout_dir)
+        if result.returncode != 0:
+            raise UserNotificationException(f"Could not get the commit of {checkout_dir}: {result.stdout.strip()}")
+        return result.stdout.strip()
+
+
+def is_commit(revision: str) -> bool:
+    """Whether the revision is a full commit id (SHA-1 or SHA-256), which never points to another commit."""
+    return re.fullmatch(r"[0-9a-f]{40}|[0-9a-f]{64}", revision) is not None
+
+
+def _run_git(arguments: List[str], cwd: Optional[Path] = None) -> subprocess.CompletedProcess[str]:
+    # Not printed: the output is parsed. Inside a step, the step timeout and cancel apply (see StepProcessGroup).
+    executor = StreamingSubprocessExecutor(["git", *arguments], cwd=cwd, print_output=False)
+    return cast(subprocess.CompletedProcess[str], executor.execute(handle_errors=False))
+
+
+def _ref_id(link_path: Path) -> str:
+    return hashlib.sha256(str(link_path).encode()).hexdigest()[:16]
+
+
+def _get_size(path: Path) -> int:
+    size = 0
+    for dir_path, _, file_names in os.walk(path):
+        for file_name in file_names:
+            size += os.lstat(os.path.join(dir_path, file_name)).st_size
+    return size
@@ -0,0 +1,167 @@
+"""
+Thin client of the pypeline daemon (see :class:`pypeline.daemon.PypelineDaemon`).
+
+``pypeline-client`` takes the same arguments as ``pypeline``. It only imports the standard library: with a running
+daemon, a command costs the Python startup and a round trip instead of importing pypeline and its dependencies.
+Without a daemon, the command runs in this process.
+"""
+
+import json
+import os
+import socket
+import stat
+import struct
+import sys
+import tempfile
+import threading
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+#: Environment variable overriding the path of the daemon socket
+DAEMON_SOCKET_ENV = "PYPELINE_DAEMON_SOCKET"
+#: Commands always run in the client process: managing the daemon itself, and `watch` which would block the daemon
+LOCAL_COMMANDS = {"daemon", "watch"}
+#: Secrets which are not sent to the daemon: it uses the values of its own environment
+PRIVATE_ENV_VARS = {"PYPELINE_ARTIFACT_CACHE_TOKEN"}
+
+
+def get_socket_path() -> Path:
+    """
+    Socket of the daemon of the current user: ``$PYPELINE_DAEMON_SOCKET``, else in ``$XDG_RUNTIME_DIR``.
+
+    Without a runtime directory, the socket is in a directory of the user in the temp directory, which the daemon
+    creates only accessible by the user.
+    """
+    if socket_path := os.environ.get(DAEMON_SOCKET_ENV):
+        return Path(socket_path)
+    if runtime_dir := os.environ.get("XDG_RUNTIME_DIR"):
+        return Path(runtime_dir) / "pypeline-daemon.sock"
+    return Path(tempfile.gettempdir()) / f"pypeline-{get_uid()}" / "daemon.sock"
+
+
+def get_uid() -> int:
+    return os.getuid() if hasattr(os, "getuid") else 0
+
+
+def get_peer_uid(connection: socket.socket) -> Optional[int]:
+    """User id of the process on the other side of a Unix socket (None if the system does not tell, e.g. macOS)."""
+    if not hasattr(socket, "SO_PEERCRED"):
+        return None
+    credentials = connection.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+    return struct.unpack("3i", credentials)[1]
+
+
+def is_own_socket(socket_path: Path) -> bool:
+    """Whether the path is a socket of the current user which no other user can use (it is not a link)."""
+    try:
+        socket_stat = socket_path.lstat()
+    except OSError:
+        return False
+    return stat.S_ISSOCK(socket_stat.st_mode) and socket_stat.st_uid == get_uid() and not socket_stat.st_mode & 0o077
+
+
+def get_client_env() -> Dict[str, str]:
+    """Environment sent to the daemon for a command."""
+    return {name: value for name, value in os.environ.items() if name not in PRIVATE_ENV_VARS}
+
+
+def send_message(connection: socket.socket, message: Dict[str, Any], lock: Optional[threading.Lock] = None) -> None:
+    data = (json.dumps(message) + "\n").encode()
+    with lock or nullcontext():
+        try:
+            connection.sendall(data)
+        except OSError:
+            # The other side went away: the daemon notices it and cancels the running command, its output is lost
+            pass
+
+
+def read_messages(connection: socket.socket) -> Iterator[Dict[str, Any]]:
+    """Messages are JSON objects, one per line."""
+    buffer = b""
+    while chunk := connection.recv(65536):
+        buffer += chunk
+        while b"\n" in buffer:
+            line, buffer = buffer.split(b"\n", 1)
+            yield json.loads(line)
+
+
+def connect(socket_path: Optional[Path] = None) -> Optional[socket.socket]:
+    """
+    Connect to the daemon (None if no daemon is running).
+
+    Only a daemon of the current user is trusted, as the client sends it its environment: a socket created by
+    another user, or accessible by other users, is ignored.
+    """
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+    socket_path = socket_path or get_socket_path()
+    if not is_own_socket(socket_path):
+        if socket_path.exists():
+            sys.stderr.write(f"Ignoring the pypeline daemon socket {socket_path}: it is not a socket of the current user only.\n")
+        return None
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(str(socket_path))
+        peer_uid = get_peer_uid(connection)
+    except OSError:
+        connection.close()
+        return None
+    if peer_uid is not None and peer_uid != get_uid():
+        connection.close()
+        sys.stderr.write(f"Ignoring the pypeline daemon on {socket_path}: it runs as another user.\n")
+        return None
+    return connection
+
+
+def request_daemon(request: Dict[str, Any], socket_path: Optional[Path] = None) -> Optional[Dict[str, Any]]:
+    """Send a control request (``status`` or ``stop``) to the daemon and return its answer (None if no daemon is running)."""
+    connection = connect(socket_path)
+    if connection is None:
+        return None
+    with connection:
+        send_message(connection, request)
+        try:
+            return next(read_messages(connection), None)
+        except OSError:
+            # The daemon stopped before accepting the connection
+            return None
+
+
+def is_daemon_running(socket_path: Optional[Path] = None) -> bool:
+    return request_daemon({"command": "status"}, socket_path) is not None
+
+
+def run_in_daemon(argv: List[str], socket_path: Optional[Path] = None) -> Optional[int]:
+    """Run a pypeline command in the daemon, streaming its output here, and return its exit code (None if no daemon is running)."""
+    connection = connect(socket_path)
+    if connection is None:
+        return None
+    with connection:
+        send_message(connection, {"argv": argv, "cwd": os.getcwd(), "env": get_client_env(), "is_tty": sys.stdout.isatty()})
+        try:
+            for message in read_messages(connection):
+                if "exit_code" in message:
+                    return message["exit_code"]
+                stream = sys.stdout if message["stream"] == "stdout" else sys.stderr
+                stream.write(message["data"])
+                stream.flush()
+        except OSError:
+            pass
+    # The daemon stopped while running the command
+    return 1
+
+
+def main() -> None:
+    argv = sys.argv[1:]
+    exit_code = run_in_daemon(argv) if not LOCAL_COMMANDS.intersection(argv[:1]) else None
+    if exit_code is None:
+        from pypeline.main import main as pypeline_main
+
+        pypeline_main()
+        return
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
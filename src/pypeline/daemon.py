@@ -0,0 +1,342 @@
+import io
+import os
+import queue
+import select
+import socket
+import stat
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from py_app_dev.core.exceptions import UserNotificationException
+from py_app_dev.core.logging import logger, setup_logger
+
+from .client import LOCAL_COMMANDS, PRIVATE_ENV_VARS, get_peer_uid, get_socket_path, get_uid, is_daemon_running, is_own_socket, read_messages, send_message
+from .process_executor import StepProcessGroup
+
+#: Seconds between the checks whether the client of the running command is still connected
+DISCONNECT_POLL_INTERVAL = 0.2
+
+
+class _ConnectionWriter(io.TextIOBase):
+    """Text stream forwarding everything written to it to the client, as ``{"stream": ..., "data": ...}`` lines."""
+
+    def __init__(self, connection: socket.socket, lock: threading.Lock, stream: str, is_tty: bool) -> None:
+        self.connection = connection
+        self.lock = lock
+        self.stream = stream
+        self.is_tty = is_tty
+
+    def write(self, data: str) -> int:
+        if not isinstance(data, str):
+            # Tells click (typer.echo) that this is a text stream
+            raise TypeError(f"write() argument must be str, not {type(data).__name__}")
+        if data:
+            send_message(self.connection, {"stream": self.stream, "data": data}, self.lock)
+        return len(data)
+
+    def isatty(self) -> bool:
+        return self.is_tty
+
+    def writable(self) -> bool:
+        return True
+
+
+class PypelineDaemon:
+    """
+    Local server running pypeline commands in a long-lived process, so that they do not pay the Python startup and imports.
+
+    A client (``pypeline-client``) sends the command line arguments, working directory and environment over a Unix
+    socket and gets the output streamed back, followed by the exit code. The modules of pypeline, its dependencies
+    (typer, py_app_dev, west, poks) and the step modules stay imported between the commands. Modules located in the
+    project directory are imported again for every command, so that changes to the project's steps take effect.
+
+    The working directory, the environment and the logger are process-wide: the commands run one after the other, on
+    a worker thread, while ``status`` and ``stop`` requests are answered right away. Stopping the daemon cancels the
+    running command and the waiting ones. A client has ``request_timeout`` seconds to send its request, so that a stuck
+    client does not block the others.
+    When the client goes away while its command runs (e.g. interrupted with Ctrl+C), the steps are cancelled.
+    The socket is only accessible by the user who started the daemon, and connections of other users are rejected.
+    """
+
+    def __init__(self, socket_path: Optional[Path] = None, idle_timeout: Optional[float] = None, request_timeout: float = 10) -> None:
+        if not hasattr(socket, "AF_UNIX"):
+            raise UserNotificationException("The pypeline daemon requires Unix domain sockets, which are not available on this system.")
+        self.socket_path = socket_path or get_socket_path()
+        #: Stop after this many seconds without a request (None: never)
+        self.idle_timeout = idle_timeout
+        self.request_timeout = request_timeout
+        self.started_at = time.time()
+        self.requests = 0
+        self._running = False
+        #: Connections and requests of the commands to run, None to stop the worker
+        self._runs: queue.Queue[Optional[Tuple[socket.socket, Dict[str, Any]]]] = queue.Queue()
+        #: Commands waiting or running
+        self._pending_runs = 0
+        self._pending_runs_lock = threading.Lock()
+
+    def serve_forever(self) -> None:
+        if is_daemon_running(self.socket_path):
+            raise UserNotificationException(f"A pypeline daemon is already running on {self.socket_path}.")
+        self._prepare_socket_path()
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        previous_umask = os.umask(0o077)
+        try:
+            server.bind(str(self.socket_path))
+        finally:
+            os.umask(previous_umask)
+        server.listen()
+        server.settimeout(self.idle_timeout)
+        logger.info(f"pypeline daemon listening on {self.socket_path} (pid {os.getpid()})")
+        self._running = True
+        worker = threading.Thread(target=self._serve_runs, name="pypeline-daemon-runs", daemon=True)
+        worker.start()
+        try:
+            while self._running:
+                try:
+                    connection, _ = server.accept()
+                except socket.timeout:
+                    if self._pending_runs:
+                        continue
+                    logger.info(f"No request for {self.idle_timeout} seconds, stopping.")
+                    break
+                peer_uid = get_peer_uid(connection)
+                if peer_uid is not None and peer_uid != get_uid():
+                    logger.warning(f"Rejected a connection of user {peer_uid}.")
+                    connection.close()
+                    continue
+                try:
+                    handed_over = self._handle(connection)
+                except Exception:
+                    # A failed request must not stop the daemon
+                    logger.exception("Failed to handle the request")
+                    handed_over = False
+                if not handed_over:
+                    connection.close()
+        finally:
+            self._running = False
+            self._runs.put(None)
+            worker.join()
+            # A stop request may have cancelled the steps right after the last command finished
+            StepProcessGroup.reset_cancel_all()
+            server.close()
+            if is_own_socket(self.socket_path):
+                self.socket_path.unlink()
+
+    def _prepare_socket_path(self) -> None:
+        """Create the directory of the socket, only accessible by the user, and remove a stale socket of the user."""
+        socket_dir = self.socket_path.parent
+        socket_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+        dir_stat = socket_dir.stat()
+        # In a directory of another user (e.g. created first under the default name), the socket could be replaced
+        if dir_stat.st_uid != get_uid() and not dir_stat.st_mode & stat.S_ISVTX:
+            raise UserNotificationException(f"The directory of the daemon socket {socket_dir} belongs to another user.")
+        if is_own_socket(self.socket_path):
+            self.socket_path.unlink()
+        elif self.socket_path.exists() or self.socket_path.is_symlink():
+            raise UserNotificationException(f"{self.socket_path} exists and is not a daemon socket of the current user: not replacing it.")
+
+    def _handle(self, connection: socket.socket) -> bool:
+        """Answer the request of the connection, return whether the connection was handed over to the worker running the commands."""
+        connection.settimeout(self.request_timeout)
+        try:
+            request = next(read_messages(connection))
+        except (StopIteration, ValueError, OSError) as e:
+            logger.warning(f"Ignoring invalid request: {e}")
+            return False
+        # The command may run for hours: only the request is limited in time
+        connection.settimeout(None)
+        if error := get_request_error(request):
+            logger.warning(f"Ignoring invalid request: {error}")
+            send_message(connection, {"stream": "stderr", "data": f"Invalid request to the pypeline daemon: {error}\n"})
+            send_message(connection, {"exit_code": 1})
+            return False
+        command = request.get("command", "run")
+        if command == "stop":
+            self._running = False
+            if self._pending_runs:
+                StepProcessGroup.cancel_all("the daemon was stopped")
+            send_message(connection, {"exit_code": 0})
+        elif command == "status":
+            send_message(connection, {"pid": os.getpid(), "started_at": self.started_at, "requests": self.requests, "running": self._pending_runs, "exit_code": 0})
+        elif LOCAL_COMMANDS.intersection(request["argv"][:1]):
+            send_message(connection, {"stream": "stderr", "data": f"'pypeline {request['argv'][0]}' cannot run in the daemon.\n"})
+            send_message(connection, {"exit_code": 1})
+        else:
+            self.requests += 1
+            with self._pending_runs_lock:
+                self._pending_runs += 1
+            self._runs.put((connection, request))
+            return True
+        return False
+
+    def _serve_runs(self) -> None:
+        """Run the queued commands one after the other, until the daemon stops."""
+        while (item := self._runs.get()) is not None:
+            connection, request = item
+            try:
+                with connection:
+                    if not self._running:
+                        send_message(connection, {"stream": "stderr", "data": "The pypeline daemon was stopped before running the command.\n"})
+                        send_message(connection, {"exit_code": 1})
+                        continue
+                    exit_code = self._run(connection, request["argv"], Path(request["cwd"]), request["env"], bool(request.get("is_tty", False)))
+                    send_message(connection, {"exit_code": exit_code})
+            except Exception:
+                # A failed command must not stop the daemon
+                logger.exception("Failed to run the command")
+            finally:
+                with self._pending_runs_lock:
+                    self._pending_runs -= 1
+
+    def _run(self, connection: socket.socket, argv: List[str], cwd: Path, env: Dict[str, str], is_tty: bool) -> int:
+        from .main import app
+
+        lock = threading.Lock()
+        stdout = _ConnectionWriter(connection, lock, "stdout", is_tty)
+        stderr = _ConnectionWriter(connection, lock, "stderr", is_tty)
+        argv = add_project_dir(argv, cwd)
+        start = time.perf_counter()
+        with _cancel_on_disconnect(connection) as disconnected, _client_process_state(cwd, env, stdout, stderr):
+            forget_project_modules(get_project_dir(argv, cwd))
+            # Log to the client, like `pypeline.main.main`
+            setup_logger()
+            exit_code = self._run_app(app, argv, stderr)
+        setup_logger()
+        cancelled = ", cancelled because the client disconnected" if disconnected.is_set() else ""
+        logger.info(f"pypeline {' '.join(argv)}: exit code {exit_code}{cancelled} ({time.perf_counter() - start:.2f}s)")
+        return exit_code
+
+    @staticmethod
+    def _run_app(app: Any, argv: List[str], stderr: io.TextIOBase) -> int:
+        try:
+            app(args=argv, prog_name="pypeline")
+            return 0
+        except SystemExit as e:
+            if isinstance(e.code, str):
+                stderr.write(f"{e.code}\n")
+                return 1
+            return e.code or 0
+        except UserNotificationException as e:
+            logger.error(f"{e}")
+            return 1
+        except Exception:
+            logger.exception("pypeline failed")
+            return 1
+
+
+@contextmanager
+def _client_process_state(cwd: Path, env: Dict[str, str], stdout: io.TextIOBase, stderr: io.TextIOBase) -> Iterator[None]:
+    """
+    Run the enclosed block in the working directory and environment of the client, with its output sent to the client.
+
+    The client does not send its secrets (see :data:`PRIVATE_ENV_VARS`): the ones of the daemon are kept.
+    """
+    previous_cwd, previous_env = os.getcwd(), dict(os.environ)
+    previous_stdout, previous_stderr = sys.stdout, sys.stderr
+    try:
+        os.chdir(cwd)
+        os.environ.clear()
+        os.environ.update(env)
+        os.environ.update({name: value for name, value in previous_env.items() if name in PRIVATE_ENV_VARS})
+        sys.stdout, sys.stderr = stdout, stderr
+        yield
+    finally:
+        sys.stdout, sys.stderr = previous_stdout, previous_stderr
+        os.environ.clear()
+        os.environ.update(previous_env)
+        os.chdir(previous_cwd)
+
+
+@contextmanager
+def _cancel_on_disconnect(connection: socket.socket) -> Iterator[threading.Event]:
+    """
+    Cancel the steps (see :meth:`StepProcessGroup.cancel_all`) when the client closes the connection, like Ctrl+C in a local run.
+
+    The client sends nothing after its request, so the connection only becomes readable when it is closed. The
+    returned event is set if the client disconnected.
+    """
+    done, disconnected = threading.Event(), threading.Event()
+
+    def watch() -> None:
+        while not done.is_set():
+            readable, _, _ = select.select([connection], [], [], DISCONNECT_POLL_INTERVAL)
+            if readable and _is_closed(connection):
+                disconnected.set()
+                StepProcessGroup.cancel_all("the client disconnected")
+                return
+
+    watcher = threading.Thread(target=watch, name="pypeline-daemon-client", daemon=True)
+    watcher.start()
+    try:
+        yield disconnected
+    finally:
+        done.set()
+        watcher.join()
+        StepProcessGroup.reset_cancel_all()
+
+
+def _is_closed(connection: socket.socket) -> bool:
+    try:
+        return not connection.recv(4096)
+    except OSError:
+        return True
+
+
+def get_request_error(request: Any) -> Optional[str]:
+    """Why the request of a client is invalid (None: it is valid). ``stop`` and ``status`` only need their command."""
+    if not isinstance(request, dict):
+        return "the request is not a JSON object"
+    command = request.get("command", "run")
+    if command in ("stop", "status"):
+        return None
+    if command != "run":
+        return f"unknown command {command!r}"
+    argv, cwd, env = request.get("argv"), request.get("cwd"), request.get("env")
+    if not isinstance(argv, list) or not all(isinstance(arg, str) for arg in argv):
+        return "'argv' must be a list of strings"
+    if not isinstance(cwd, str) or not Path(cwd).is_dir():
+        return "'cwd' must be an existing directory"
+    if not isinstance(env, dict) or not all(isinstance(name, str) and isinstance(value, str) for name, value in env.items()):
+        return "'env' must be an object of strings"
+    return None
+
+
+def add_project_dir(argv: List[str], cwd: Path) -> List[str]:
+    """
+    Pass the client working directory as ``--project-dir`` to the commands which have it.
+
+    The default of the option is the working directory of the daemon, taken when it imported the commands.
+    """
+    import typer
+
+    from .main import app
+
+    command_name = argv[0] if argv else None
+    command = getattr(typer.main.get_command(app), "commands", {}).get(command_name)
+    if command is None or any(arg == "--project-dir" or arg.startswith("--project-dir=") for arg in argv):
+        return argv
+    if not any("--project-dir" in param.opts for param in command.params):
+        return argv
+    return [*argv, "--project-dir", str(cwd)]
+
+
+def get_project_dir(argv: List[str], cwd: Path) -> Path:
+    for index, arg in enumerate(argv):
+        if arg.startswith("--project-dir="):
+            return cwd / arg.split("=", 1)[1]
+        if arg == "--project-dir" and index + 1 < len(argv):
+            return cwd / argv[index + 1]
+    return cwd
+
+
+def forget_project_modules(project_dir: Path) -> None:
+    """Remove the modules located in the project from the imported modules, so that they are imported again."""
+    project_dir = project_dir.absolute()
+    for name, module in list(sys.modules.items()):
+        module_file = getattr(module, "__file__", None)
+        if module_file and Path(module_file).is_relative_to(project_dir):
+            del sys.modules[name]
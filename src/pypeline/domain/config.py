@@ -1,11 +1,12 @@
 from collections import OrderedDict
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Dict, List, Literal, Optional, Set, Union
+from typing import Any, Dict, List, Literal, Optional, Set, Tuple, Union
 
 from py_app_dev.core.config import ConfigElement, parse_config_element
 from py_app_dev.core.exceptions import UserNotificationException
 
+from ..tracing import span
 from .pipeline import IncludeSpec, PipelineConfig, PipelineConfigIterator, PipelineStepConfig
 
 InputType = Literal["string", "integer", "boolean"]
@@ -25,6 +26,10 @@ class ProjectInput(ConfigElement):
 class ProjectConfig(ConfigElement):
     pipeline: PipelineConfig
     inputs: Optional[Dict[str, ProjectInput]] = None
+    #: Tokens available per resource for the steps of a concurrent run (``cpu`` defaults to the number of CPUs, others to 1)
+    resources: Optional[Dict[str, int]] = None
+    #: Glob patterns (relative to the project directory) of additional files watched by ``pypeline watch``
+    watch: Optional[List[str]] = None
 
     @property
     def file(self) -> Optional[Path]:
@@ -33,46 +38,55 @@ class ProjectConfig(ConfigElement):
 
     @classmethod
     def from_file(cls, config_file: Path) -> "ProjectConfig":
-        return cls._load(config_file, set())
+        return cls.from_file_with_sources(config_file)[0]
 
     @classmethod
-    def _load(cls, config_file: Path, visited: Set[Path]) -> "ProjectConfig":
+    def from_file_with_sources(cls, config_file: Path) -> Tuple["ProjectConfig", List[Path]]:
+        """Load the configuration and return it with every file of its include graph (the configuration file first)."""
+        sources: List[Path] = []
+        return cls._load(config_file, set(), sources), sources
+
+    @classmethod
+    def _load(cls, config_file: Path, visited: Set[Path], sources: List[Path]) -> "ProjectConfig":
         if not config_file.is_file():
             raise FileNotFoundError(config_file)
+        sources.append(config_file)
         resolved = config_file.resolve()
         if resolved in visited:
             chain = " -> ".join(str(path) for path in (*visited, resolved))
             raise UserNotificationException(f"Circular pipeline include detected: {chain}")
-        config = parse_config_element(cls, config_file)
-        # Pin each step's output group to THIS file before inserting any included steps, so an
-        # included step keeps the group of the file it is defined in, not the one it is included into.
-        _stamp_home_groups(config.pipeline)
-        config.pipeline = cls._expand_includes(config.pipeline, config_file, visited | {resolved})
+        # Included files are loaded within the span of the including file: the trace shows the include tree
+        with span(f"load {config_file.name}", "config", file=str(config_file)):
+            config = parse_config_element(cls, config_file)
+            # Pin each step's output group to THIS file before inserting any included steps, so an
+            # included step keeps the group of the file it is defined in, not the one it is included into.
+            _stamp_home_groups(config.pipeline)
+            config.pipeline = cls._expand_includes(config.pipeline, config_file, visited | {resolved}, sources)
         return config
 
     @classmethod
-    def _expand_includes(cls, pipeline: PipelineConfig, including_file: Path, visited: Set[Path]) -> PipelineConfig:
+    def _expand_includes(cls, pipeline: PipelineConfig, including_file: Path, visited: Set[Path], sources: List[Path]) -> PipelineConfig:
         if isinstance(pipeline, OrderedDict):
-            return OrderedDict((group, cls._expand_steps(steps, including_file, visited)) for group, steps in pipeline.items())
-        return cls._expand_steps(pipeline, including_file, visited)
+            return OrderedDict((group, cls._expand_steps(steps, including_file, visited, sources)) for group, steps in pipeline.items())
+        return cls._expand_steps(pipeline, including_file, visited, sources)
 
     @classmethod
-    def _expand_steps(cls, steps: List[PipelineStepConfig], including_file: Path, visited: Set[Path]) -> List[PipelineStepConfig]:
+    def _expand_steps(cls, steps: List[PipelineStepConfig], including_file: Path, visited: Set[Path], sources: List[Path]) -> List[PipelineStepConfig]:
         result: List[PipelineStepConfig] = []
         for entry in steps:
             _validate_entry(entry, including_file)
             if entry.include is None:
                 result.append(entry)
             else:
-                result.extend(cls._expand_include(entry.include, including_file, visited))
+                result.extend(cls._expand_include(entry.include, including_file, visited, sources))
         return result
 
     @classmethod
-    def _expand_include(cls, include: Union[str, IncludeSpec], including_file: Path, visited: Set[Path]) -> List[PipelineStepConfig]:
+    def _expand_include(cls, include: Union[str, IncludeSpec], including_file: Path, visited: Set[Path], sources: List[Path]) -> List[PipelineStepConfig]:
         # A plain string includes the whole file; an IncludeSpec narrows it to named steps. Coerce to the
         # object form here so the rest reads one shape, without normalising the config's genuine union away.
         spec = include if isinstance(include, IncludeSpec) else IncludeSpec(file=include)
-        fragment = cls._load(including_file.parent / spec.file, visited)
+        fragment = cls._load(including_file.parent / spec.file, visited, sources)
         if isinstance(fragment.pipeline, OrderedDict):
             raise UserNotificationException(
                 f"Included pipeline '{spec.file}' must define a flat list of steps (no groups) to be included from '{including_file}'."
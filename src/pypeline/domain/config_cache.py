@@ -0,0 +1,87 @@
+import os
+import pickle
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from py_app_dev.core.logging import logger
+
+from .. import __version__
+from ..hashing import RACY_MTIME_WINDOW_NS, hash_file
+from ..tracing import span
+from .config import ProjectConfig
+
+#: Parsed project configuration cache, in the project build directory.
+CONFIG_CACHE_FILE = "pypeline_config.pickle"
+
+
+class ProjectConfigCache:
+    """
+    Cache of the fully expanded :class:`ProjectConfig`, pickled in the build directory.
+
+    The entry records the size, modification time and content hash of every file of the include graph. It is reused
+    as long as none of them changed, which skips the YAML parsing and the include expansion. A file whose ``stat()``
+    signature differs (e.g. after a checkout) or was modified too close to the recording is compared by content.
+    An entry written by another pypeline version or for another configuration file is ignored.
+    """
+
+    def __init__(self, cache_file: Path) -> None:
+        self.cache_file = cache_file
+
+    def load(self, config_file: Path) -> ProjectConfig:
+        """Return the cached configuration if it is still valid, otherwise parse it and update the cache."""
+        with span("load configuration", "config", file=str(config_file)) as span_args:
+            config = self._read(config_file)
+            span_args["cached"] = config is not None
+            if config is None:
+                config, sources = ProjectConfig.from_file_with_sources(config_file)
+                self._write(config_file, config, sources)
+        return config
+
+    def _read(self, config_file: Path) -> Optional[ProjectConfig]:
+        if not self.cache_file.is_file():
+            return None
+        try:
+            entry = pickle.loads(self.cache_file.read_bytes())  # noqa: S301 - written by pypeline in the project build directory
+            if entry["version"] != __version__ or entry["config_file"] != str(config_file.absolute()):
+                return None
+            if not all(self._is_unchanged(Path(path), source, entry["recorded_ns"]) for path, source in entry["sources"].items()):
+                return None
+            return entry["config"]
+        except Exception as e:
+            # The cache is only an optimization: an unreadable entry (e.g. from an incompatible version) costs a parse
+            logger.debug(f"Ignoring unreadable configuration cache {self.cache_file}: {e}")
+            return None
+
+    @staticmethod
+    def _is_unchanged(path: Path, source: Dict[str, Any], recorded_ns: int) -> bool:
+        try:
+            file_stat = path.stat()
+        except OSError:
+            return False
+        if (file_stat.st_size, file_stat.st_mtime_ns) == (source["size"], source["mtime_ns"]) and recorded_ns - file_stat.st_mtime_ns > RACY_MTIME_WINDOW_NS:
+            return True
+        return file_stat.st_size == source["size"] and hash_file(path) == source["hash"]
+
+    def _write(self, config_file: Path, config: ProjectConfig, sources: List[Path]) -> None:
+        entry = {
+            "version": __version__,
+            "config_file": str(config_file.absolute()),
+            "recorded_ns": time.time_ns(),
+            "sources": {str(path.absolute()): self._describe(path) for path in sources},
+            "config": config,
+        }
+        try:
+            self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+            # The file is replaced atomically so concurrent pypeline invocations never read a partial entry
+            tmp_file = self.cache_file.with_name(f"{self.cache_file.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp_file.write_bytes(pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL))
+            os.replace(tmp_file, self.cache_file)
+        except OSError as e:
+            logger.debug(f"Could not write the configuration cache {self.cache_file}: {e}")
+
+    @staticmethod
+    def _describe(path: Path) -> Dict[str, Any]:
+        file_stat = path.stat()
+        return {"size": file_stat.st_size, "mtime_ns": file_stat.st_mtime_ns, "hash": hash_file(path)}
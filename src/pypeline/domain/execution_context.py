@@ -4,8 +4,8 @@ from pathlib import Path
 from typing import Any, Dict, List, Optional
 
 from py_app_dev.core.data_registry import DataRegistry
-from py_app_dev.core.subprocess import SubprocessExecutor
 
+from ..process_executor import StreamingSubprocessExecutor
 from .artifacts import ProjectArtifactsLocator
 
 
@@ -20,6 +20,8 @@ class ExecutionContext:
     inputs: Dict[str, Any] = field(default_factory=dict)
     # Environment variables to be passed to the subprocesses
     env_vars: Dict[str, Any] = field(default_factory=dict)
+    # The steps run even if they are up to date (--force-run): steps keeping an incremental state redo all their work
+    force_run: bool = False
 
     def get_input(self, name: str) -> Optional[Any]:
         return self.inputs.get(name, None)
@@ -30,13 +32,14 @@ class ExecutionContext:
     def add_env_vars(self, env_vars: Dict[str, Any]) -> None:
         self.env_vars.update(env_vars)
 
-    def create_process_executor(self, command: List[str | Path], cwd: Optional[Path] = None) -> SubprocessExecutor:
+    def create_process_executor(self, command: List[str | Path], cwd: Optional[Path] = None, log_file: Optional[Path] = None) -> StreamingSubprocessExecutor:
+        """Create an executor running the command with the install directories and environment variables of the pipeline. Its output is also appended to ``log_file``."""
         env = os.environ.copy()
         env.update(self.env_vars)
         env["PATH"] = os.pathsep.join([path.absolute().as_posix() for path in self.install_dirs] + [env["PATH"]])
         # When started from a windows shell (e.g. cmd on Jenkins) the shell parameter must be set to True
         shell = True if os.name == "nt" else False
-        return SubprocessExecutor(command, cwd=cwd, env=env, shell=shell)
+        return StreamingSubprocessExecutor(command, cwd=cwd, env=env, shell=shell, log_file=log_file)
 
     def create_artifacts_locator(self) -> ProjectArtifactsLocator:
         return ProjectArtifactsLocator(self.project_root_dir)
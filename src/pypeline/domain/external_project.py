@@ -18,3 +18,5 @@ class ExternalProject:
     revision: str
     #: Absolute, resolved install location.
     path: Path
+    #: Repository the project was cloned from (None if unknown).
+    url: str | None = None
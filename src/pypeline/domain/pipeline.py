@@ -1,7 +1,8 @@
 import importlib
+import time
 from abc import abstractmethod
 from dataclasses import dataclass, field
-from importlib.util import module_from_spec, spec_from_file_location
+from importlib.util import find_spec, module_from_spec, spec_from_file_location
 from pathlib import Path
 from typing import (
     Any,
@@ -70,12 +71,23 @@ class PipelineStepConfig(ConfigElement):
     #:       ruff check .
     #:       pytest -v --cov
     run: Optional[RunCommandSpec] = None
+    #: Run the commands of a multi-line ``run`` block concurrently instead of one after another.
+    #: The step fails if any of the commands fails.
+    parallel: Optional[bool] = None
+    #: Maximum number of commands of a ``parallel`` block running at the same time (default: all)
+    max_parallel: Optional[int] = None
     #: Step description
     description: Optional[str] = None
     #: Step timeout in seconds
     timeout_sec: Optional[int] = None
     #: Custom step configuration
     config: Optional[Dict[str, Any]] = None
+    #: Names of earlier steps this step depends on. Only concurrent runs (``--jobs``) read it: a step
+    #: without ``needs`` waits for every step before it, ``needs: []`` lets it start right away.
+    needs: Optional[List[str]] = None
+    #: Resource tokens the step holds while it runs in a concurrent run, e.g. ``{cpu: 8, network: 1}``.
+    #: The available tokens are configured in the project ``resources``.
+    resources: Optional[Dict[str, int]] = None
     #: Output group taken from the file where the step is *defined*, not the file that includes
     #: it, so the step's output directory is identical whether its file is run standalone or
     #: included into a larger pipeline. Assembly metadata: set during loading, never serialized.
@@ -98,22 +110,78 @@ class PipelineStepConfig(ConfigElement):
         return self.home_group if self._home_group_set else fallback
 
 
+@dataclass
+class TreeFingerprint:
+    """How a step output directory is fingerprinted for dependency checks (see :meth:`PipelineStep.get_output_fingerprint`)."""
+
+    #: Glob patterns of entries left out of the fingerprint, matched against the entry name and
+    #: its path relative to the output directory (e.g. ``.git`` or ``*.pyc``)
+    ignore: List[str] = field(default_factory=list)
+
+
 PipelineConfig: TypeAlias = Union[List[PipelineStepConfig], OrderedDict[str, List[PipelineStepConfig]]]
 
 TPipelineStep = TypeVar("TPipelineStep", covariant=True)
 
 
+class StepClassLoader(Generic[TPipelineStep]):
+    """Import a step class from a module or a Python file on first use, so steps that never run are never imported."""
+
+    def __init__(self, class_name: str, module: Optional[str] = None, file: Optional[Path] = None) -> None:
+        self.class_name = class_name
+        self.module = module
+        self.file = file
+        self._class: Optional[Type[TPipelineStep]] = None
+        #: Seconds spent importing the step class (None until it is imported)
+        self.import_duration: Optional[float] = None
+
+    def load(self) -> Type[TPipelineStep]:
+        if self._class is None:
+            start = time.perf_counter()
+            if self.module:
+                self._class = PipelineLoader[TPipelineStep]._load_module_step(self.module, self.class_name)
+            elif self.file:
+                self._class = PipelineLoader[TPipelineStep]._load_user_step(self.file, self.class_name)
+            else:
+                raise UserNotificationException(f"Step '{self.class_name}' has neither a module nor a file to load it from.")
+            self.import_duration = time.perf_counter() - start
+        return self._class
+
+
 @dataclass
 class PipelineStepReference(Generic[TPipelineStep]):
-    """Once a Step is found, keep the Step class reference to be able to instantiate it later."""
+    """
+    Once a Step is found, keep the Step class reference to be able to instantiate it later.
+
+    The class is either given directly or as a :class:`StepClassLoader`, which imports it on first access.
+    """
 
     group_name: Optional[str]
-    _class: Type[TPipelineStep]
+    step_class: Union[Type[TPipelineStep], StepClassLoader[TPipelineStep]]
     config: Optional[Dict[str, Any]] = None
+    #: Steps that must complete before this one in a concurrent run (None: all previous steps)
+    needs: Optional[List[str]] = None
+    #: Maximum duration of the step in seconds (None: no timeout)
+    timeout_sec: Optional[int] = None
+    #: Resource tokens the step holds while it runs in a concurrent run (None: none)
+    resources: Optional[Dict[str, int]] = None
+
+    @property
+    def _class(self) -> Type[TPipelineStep]:
+        if isinstance(self.step_class, StepClassLoader):
+            return self.step_class.load()
+        return self.step_class
 
     @property
     def name(self) -> str:
-        return self._class.__name__
+        if isinstance(self.step_class, StepClassLoader):
+            return self.step_class.class_name
+        return self.step_class.__name__
+
+    @property
+    def import_duration(self) -> Optional[float]:
+        """Seconds spent importing the step class, if it was loaded lazily and already imported."""
+        return self.step_class.import_duration if isinstance(self.step_class, StepClassLoader) else None
 
 
 class PipelineConfigIterator:
@@ -160,10 +228,16 @@ class PipelineLoader(Generic[TPipelineStep]):
             step_class_name = step_config.class_name or step_config.step
             if not step_class_name:
                 raise UserNotificationException("A pipeline step must define a 'step' name. Please check your pipeline configuration.")
+            step_class: Union[Type[TPipelineStep], StepClassLoader[TPipelineStep]]
+            # Module and file steps are only imported when they are instantiated; only their location is checked here
             if step_config.module:
-                step_class = PipelineLoader[TPipelineStep]._load_module_step(step_config.module, step_class_name)
+                PipelineLoader[TPipelineStep]._check_module_exists(step_config.module)
+                step_class = StepClassLoader(step_class_name, module=step_config.module)
             elif step_config.file:
-                step_class = PipelineLoader[TPipelineStep]._load_user_step(project_root_dir.joinpath(step_config.file), step_class_name)
+                python_file = project_root_dir.joinpath(step_config.file)
+                if not python_file.is_file():
+                    raise UserNotificationException(f"Could not load file '{python_file}'. Please check your pipeline configuration.")
+                step_class = StepClassLoader(step_class_name, file=python_file)
             else:
                 if step_class_factory:
                     step_class = step_class_factory.create_step_class(step_config, project_root_dir)
@@ -173,9 +247,26 @@ class PipelineLoader(Generic[TPipelineStep]):
                     )
             # The output group comes from where the step is DEFINED, not the (possibly including) file
             # being assembled here; this keeps a step's output dir stable across standalone vs included runs.
-            result.append(PipelineStepReference(step_config.resolve_output_group(group_name), step_class, step_config.config))
+            for resource, amount in (step_config.resources or {}).items():
+                if amount < 1:
+                    raise UserNotificationException(f"Step '{step_class_name}' requests an invalid amount {amount} of resource '{resource}'. It must be at least 1.")
+            result.append(
+                PipelineStepReference(
+                    step_config.resolve_output_group(group_name), step_class, step_config.config, step_config.needs, step_config.timeout_sec, step_config.resources
+                )
+            )
         return result
 
+    @staticmethod
+    def _check_module_exists(module_name: str) -> None:
+        try:
+            # Locates the module without executing it (its parent packages are imported, though)
+            module_spec = find_spec(module_name)
+        except ImportError:
+            module_spec = None
+        if module_spec is None:
+            raise UserNotificationException(f"Could not load module '{module_name}'. Please check your pipeline configuration.")
+
     @staticmethod
     def _load_user_step(python_file: Path, step_class_name: str) -> Type[TPipelineStep]:
         # Create a module specification from the file path
@@ -223,6 +314,11 @@ class PipelineStep(Generic[TExecutionContext], Runnable):
             output_dir = output_dir / self.group_name
         return output_dir
 
+    @property
+    def log_file(self) -> Path:
+        """File collecting the output of the commands run by the step (pass it to ``create_process_executor``); it is cleared when the step runs."""
+        return self.output_dir / f"{self.get_id()}.log"
+
     @abstractmethod
     def update_execution_context(self) -> None:
         """
@@ -235,3 +331,23 @@ class PipelineStep(Generic[TExecutionContext], Runnable):
     def get_needs_dependency_management(self) -> bool:
         """If false, the step executor will not check for outdated dependencies. This is useful for steps consisting of command lines which shall always run."""
         return True
+
+    def get_output_fingerprint(self, path: Path) -> Optional[TreeFingerprint]:
+        """
+        Opt an output directory into content fingerprinting.
+
+        By default an output directory is only checked for existence. Return a :class:`TreeFingerprint` to track
+        the content of the whole tree instead, so the step re-runs when a file in it is added, removed or changed.
+        Called for every output directory, both before the step runs and when its outputs are recorded.
+        """
+        return None
+
+    def get_cache_outputs(self) -> Optional[List[Path]]:
+        """
+        Opt the step into the shared artifact cache (``--artifact-cache``).
+
+        Return the files and directories (inside the project directory) that fully capture the result of the step.
+        They are archived after the step ran and restored instead of running it when the same inputs and
+        configuration were already built elsewhere. Called after :meth:`run`. None (the default) disables caching.
+        """
+        return None
@@ -6,6 +6,7 @@ from py_app_dev.core.logging import logger
 
 from .artifacts import ProjectArtifactsLocator
 from .config import PipelineConfig, ProjectConfig
+from .config_cache import CONFIG_CACHE_FILE, ProjectConfigCache
 
 
 class ProjectSlurper:
@@ -13,7 +14,9 @@ class ProjectSlurper:
         self.logger = logger.bind()
         self.artifacts_locator = ProjectArtifactsLocator(project_dir, config_file)
         try:
-            self.user_config: ProjectConfig = ProjectConfig.from_file(self.artifacts_locator.config_file)
+            # Repeated invocations reuse the parsed configuration until a file of its include graph changes
+            config_cache = ProjectConfigCache(self.artifacts_locator.build_dir / CONFIG_CACHE_FILE)
+            self.user_config: ProjectConfig = config_cache.load(self.artifacts_locator.config_file)
         except FileNotFoundError:
             raise UserNotificationException(f"Project configuration file '{self.artifacts_locator.config_file}' not found.") from None
         self.pipeline: PipelineConfig = self.user_config.pipeline
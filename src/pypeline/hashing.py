@@ -0,0 +1,156 @@
+import fnmatch
+import hashlib
+import json
+import os
+import stat
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+from py_app_dev.core.logging import logger
+
+#: Files are hashed in chunks of this size so large files are never loaded into memory at once.
+HASH_CHUNK_SIZE = 1024 * 1024
+
+#: A file modified this recently is hashed but not cached: a change within the same mtime tick would go unnoticed.
+RACY_MTIME_WINDOW_NS = 2_000_000_000
+
+
+def hash_file(path: Path) -> str:
+    """SHA-256 of the file content, streamed in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        while chunk := file.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FileHashCache:
+    """
+    Persistent cache of file hashes keyed by path and validated by ``stat()``.
+
+    A file whose size, modification time and inode are unchanged since it was last hashed is not read again.
+    The cache is a JSON file (path -> size, mtime_ns, inode, hash), loaded on first use and written by :meth:`save`.
+    Subclasses store the entries elsewhere by overriding :meth:`_load` and :meth:`_write`.
+
+    The entry of a path which is no longer a file is dropped when the path is looked up. Saving with ``prune`` also
+    drops the entries which were not looked up since the cache was loaded, so renamed and deleted files do not
+    accumulate: the owner of the cache prunes it at the end of a run which looked up all the files it needs.
+    """
+
+    def __init__(self, cache_file: Path) -> None:
+        self.cache_file = cache_file
+        self._entries: Optional[Dict[str, Dict[str, Any]]] = None
+        self._changed: Set[str] = set()
+        self._removed: Set[str] = set()
+        self._used: Set[str] = set()
+        self._lock = threading.Lock()
+
+    @property
+    def entries(self) -> Dict[str, Dict[str, Any]]:
+        if self._entries is None:
+            self._entries = self._load()
+        return self._entries
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if not self.cache_file.is_file():
+            return {}
+        try:
+            return json.loads(self.cache_file.read_text())
+        except (OSError, ValueError) as e:
+            # The cache is only an optimization: a corrupt file costs a rehash, not a failure
+            logger.debug(f"Ignoring unreadable file hash cache {self.cache_file}: {e}")
+            return {}
+
+    def get_hash(self, path: Path) -> Optional[str]:
+        """Return the content hash of a regular file or None if the path does not exist or is not a regular file."""
+        key = str(path)
+        try:
+            file_stat = path.stat()
+        except OSError:
+            self._remove(key)
+            return None
+        if not stat.S_ISREG(file_stat.st_mode):
+            self._remove(key)
+            return None
+        with self._lock:
+            self._used.add(key)
+            entry = self.entries.get(key)
+        if entry and (entry["size"], entry["mtime_ns"], entry["inode"]) == (file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino):
+            return entry["hash"]
+        file_hash = hash_file(path)
+        if time.time_ns() - file_stat.st_mtime_ns > RACY_MTIME_WINDOW_NS:
+            with self._lock:
+                self.entries[key] = {"size": file_stat.st_size, "mtime_ns": file_stat.st_mtime_ns, "inode": file_stat.st_ino, "hash": file_hash}
+                self._changed.add(key)
+        return file_hash
+
+    def _remove(self, key: str) -> None:
+        with self._lock:
+            if self.entries.pop(key, None) is not None:
+                self._changed.discard(key)
+                self._removed.add(key)
+
+    def save(self, prune: bool = False) -> None:
+        """Write the cache if any entry changed. With ``prune``, the entries not looked up since the cache was loaded are dropped first."""
+        with self._lock:
+            if prune:
+                unused = set(self.entries) - self._used
+                for key in unused:
+                    del self.entries[key]
+                self._changed -= unused
+                self._removed |= unused
+            if not (self._changed or self._removed):
+                return
+            self._write(self.entries, self._changed, self._removed)
+            self._changed, self._removed = set(), set()
+
+    def _write(self, entries: Dict[str, Dict[str, Any]], changed: Set[str], removed: Set[str]) -> None:
+        # The file is replaced atomically so concurrent writers never corrupt it
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.cache_file.with_name(f"{self.cache_file.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp_file.write_text(json.dumps(entries, indent=1))
+        os.replace(tmp_file, self.cache_file)
+
+    def get_tree_hash(self, path: Path, ignore: Optional[List[str]] = None) -> Optional[str]:
+        """
+        Return a Merkle-style hash of a directory tree or None if the path is not a directory.
+
+        Each directory hashes the sorted names, types and hashes of its entries, so any added, removed, renamed or
+        modified file changes the hash of every directory above it. File contents come from this cache, which means
+        an unchanged tree costs one ``stat()`` per entry and no file reads. Symbolic links are recorded by their
+        target and never followed. Entries matching one of the ``ignore`` globs (checked against the entry name and
+        its path relative to ``path``) are excluded.
+        """
+        if not path.is_dir():
+            return None
+        return self._hash_dir(path, "", ignore or [])
+
+    def _hash_dir(self, dir_path: Path, relative_dir: str, ignore: List[str]) -> str:
+        digest = hashlib.sha256()
+        with os.scandir(dir_path) as dir_entries:
+            entries = sorted(dir_entries, key=lambda entry: entry.name)
+        for entry in entries:
+            relative_path = f"{relative_dir}{entry.name}"
+            if any(fnmatch.fnmatch(entry.name, pattern) or fnmatch.fnmatch(relative_path, pattern) for pattern in ignore):
+                continue
+            if entry.is_symlink():
+                entry_type, entry_hash = "link", os.readlink(entry.path)
+            elif entry.is_dir(follow_symlinks=False):
+                entry_type, entry_hash = "dir", self._hash_dir(Path(entry.path), f"{relative_path}/", ignore)
+            elif entry.is_file(follow_symlinks=False):
+                entry_type, entry_hash = "file", self._hash_tree_file(Path(entry.path))
+            else:
+                continue
+            digest.update(f"{entry_type} {entry.name} {entry_hash}\n".encode())
+        return digest.hexdigest()
+
+    def _hash_tree_file(self, path: Path) -> str:
+        try:
+            return self.get_hash(path) or "NOT_FOUND"
+        except OSError as e:
+            # A locked or unreadable file (e.g. a running executable on Windows) must not fail the whole check
+            logger.debug(f"Could not read {path} for the tree hash, using its stat() signature: {e}")
+            file_stat = path.stat()
+            return f"UNREADABLE:{file_stat.st_size}:{file_stat.st_mtime_ns}"
@@ -0,0 +1,111 @@
+import hashlib
+import json
+import platform
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from .domain.pipeline import PipelineStep
+from .run_state import StepDuration
+
+
+def get_machine_name() -> str:
+    return platform.node() or "unknown"
+
+
+def get_config_hash(step: PipelineStep[Any]) -> str:
+    """Hash of what defines the work of a step: its configuration and, for ``run:`` steps, its commands."""
+    config_data = {"config": step.get_config(), "run": getattr(step, "run_spec", None)}
+    return hashlib.sha256(json.dumps(config_data, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Percentile with linear interpolation between the closest ranks (``fraction`` between 0 and 1)."""
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def estimate_durations(history: List[StepDuration], last_runs: int = 5, machine: Optional[str] = None) -> Dict[Tuple[str, str], float]:
+    """
+    Expected duration of each step (by group and step name): the median of its last runs on ``machine`` (default: this machine).
+
+    Unlike the trends, the runs with an older configuration are used too: a rough estimate is better than none.
+    """
+    machine = machine or get_machine_name()
+    durations: Dict[Tuple[str, str], List[float]] = {}
+    for duration in history:
+        if duration.machine == machine:
+            durations.setdefault((duration.group_name, duration.step_name), []).append(duration.duration)
+    return {step_key: percentile(step_durations[-last_runs:], 0.5) for step_key, step_durations in durations.items()}
+
+
+@dataclass
+class StepTrend:
+    """Duration statistics of a step over its last runs."""
+
+    group_name: str
+    step_name: str
+    #: Number of runs the statistics are computed from
+    runs: int
+    p50: float
+    p95: float
+    #: Duration of the last run
+    last: float
+    #: Median duration of the runs before the last one (None without enough runs to compare to)
+    baseline: Optional[float]
+    #: The last run is slower than the baseline beyond the threshold
+    regressed: bool
+
+    @property
+    def change(self) -> Optional[float]:
+        """Relative change of the last run compared to the baseline (0.25: 25% slower)."""
+        return self.last / self.baseline - 1 if self.baseline else None
+
+
+class HistoryReport:
+    """
+    Duration trends of the steps from the run history, and the steps whose last run regressed.
+
+    Only the runs on one machine with the current configuration of each step are compared: the series of a step is
+    the one of its most recent run. A step regressed when its last run is more than ``threshold`` (relative) and
+    ``min_increase`` seconds slower than the median of the ``last_runs`` runs before it. At least
+    ``min_baseline_runs`` earlier runs are needed to tell.
+    """
+
+    def __init__(
+        self,
+        history: List[StepDuration],
+        last_runs: int = 20,
+        threshold: float = 0.2,
+        min_increase: float = 1.0,
+        min_baseline_runs: int = 3,
+    ) -> None:
+        self.history = history
+        self.last_runs = last_runs
+        self.threshold = threshold
+        self.min_increase = min_increase
+        self.min_baseline_runs = min_baseline_runs
+
+    def get_trends(self, machine: Optional[str] = None) -> List[StepTrend]:
+        """Trends of the steps which ran on ``machine`` (default: this machine), in the order of their first recorded run."""
+        machine = machine or get_machine_name()
+        series: Dict[Tuple[str, str], Dict[str, List[float]]] = {}
+        current_config: Dict[Tuple[str, str], str] = {}
+        for duration in self.history:
+            if duration.machine != machine:
+                continue
+            step_key = (duration.group_name, duration.step_name)
+            series.setdefault(step_key, {}).setdefault(duration.config_hash, []).append(duration.duration)
+            # The history is sorted by start time: the last config hash seen is the current one
+            current_config[step_key] = duration.config_hash
+        return [self._get_trend(step_key, series[step_key][config_hash][-self.last_runs - 1 :]) for step_key, config_hash in current_config.items()]
+
+    def _get_trend(self, step_key: Tuple[str, str], durations: List[float]) -> StepTrend:
+        last = durations[-1]
+        window = durations[-self.last_runs :]
+        previous = durations[:-1]
+        baseline = percentile(previous, 0.5) if len(previous) >= self.min_baseline_runs else None
+        regressed = baseline is not None and last > baseline * (1 + self.threshold) and last - baseline >= self.min_increase
+        return StepTrend(*step_key, runs=len(window), p50=percentile(window, 0.5), p95=percentile(window, 0.95), last=last, baseline=baseline, regressed=regressed)
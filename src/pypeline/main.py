@@ -1,24 +1,24 @@
 import sys
+import time
+from contextlib import contextmanager
 from pathlib import Path
-from typing import List, Optional
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Set
 
 import typer
 from py_app_dev.core.exceptions import UserNotificationException
 from py_app_dev.core.logging import logger, setup_logger, time_it
 
 from pypeline import __version__
-from pypeline.domain.execution_context import ExecutionContext
-from pypeline.domain.pipeline import PipelineConfigIterator
-from pypeline.domain.project_slurper import ProjectSlurper
-from pypeline.inputs_parser import InputsParser
-from pypeline.kickstart.create import KickstartProject
-from pypeline.pypeline import PipelineScheduler, PipelineStepsExecutor
+from pypeline import package_version_file as package_version_file  # kept for steps importing it from here
 
-package_name = "pypeline"
+if TYPE_CHECKING:
+    from pypeline.domain.project_slurper import ProjectSlurper
+    from pypeline.pypeline import ScheduledStep
 
+# The commands import their dependencies when they are invoked: `pypeline --version` or `pypeline --help`
+# shall not pay for loading the pipeline, the executor or the configuration parsing.
 
-def package_version_file() -> Path:
-    return Path(__file__).parent / "__init__.py"
+package_name = "pypeline"
 
 
 app = typer.Typer(
@@ -41,9 +41,51 @@ def init(
     project_dir: Path = typer.Option(Path.cwd().absolute(), help="The project directory"),  # noqa: B008
     force: bool = typer.Option(False, help="Force the initialization of the project even if the directory is not empty."),
 ) -> None:
+    from pypeline.kickstart.create import KickstartProject
+
     KickstartProject(project_dir.absolute(), force).run()
 
 
+@contextmanager
+def _tracing(trace_file: Optional[Path]) -> Iterator[None]:
+    """Record a trace of the enclosed block if a trace file is given. Written also for a failed run."""
+    if trace_file is None:
+        yield
+        return
+    from pypeline.tracing import Tracer, tracing
+
+    tracer = Tracer()
+    try:
+        with tracing(tracer):
+            yield
+    finally:
+        tracer.write(trace_file)
+        logger.info(f"Trace written to {trace_file}")
+
+
+def _parse_inputs(project_slurper: "ProjectSlurper", inputs: Optional[List[str]]) -> Dict[str, Any]:
+    from pypeline.inputs_parser import InputsParser
+
+    input_definitions = project_slurper.project_config.inputs
+    if input_definitions is None and inputs:
+        raise UserNotificationException(f"Inputs are not accepted because there are no inputs defined in the '{project_slurper.project_config.file}' configuration.")
+    if input_definitions and inputs:
+        return InputsParser.from_inputs_definitions(input_definitions).parse_inputs(inputs)
+    return {}
+
+
+def _print_schedule(scheduled_steps: List["ScheduledStep"], jobs: int) -> None:
+    total = max((scheduled_step.finish for scheduled_step in scheduled_steps), default=0.0)
+    typer.echo(f"Schedule on {jobs} worker(s), estimated duration {total:.1f}s:")
+    typer.echo(f"{'step':<40} {'duration':>9} {'path':>9} {'start':>9} {'finish':>9}")
+    for scheduled_step in sorted(scheduled_steps, key=lambda scheduled_step: (scheduled_step.start, -scheduled_step.critical_path)):
+        name = f"{scheduled_step.group_name}/{scheduled_step.step_name}" if scheduled_step.group_name else scheduled_step.step_name
+        duration = f"{scheduled_step.duration:.1f}s" + ("" if scheduled_step.recorded else "*")
+        typer.echo(f"{name:<40} {duration:>9} {scheduled_step.critical_path:>8.1f}s {scheduled_step.start:>8.1f}s {scheduled_step.finish:>8.1f}s")
+    if not all(scheduled_step.recorded for scheduled_step in scheduled_steps):
+        typer.echo("* no recorded duration: the median of the other steps is assumed")
+
+
 @app.command(help="Run the pipeline steps defined in the configuration file.")
 @time_it("run")
 def run(
@@ -54,39 +96,238 @@ def run(
     print: bool = typer.Option(False, help="Print the pipeline steps."),
     force_run: bool = typer.Option(False, help="Force the execution of a step even if it is not dirty."),
     dry_run: bool = typer.Option(False, help="Do not run any step, just print the steps that would be executed."),
+    jobs: int = typer.Option(1, "--jobs", "-j", min=1, help="Run up to N steps concurrently. Steps declaring `needs` only wait for the steps they need."),
+    fail_fast: bool = typer.Option(False, help="On the first failed step, cancel the running steps and kill their processes."),
+    keep_going: bool = typer.Option(False, help="Run all the steps which do not need a failed step, then report all the failures."),
+    artifact_cache: Optional[str] = typer.Option(
+        None,
+        envvar="PYPELINE_ARTIFACT_CACHE",
+        help="Shared cache for step outputs: a directory or an http(s):// URL. Steps supporting it are restored from the cache instead of running.",
+    ),
+    artifact_cache_read_only: bool = typer.Option(False, envvar="PYPELINE_ARTIFACT_CACHE_READ_ONLY", help="Only restore from the artifact cache, never store new entries."),
     inputs: Optional[List[str]] = typer.Option(  # noqa: B008
         None,
         "--input",
         "-i",
         help="Provide input parameters as key=value pairs (e.g., -i name=value -i flag=true).",
     ),
+    explain_schedule: bool = typer.Option(False, help="Print the planned order, start and finish of the steps based on their recorded durations, without running them."),
+    trace: Optional[Path] = typer.Option(None, help="Write a Chrome trace of the run to this file (open it in https://ui.perfetto.dev)."),  # noqa: B008
 ) -> None:
+    from pypeline.domain.pipeline import PipelineConfigIterator
+    from pypeline.domain.project_slurper import ProjectSlurper
+
+    if fail_fast and keep_going:
+        raise UserNotificationException("The options --fail-fast and --keep-going exclude each other.")
+    with _tracing(trace):
+        project_dir = project_dir.absolute()
+        project_slurper = ProjectSlurper(project_dir, config_file)
+        if print:
+            logger.info("Pipeline steps:")
+            for group, step_configs in PipelineConfigIterator(project_slurper.pipeline):
+                if group:
+                    logger.info(f"    Group: {group}")
+                for step_config in step_configs:
+                    logger.info(f"        {step_config.step}")
+            return
+        if not project_slurper.pipeline:
+            raise UserNotificationException("No pipeline found in the configuration.")
+        from pypeline.artifact_cache import ArtifactCache, create_artifact_cache_backend
+        from pypeline.domain.execution_context import ExecutionContext
+        from pypeline.pypeline import PipelineScheduler, PipelineStepsExecutor
+
+        # Schedule the steps to run
+        steps_references = PipelineScheduler[ExecutionContext](project_slurper.pipeline, project_dir).get_steps_to_run(step, single)
+        if not steps_references:
+            logger.info("No steps to run.")
+            return
+        inputs_dict = _parse_inputs(project_slurper, inputs)
+        cache = ArtifactCache(create_artifact_cache_backend(artifact_cache), artifact_cache_read_only) if artifact_cache else None
+        executor = PipelineStepsExecutor[ExecutionContext](
+            ExecutionContext(project_dir, inputs=inputs_dict, force_run=force_run),
+            steps_references,
+            force_run,
+            dry_run,
+            jobs,
+            cache,
+            project_slurper.project_config.resources,
+            fail_fast,
+            keep_going,
+        )
+        if explain_schedule:
+            _print_schedule(executor.explain_schedule(), jobs)
+            return
+        executor.run()
+
+
+@app.command(help="Run the pipeline, then re-run the steps affected by file changes until interrupted (Ctrl+C).")
+def watch(
+    project_dir: Path = typer.Option(Path.cwd().absolute(), help="The project directory"),  # noqa: B008
+    config_file: Optional[str] = typer.Option(None, help="The name of the YAML configuration file containing the pypeline definition."),
+    step: Optional[List[str]] = typer.Option(None, help="Name of the step to run (as written in the pipeline config)."),  # noqa: B008
+    single: bool = typer.Option(False, help="If provided, only the provided step will run, without running all previous steps in the pipeline."),
+    jobs: int = typer.Option(1, "--jobs", "-j", min=1, help="Run up to N steps concurrently. Steps declaring `needs` only wait for the steps they need."),
+    inputs: Optional[List[str]] = typer.Option(  # noqa: B008
+        None,
+        "--input",
+        "-i",
+        help="Provide input parameters as key=value pairs (e.g., -i name=value -i flag=true).",
+    ),
+    globs: Optional[List[str]] = typer.Option(  # noqa: B008
+        None, "--watch", help="Also watch the files matching this glob pattern (relative to the project directory). A change runs all steps."
+    ),
+    debounce: float = typer.Option(0.3, min=0, help="Seconds without further changes before the affected steps run."),
+    polling: bool = typer.Option(False, help="Poll the files for changes instead of using inotify."),
+) -> None:
+    from pypeline.domain.execution_context import ExecutionContext
+    from pypeline.domain.project_slurper import ProjectSlurper
+    from pypeline.pypeline import PipelineScheduler, PipelineStepsExecutor
+    from pypeline.watch import WatchSession, create_file_watcher
+
     project_dir = project_dir.absolute()
     project_slurper = ProjectSlurper(project_dir, config_file)
-    if print:
-        logger.info("Pipeline steps:")
-        for group, step_configs in PipelineConfigIterator(project_slurper.pipeline):
-            if group:
-                logger.info(f"    Group: {group}")
-            for step_config in step_configs:
-                logger.info(f"        {step_config.step}")
-        return
     if not project_slurper.pipeline:
         raise UserNotificationException("No pipeline found in the configuration.")
-    # Schedule the steps to run
+    # The steps are loaded once: every run only creates a new execution context
     steps_references = PipelineScheduler[ExecutionContext](project_slurper.pipeline, project_dir).get_steps_to_run(step, single)
     if not steps_references:
         logger.info("No steps to run.")
         return
-    # Parse the inputs
-    input_definitions = project_slurper.project_config.inputs
-    if input_definitions is None and inputs:
-        raise UserNotificationException(f"Inputs are not accepted because there are no inputs defined in the '{project_slurper.project_config.file}' configuration.")
-    if input_definitions and inputs:
-        inputs_dict = InputsParser.from_inputs_definitions(input_definitions).parse_inputs(inputs)
-    else:
-        inputs_dict = {}
-    PipelineStepsExecutor[ExecutionContext](ExecutionContext(project_dir, inputs=inputs_dict), steps_references, force_run, dry_run).run()
+    inputs_dict = _parse_inputs(project_slurper, inputs)
+
+    def create_executor(steps_to_execute: Optional[Set[int]]) -> PipelineStepsExecutor[ExecutionContext]:
+        return PipelineStepsExecutor[ExecutionContext](
+            ExecutionContext(project_dir, inputs=dict(inputs_dict)),
+            steps_references,
+            jobs=jobs,
+            resources=project_slurper.project_config.resources,
+            steps_to_execute=steps_to_execute,
+        )
+
+    file_watcher = create_file_watcher(polling)
+    try:
+        WatchSession(create_executor, project_dir, file_watcher, [*(project_slurper.project_config.watch or []), *(globs or [])], debounce).run()
+    except KeyboardInterrupt:
+        logger.info("Stopped watching.")
+    finally:
+        file_watcher.close()
+
+
+daemon_app = typer.Typer(name="daemon", help="Manage the pypeline daemon, which runs the commands sent by `pypeline-client` without paying the startup.", no_args_is_help=True)
+app.add_typer(daemon_app)
+
+
+@daemon_app.command("start", help="Start the daemon (in the foreground unless --detach is given).")
+def daemon_start(
+    socket: Optional[Path] = typer.Option(None, envvar="PYPELINE_DAEMON_SOCKET", help="The daemon socket (default: in $XDG_RUNTIME_DIR or the temp directory)."),  # noqa: B008
+    idle_timeout: Optional[float] = typer.Option(None, min=1, help="Stop after this many seconds without a command."),
+    detach: bool = typer.Option(False, help="Run the daemon in the background. Its output goes to a log file next to the socket."),
+) -> None:
+    import subprocess
+
+    from pypeline.client import get_socket_path, is_daemon_running
+    from pypeline.daemon import PypelineDaemon
+
+    socket_path = socket or get_socket_path()
+    if not detach:
+        PypelineDaemon(socket_path, idle_timeout).serve_forever()
+        return
+    if is_daemon_running(socket_path):
+        raise UserNotificationException(f"A pypeline daemon is already running on {socket_path}.")
+    log_file = socket_path.with_suffix(".log")
+    # The log holds the output of the commands: it goes to the directory of the socket, only accessible by the user
+    socket_path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    command = [sys.executable, "-m", "pypeline.main", "daemon", "start", "--socket", str(socket_path)]
+    if idle_timeout:
+        command += ["--idle-timeout", str(idle_timeout)]
+    with open(log_file, "w") as log:
+        subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT, start_new_session=True)  # noqa: S603
+    deadline = time.monotonic() + 30
+    while not is_daemon_running(socket_path):
+        if time.monotonic() > deadline:
+            raise UserNotificationException(f"The pypeline daemon did not start. See {log_file}.")
+        time.sleep(0.1)
+    logger.info(f"pypeline daemon started on {socket_path}, logging to {log_file}")
+
+
+@daemon_app.command("stop", help="Stop the daemon.")
+def daemon_stop(
+    socket: Optional[Path] = typer.Option(None, envvar="PYPELINE_DAEMON_SOCKET", help="The daemon socket (default: in $XDG_RUNTIME_DIR or the temp directory)."),  # noqa: B008
+) -> None:
+    from pypeline.client import request_daemon
+
+    if request_daemon({"command": "stop"}, socket) is None:
+        logger.info("No pypeline daemon is running.")
+
+
+@daemon_app.command("status", help="Show whether the daemon is running.")
+def daemon_status(
+    socket: Optional[Path] = typer.Option(None, envvar="PYPELINE_DAEMON_SOCKET", help="The daemon socket (default: in $XDG_RUNTIME_DIR or the temp directory)."),  # noqa: B008
+) -> None:
+    from pypeline.client import request_daemon
+
+    status = request_daemon({"command": "status"}, socket)
+    if status is None:
+        typer.echo("No pypeline daemon is running.")
+        raise typer.Exit(1)
+    in_progress = f", {status['running']} in progress" if status.get("running") else ""
+    typer.echo(f"pypeline daemon running (pid {status['pid']}, up {time.time() - status['started_at']:.0f}s, {status['requests']} command(s) run{in_progress})")
+
+
+@app.command(help="Show which pipeline steps are up to date and which would run, without running or loading any step.")
+def status(
+    project_dir: Path = typer.Option(Path.cwd().absolute(), help="The project directory"),  # noqa: B008
+    config_file: Optional[str] = typer.Option(None, help="The name of the YAML configuration file containing the pypeline definition."),
+    jobs: Optional[int] = typer.Option(None, "--jobs", "-j", min=1, help="Number of threads hashing files (default: number of CPUs)."),
+) -> None:
+    from pypeline.domain.project_slurper import ProjectSlurper
+    from pypeline.run_state import RUN_STATE_DB_FILE, RunStateStore
+    from pypeline.status import PipelineStatus
+
+    project_slurper = ProjectSlurper(project_dir.absolute(), config_file)
+    if not project_slurper.pipeline:
+        raise UserNotificationException("No pipeline found in the configuration.")
+    with RunStateStore(project_slurper.artifacts_locator.build_dir / RUN_STATE_DB_FILE) as state_store:
+        steps_status = PipelineStatus(project_slurper.pipeline, state_store, jobs).get_steps_status()
+    for step_status in steps_status:
+        name = f"{step_status.group_name}/{step_status.step_name}" if step_status.group_name else step_status.step_name
+        state = "up to date" if step_status.up_to_date else "dirty"
+        duration = f"{step_status.last_duration:.1f}s" if step_status.last_duration is not None else "-"
+        changed = f" ({step_status.changed})" if step_status.changed else ""
+        typer.echo(f"{name:<40} {state:<10} {duration:>8}  {step_status.reason}{changed}")
+
+
+@app.command(help="Show the duration trends of the pipeline steps over the last runs and flag the steps whose last run regressed.")
+def report(
+    project_dir: Path = typer.Option(Path.cwd().absolute(), help="The project directory"),  # noqa: B008
+    config_file: Optional[str] = typer.Option(None, help="The name of the YAML configuration file containing the pypeline definition."),
+    last: int = typer.Option(20, min=1, help="Number of runs of each step to compute the trends from."),
+    threshold: float = typer.Option(20.0, min=0, help="Flag a step whose last run is more than this percentage slower than the median of the previous runs."),
+    min_increase: float = typer.Option(1.0, min=0, help="Only flag a step whose last run is at least this many seconds slower."),
+    machine: Optional[str] = typer.Option(None, help="Report the runs on this machine (default: this machine)."),
+    fail_on_regression: bool = typer.Option(False, help="Exit with an error if a step regressed."),
+) -> None:
+    from pypeline.domain.project_slurper import ProjectSlurper
+    from pypeline.history import HistoryReport
+    from pypeline.run_state import RUN_STATE_DB_FILE, RunStateStore
+
+    project_slurper = ProjectSlurper(project_dir.absolute(), config_file)
+    with RunStateStore(project_slurper.artifacts_locator.build_dir / RUN_STATE_DB_FILE) as state_store:
+        history = state_store.get_history()
+    trends = HistoryReport(history, last, threshold / 100, min_increase).get_trends(machine)
+    if not trends:
+        typer.echo("No step durations recorded yet.")
+        return
+    typer.echo(f"{'step':<40} {'runs':>5} {'p50':>8} {'p95':>8} {'last':>8} {'change':>8}")
+    for trend in trends:
+        name = f"{trend.group_name}/{trend.step_name}" if trend.group_name else trend.step_name
+        change = f"{trend.change:+.0%}" if trend.change is not None else "-"
+        flag = "  REGRESSED" if trend.regressed else ""
+        typer.echo(f"{name:<40} {trend.runs:>5} {trend.p50:>7.1f}s {trend.p95:>7.1f}s {trend.last:>7.1f}s {change:>8}{flag}")
+    regressed = [trend.step_name for trend in trends if trend.regressed]
+    if regressed and fail_on_regression:
+        raise UserNotificationException(f"{len(regressed)} step(s) regressed: {', '.join(regressed)}")
+
 
 def main() -> None:
     try:
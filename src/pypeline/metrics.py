@@ -0,0 +1,109 @@
+import json
+import os
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from . import __version__
+
+#: Timing report of the last run, in the project build directory.
+TIMING_REPORT_FILE = "pypeline_timings.json"
+
+
+@dataclass
+class ChildrenUsage:
+    """Resource usage of the terminated child processes of pypeline (``getrusage(RUSAGE_CHILDREN)``)."""
+
+    #: User and system CPU time in seconds
+    cpu_time: float
+    #: Largest resident set size of any child, in bytes
+    max_rss: int
+
+    @classmethod
+    def snapshot(cls) -> Optional["ChildrenUsage"]:
+        """Return the current usage, or None where ``resource`` is not available (Windows)."""
+        try:
+            import resource
+        except ImportError:
+            return None
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        # ru_maxrss is in kilobytes on Linux, in bytes on macOS
+        max_rss = usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+        return cls(usage.ru_utime + usage.ru_stime, max_rss)
+
+
+@dataclass
+class StepMetrics:
+    """
+    Timings and resource usage of one step in a run. Durations are in seconds.
+
+    The child process values are process-wide deltas: with concurrent steps (``--jobs``) they also include the
+    children of the steps running at the same time.
+    """
+
+    group_name: Optional[str]
+    step_name: str
+    #: skipped, executed, restored (from the artifact cache), dry-run, failed or cancelled
+    outcome: str = "skipped"
+    #: Start time (seconds since the epoch)
+    started_at: float = field(default_factory=time.time)
+    #: Total time spent on the step: dependency check, run and recording of its run info
+    wall_time: float = 0.0
+    #: Time to decide whether the step must run (loading the run info and hashing its files)
+    check_time: float = 0.0
+    #: Time spent hashing input and output files, during the check and when recording the run info
+    hash_time: float = 0.0
+    #: Duration of ``run()`` (None if the step did not run)
+    run_time: Optional[float] = None
+    #: CPU time of the pypeline thread running ``run()``
+    cpu_time: Optional[float] = None
+    #: CPU time of the child processes which terminated during ``run()``
+    children_cpu_time: Optional[float] = None
+    #: Peak resident set size of those child processes in bytes (None if none exceeded the peak of earlier children)
+    children_max_rss: Optional[int] = None
+    #: Time to import the step class
+    import_time: Optional[float] = None
+
+    def record_children_usage(self, before: Optional[ChildrenUsage], after: Optional[ChildrenUsage]) -> None:
+        if before and after:
+            self.children_cpu_time = after.cpu_time - before.cpu_time
+            self.children_max_rss = after.max_rss if after.max_rss > before.max_rss else None
+
+
+class TimingReport:
+    """Collects the metrics of the steps of a run and writes them as JSON."""
+
+    def __init__(self, jobs: int = 1) -> None:
+        self.jobs = jobs
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self._steps: Dict[int, StepMetrics] = {}
+        self._lock = threading.Lock()
+
+    def add(self, index: int, metrics: StepMetrics) -> None:
+        """Add the metrics of the step at ``index`` in the pipeline (steps may finish in any order)."""
+        with self._lock:
+            self._steps[index] = metrics
+
+    @property
+    def steps(self) -> List[StepMetrics]:
+        with self._lock:
+            return [self._steps[index] for index in sorted(self._steps)]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "pypeline_version": __version__,
+            "started_at": self.started_at,
+            "wall_time": time.perf_counter() - self._start,
+            "jobs": self.jobs,
+            "steps": [asdict(metrics) for metrics in self.steps],
+        }
+
+    def write(self, report_file: Path) -> None:
+        report_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = report_file.with_name(f"{report_file.name}.{os.getpid()}.tmp")
+        tmp_file.write_text(json.dumps(self.to_dict(), indent=2))
+        os.replace(tmp_file, report_file)
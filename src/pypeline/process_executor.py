@@ -0,0 +1,427 @@
+import asyncio
+import contextlib
+import locale
+import subprocess  # nosec
+import threading
+import time
+import weakref
+from collections import deque
+from contextvars import ContextVar
+from pathlib import Path
+from typing import IO, Any, Deque, Dict, List, Optional, Set, Union, cast
+
+import psutil  # type: ignore[import-untyped]
+from py_app_dev.core.exceptions import UserNotificationException
+from py_app_dev.core.subprocess import SubprocessExecutor
+
+from .tracing import span
+
+#: Output lines are read at most this many characters at a time; a longer line is split.
+MAX_LINE_LENGTH = 64 * 1024
+#: Seconds between the checks of the timeout and cancel of a command whose output is still open after it exited
+OUTPUT_POLL_INTERVAL = 0.1
+
+
+#: A subprocess started by the blocking or by the asyncio engine
+Process = Union[subprocess.Popen[str], asyncio.subprocess.Process]
+
+
+class StepTimeoutError(UserNotificationException):
+    """A step did not finish within its ``timeout_sec``."""
+
+
+class StepCancelledError(UserNotificationException):
+    """A running step was stopped, e.g. because another step failed in a ``--fail-fast`` run."""
+
+
+def kill_process_tree(pid: int) -> None:
+    """Kill a process and all its descendants (children first, so none of them is re-parented and missed)."""
+    try:
+        parent = psutil.Process(pid)
+        processes = [*parent.children(recursive=True), parent]
+    except (psutil.NoSuchProcess, psutil.AccessDenied):
+        return
+    for process in processes:
+        with contextlib.suppress(psutil.Error):
+            process.kill()
+
+
+class StepProcessGroup:
+    """
+    Deadline of a step and the subprocesses it is running, killed together when the step times out or is cancelled.
+
+    The group of the running step is held in the :data:`current_process_group` context variable, so every
+    :class:`StreamingSubprocessExecutor` created by the step applies the remaining time of the step as timeout
+    and registers its process, without the step passing anything along.
+    """
+
+    #: The groups of the steps of this process (dropped once they are garbage), see :meth:`cancel_all`
+    _groups: "weakref.WeakSet[StepProcessGroup]" = weakref.WeakSet()
+    #: Why all steps are cancelled, also the ones starting afterwards (None: not cancelled)
+    _cancel_all_reason: Optional[str] = None
+    _groups_lock = threading.Lock()
+
+    def __init__(self, step_name: str, timeout_sec: Optional[float] = None) -> None:
+        self.step_name = step_name
+        self.timeout_sec = timeout_sec
+        self.deadline = time.monotonic() + timeout_sec if timeout_sec is not None else None
+        self.expired = False
+        #: Why the step was cancelled (None: not cancelled)
+        self.cancel_reason: Optional[str] = None
+        self._processes: Set[Process] = set()
+        self._lock = threading.Lock()
+        with StepProcessGroup._groups_lock:
+            StepProcessGroup._groups.add(self)
+            if StepProcessGroup._cancel_all_reason is not None:
+                self.cancel_reason, self.expired = StepProcessGroup._cancel_all_reason, True
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left until the deadline (None: no timeout)."""
+        return max(0.0, self.deadline - time.monotonic()) if self.deadline is not None else None
+
+    def add(self, process: Process) -> None:
+        with self._lock:
+            self._processes.add(process)
+            expired = self.expired
+        if expired:
+            kill_process_tree(process.pid)
+
+    def discard(self, process: Process) -> None:
+        with self._lock:
+            self._processes.discard(process)
+
+    def expire(self) -> None:
+        """Kill the process trees of all running subprocesses; subprocesses started afterwards are killed right away."""
+        with self._lock:
+            self.expired = True
+            processes = list(self._processes)
+        for process in processes:
+            kill_process_tree(process.pid)
+
+    def cancel(self, reason: str) -> None:
+        """Kill the subprocesses of the step and make it fail with a :class:`StepCancelledError`."""
+        self.cancel_reason = reason
+        self.expire()
+
+    @classmethod
+    def cancel_all(cls, reason: str) -> None:
+        """
+        Cancel the running steps of this process and the steps starting afterwards, until :meth:`reset_cancel_all`.
+
+        Used when nobody waits for the run anymore, e.g. the client of the daemon was interrupted. Can be called from any thread.
+        """
+        with cls._groups_lock:
+            cls._cancel_all_reason = reason
+            groups = list(cls._groups)
+        for group in groups:
+            group.cancel(reason)
+
+    @classmethod
+    def reset_cancel_all(cls) -> None:
+        with cls._groups_lock:
+            cls._cancel_all_reason = None
+
+    def timeout_error(self) -> StepTimeoutError:
+        return StepTimeoutError(f"Step '{self.step_name}' timed out after {self.timeout_sec} seconds. Its subprocesses were killed.")
+
+    def expired_error(self) -> UserNotificationException:
+        """Error of a step whose subprocesses were killed."""
+        if self.cancel_reason is not None:
+            return StepCancelledError(f"Step '{self.step_name}' was cancelled: {self.cancel_reason}. Its subprocesses were killed.")
+        return self.timeout_error()
+
+
+#: Process group of the step running in the current context (None: no step timeout)
+current_process_group: ContextVar[Optional[StepProcessGroup]] = ContextVar("pypeline_step_process_group", default=None)
+
+
+class StreamingSubprocessExecutor(SubprocessExecutor):
+    """
+    Subprocess executor streaming the output of the command line by line, with bounded memory.
+
+    stderr is merged into stdout. Every line is sent to the logger and, if a ``log_file`` is given, appended to it.
+    Only the last ``tail_lines`` lines are kept in memory; they are reported when the command fails or times out.
+    A command printing hundreds of megabytes (e.g. ``west update`` or ``uv sync`` on a cold cache) therefore shows
+    its progress immediately and does not accumulate its output.
+
+    Without ``print_output`` or ``capture_output`` the output is not streamed: it is returned in full in the
+    ``CompletedProcess`` (``handle_errors=False``) or discarded, as by :class:`SubprocessExecutor`. Otherwise, with
+    ``handle_errors=False`` the returned ``CompletedProcess`` only holds the tail of the output in ``stdout``.
+
+    Inside a step with a timeout (see :class:`StepProcessGroup`) the command is killed, with all its child processes,
+    when the step runs out of time and a :class:`StepTimeoutError` is raised; likewise with a
+    :class:`StepCancelledError` when the step is cancelled. The end of the output, which a background process started
+    by the command may keep open after the command exited, is only awaited within the same time.
+    """
+
+    def __init__(
+        self,
+        command: Union[str, List[Union[str, Path]]],
+        cwd: Optional[Path] = None,
+        capture_output: bool = True,
+        env: Optional[Dict[str, str]] = None,
+        shell: bool = False,
+        print_output: bool = True,
+        timeout: Optional[int] = None,
+        log_file: Optional[Path] = None,
+        tail_lines: int = 100,
+    ) -> None:
+        super().__init__(command, cwd=cwd, capture_output=capture_output, env=env, shell=shell, print_output=print_output, timeout=timeout)
+        self.log_file = log_file
+        self.tail: Deque[str] = deque(maxlen=tail_lines)
+
+    def execute(self, handle_errors: bool = True) -> Optional[subprocess.CompletedProcess[Any]]:
+        with span(self.command_str, "subprocess"):
+            return self._execute(handle_errors)
+
+    def _execute(self, handle_errors: bool) -> Optional[subprocess.CompletedProcess[Any]]:
+        if not (self.capture_output and self.print_output):
+            return self._execute_without_streaming(handle_errors)
+        self.logger.info(f"Running command: {self.command_str}")
+        process_group = current_process_group.get()
+        timeout = self._get_timeout(process_group)
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        process: Optional[subprocess.Popen[str]] = None
+        reader_thread: Optional[threading.Thread] = None
+        log: Optional[IO[str]] = None
+        try:
+            log = self._open_log()
+            process = subprocess.Popen(  # noqa: S603
+                args=self.command,
+                cwd=(self.current_working_directory or Path.cwd()).as_posix(),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                bufsize=1,
+                text=True,
+                encoding=locale.getpreferredencoding(False),
+                errors="replace",
+                env=self.env,
+                shell=self.shell,
+            )
+            if process_group:
+                process_group.add(process)
+            # The output is pumped on a thread so the timeout applies even when the command prints nothing
+            reader_thread = threading.Thread(target=self._pump_output, args=(process.stdout, log), daemon=True)
+            reader_thread.start()
+            process.wait(timeout=timeout)
+            self._wait_for_output_end(reader_thread, process_group, deadline)
+        except subprocess.TimeoutExpired:
+            raise self._timeout_error(process_group) from None
+        except FileNotFoundError as e:
+            raise UserNotificationException(f"Command '{self.command_str}' could not be executed. Failed with error {e}") from None
+        except KeyboardInterrupt:
+            raise UserNotificationException(f"Command '{self.command_str}' execution interrupted by user") from None
+        finally:
+            if process and reader_thread and reader_thread.is_alive() and process.poll() is not None:
+                # A background process of the command keeps the output open: closing the pipe would block until the
+                # read returns, so the reader thread closes it
+                process.stdout = None
+            # Kill the process (tree) first so the pipe reaches EOF and the reader thread ends
+            self._finalize_process(process=process)
+            if process_group and process:
+                process_group.discard(process)
+            if reader_thread:
+                reader_thread.join(timeout=2.0)
+                if reader_thread.is_alive():
+                    self.logger.warning(f"Command '{self.command_str}' exited, but a process it started keeps its output open. The output is no longer awaited.")
+            if log:
+                log.close()
+        return self._get_result(process.args, process.returncode, process_group, handle_errors)
+
+    def _wait_for_output_end(self, reader_thread: threading.Thread, process_group: Optional[StepProcessGroup], deadline: Optional[float]) -> None:
+        """Wait until the output is read, within the timeout: a background process started by the command can keep the output open after the command exited."""
+        while reader_thread.is_alive():
+            if process_group and process_group.expired:
+                return
+            remaining = deadline - time.monotonic() if deadline is not None else None
+            if remaining is not None and remaining <= 0:
+                raise subprocess.TimeoutExpired(self.command_str, self.timeout or 0)
+            reader_thread.join(OUTPUT_POLL_INTERVAL if remaining is None else min(remaining, OUTPUT_POLL_INTERVAL))
+
+    def _execute_without_streaming(self, handle_errors: bool) -> Optional[subprocess.CompletedProcess[Any]]:
+        # Registered with the step like a streamed command, so the step timeout and cancel apply to it too
+        self.logger.info(f"Running command: {self.command_str}")
+        process_group = current_process_group.get()
+        timeout = self._get_timeout(process_group)
+        process: Optional[subprocess.Popen[str]] = None
+        try:
+            process = subprocess.Popen(  # noqa: S603
+                args=self.command,
+                cwd=(self.current_working_directory or Path.cwd()).as_posix(),
+                stdout=subprocess.PIPE if self.capture_output else subprocess.DEVNULL,
+                stderr=subprocess.STDOUT if self.capture_output else subprocess.DEVNULL,
+                text=True,
+                encoding=locale.getpreferredencoding(False),
+                errors="replace",
+                env=self.env,
+                shell=self.shell,
+            )
+            if process_group:
+                process_group.add(process)
+            stdout, _ = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            raise self._timeout_error(process_group) from None
+        except FileNotFoundError as e:
+            raise UserNotificationException(f"Command '{self.command_str}' could not be executed. Failed with error {e}") from None
+        except KeyboardInterrupt:
+            raise UserNotificationException(f"Command '{self.command_str}' execution interrupted by user") from None
+        finally:
+            self._finalize_process(process=process)
+            if process_group and process:
+                process_group.discard(process)
+        if process_group and process_group.expired:
+            raise process_group.expired_error()
+        if handle_errors:
+            if process.returncode != 0:
+                raise UserNotificationException(f"Command '{self.command_str}' execution failed with return code {process.returncode}")
+            return None
+        return subprocess.CompletedProcess(process.args, process.returncode, stdout or "", None)
+
+    async def execute_async(self, handle_errors: bool = True) -> Optional[subprocess.CompletedProcess[Any]]:
+        """
+        Same as :meth:`execute`, on the running asyncio event loop.
+
+        The output is read by the event loop and the timeout is applied by it: many commands can run concurrently
+        without a thread per command (see :func:`execute_concurrently`). When the task is cancelled, the command is
+        killed with its child processes.
+        """
+        if not (self.capture_output and self.print_output):
+            return await asyncio.to_thread(self.execute, handle_errors)
+        with span(self.command_str, "subprocess", track=_current_task_name()):
+            return await self._execute_async(handle_errors)
+
+    async def _execute_async(self, handle_errors: bool) -> Optional[subprocess.CompletedProcess[Any]]:
+        self.logger.info(f"Running command: {self.command_str}")
+        process_group = current_process_group.get()
+        timeout = self._get_timeout(process_group)
+        process: Optional[asyncio.subprocess.Process] = None
+        log: Optional[IO[str]] = None
+        try:
+            log = self._open_log()
+            cwd = (self.current_working_directory or Path.cwd()).as_posix()
+            if self.shell:
+                process = await asyncio.create_subprocess_shell(
+                    self.command_str, cwd=cwd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT, env=self.env, limit=MAX_LINE_LENGTH
+                )
+            else:
+                command = [self.command] if isinstance(self.command, str) else self.command
+                process = await asyncio.create_subprocess_exec(
+                    *command, cwd=cwd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT, env=self.env, limit=MAX_LINE_LENGTH
+                )
+            if process_group:
+                process_group.add(process)
+            stdout = cast(asyncio.StreamReader, process.stdout)
+            await asyncio.wait_for(asyncio.gather(self._pump_output_async(stdout, log), process.wait()), timeout)
+        except asyncio.TimeoutError:
+            raise self._timeout_error(process_group) from None
+        except FileNotFoundError as e:
+            raise UserNotificationException(f"Command '{self.command_str}' could not be executed. Failed with error {e}") from None
+        finally:
+            if process and process.returncode is None:
+                # Timed out or cancelled
+                kill_process_tree(process.pid)
+                with contextlib.suppress(ProcessLookupError):
+                    process.kill()
+                await process.wait()
+            if process_group and process:
+                process_group.discard(process)
+            if log:
+                log.close()
+        # The process has already exited: wait() only returns its exit code
+        return self._get_result(self.command, await process.wait(), process_group, handle_errors)
+
+    def _get_timeout(self, process_group: Optional[StepProcessGroup]) -> Optional[float]:
+        remaining = process_group.remaining() if process_group else None
+        if remaining is None:
+            return self.timeout
+        return remaining if self.timeout is None else min(self.timeout, remaining)
+
+    def _open_log(self) -> Optional[IO[str]]:
+        if not self.log_file:
+            return None
+        self.log_file.parent.mkdir(parents=True, exist_ok=True)
+        log = open(self.log_file, "a", encoding="utf-8")
+        log.write(f"$ {self.command_str}\n")
+        return log
+
+    def _timeout_error(self, process_group: Optional[StepProcessGroup]) -> UserNotificationException:
+        if process_group and process_group.remaining() == 0:
+            return process_group.timeout_error()
+        return UserNotificationException(f"Command '{self.command_str}' timed out after {self.timeout} seconds and was forcefully terminated.{self._output_summary()}")
+
+    def _get_result(self, args: Any, returncode: int, process_group: Optional[StepProcessGroup], handle_errors: bool) -> Optional[subprocess.CompletedProcess[Any]]:
+        if process_group and process_group.expired:
+            # Killed by the step watchdog or cancelled
+            raise process_group.expired_error()
+        if handle_errors:
+            if returncode != 0:
+                raise UserNotificationException(f"Command '{self.command_str}' execution failed with return code {returncode}.{self._output_summary()}")
+            return None
+        return subprocess.CompletedProcess(args, returncode, "\n".join(self.tail), None)
+
+    def _pump_output(self, stream: IO[str], log: Optional[IO[str]]) -> None:
+        with stream:
+            for chunk in iter(lambda: stream.readline(MAX_LINE_LENGTH), ""):
+                log = self._write_output(chunk, log)
+
+    async def _pump_output_async(self, stream: asyncio.StreamReader, log: Optional[IO[str]]) -> None:
+        encoding = locale.getpreferredencoding(False)
+        while True:
+            try:
+                data = await stream.readuntil(b"\n")
+            except asyncio.IncompleteReadError as e:
+                # Last line without newline, or end of the output
+                data = e.partial
+                if not data:
+                    break
+            except asyncio.LimitOverrunError as e:
+                # A line longer than MAX_LINE_LENGTH is split
+                data = await stream.readexactly(min(e.consumed, MAX_LINE_LENGTH))
+            log = self._write_output(data.decode(encoding, errors="replace"), log)
+
+    def _write_output(self, chunk: str, log: Optional[IO[str]]) -> Optional[IO[str]]:
+        """Log a chunk of output and append it to the log file. Return the log file, or None once it can no longer be written."""
+        line = chunk.rstrip("\r\n")
+        self.logger.info(line.strip())
+        self.tail.append(line)
+        if log:
+            try:
+                log.write(chunk)
+            except (OSError, ValueError):
+                # The log file is closed when the command is killed; the output is still logged
+                return None
+        return log
+
+    def _output_summary(self) -> str:
+        summary = ""
+        if self.tail:
+            summary += f"\nLast {len(self.tail)} output lines:\n" + "\n".join(self.tail)
+        if self.log_file:
+            summary += f"\nFull output: {self.log_file}"
+        return summary
+
+
+def _current_task_name() -> Optional[str]:
+    task = asyncio.current_task()
+    return f"{threading.current_thread().name} {task.get_name()}" if task else None
+
+
+def execute_concurrently(executors: List[StreamingSubprocessExecutor], max_parallel: Optional[int] = None) -> List[Optional[BaseException]]:
+    """
+    Run the commands of the executors concurrently, at most ``max_parallel`` at a time, on one asyncio event loop.
+
+    One thread supervises all commands: their output, timeouts and the step timeout. (Before Python 3.12, asyncio
+    still waits for the exit of each child process on a small helper thread.) Return the error of each command
+    (None if it succeeded). If the thread is interrupted, all running commands are killed.
+    """
+
+    async def execute_all() -> List[Any]:
+        semaphore = asyncio.Semaphore(max_parallel or len(executors) or 1)
+
+        async def execute(executor: StreamingSubprocessExecutor) -> None:
+            async with semaphore:
+                await executor.execute_async()
+
+        return await asyncio.gather(*(execute(executor) for executor in executors), return_exceptions=True)
+
+    return [result if isinstance(result, BaseException) else None for result in asyncio.run(execute_all())]
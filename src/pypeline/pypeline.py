@@ -1,22 +1,26 @@
 import os
 import re
 import shlex
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
 from pathlib import Path
 from typing import (
+    TYPE_CHECKING,
     Any,
     Dict,
     Generic,
     List,
     Optional,
     OrderedDict,
+    Set,
     Tuple,
     Type,
 )
 
 from py_app_dev.core.exceptions import UserNotificationException
 from py_app_dev.core.logging import logger
-from py_app_dev.core.runnable import Executor
 
+from .artifact_cache import ArtifactCache
 from .domain.artifacts import ProjectArtifactsLocator
 from .domain.execution_context import ExecutionContext
 from .domain.pipeline import (
@@ -30,6 +34,16 @@ from .domain.pipeline import (
     StepClassFactory,
     TExecutionContext,
 )
+from .history import estimate_durations, get_config_hash, get_machine_name, percentile
+from .metrics import TIMING_REPORT_FILE, StepMetrics, TimingReport
+from .process_executor import StepCancelledError, execute_concurrently
+from .resources import ResourceTokens
+from .run_state import RUN_STATE_DB_FILE, RunStateStore, StepDuration
+from .step_executor import StepExecutor
+from .tracing import span
+
+if TYPE_CHECKING:
+    from loguru import Record
 
 #: GitHub-Actions-style placeholder: ``${{ <reference> }}``, whitespace-tolerant.
 INPUT_PLACEHOLDER_PATTERN = re.compile(r"\$\{\{\s*(.+?)\s*\}\}")
@@ -94,32 +108,64 @@ class RunCommandClassFactory(StepClassFactory[PipelineStep[TExecutionContext]]):
             raise UserNotificationException(f"Step '{step_name}' has no `run` command defined. Please check your pipeline configuration.")
         if isinstance(step_config.run, str) and not step_config.run.strip():
             raise UserNotificationException(f"Step '{step_name}' has an empty `run` block. Please provide at least one command.")
-        return self._create_run_commands_step_class(step_config.run, step_name)
+        if step_config.max_parallel is not None and step_config.max_parallel < 1:
+            raise UserNotificationException(f"Step '{step_name}' has an invalid `max_parallel` value {step_config.max_parallel}. It must be at least 1.")
+        return self._create_run_commands_step_class(step_config.run, step_name, bool(step_config.parallel), step_config.max_parallel)
 
     @staticmethod
-    def _create_run_commands_step_class(run_spec: RunCommandSpec, name: str) -> Type[PipelineStep[ExecutionContext]]:
-        """Dynamically creates a step class that runs the configured commands sequentially."""
+    def _create_run_commands_step_class(run_spec: RunCommandSpec, name: str, parallel: bool = False, max_parallel: Optional[int] = None) -> Type[PipelineStep[ExecutionContext]]:
+        """Dynamically creates a step class that runs the configured commands sequentially (or concurrently if `parallel` is set)."""
 
         class TmpDynamicRunCommandsStep(PipelineStep[ExecutionContext]):
-            """A simple step that runs the configured commands sequentially."""
+            """A simple step that runs the configured commands sequentially (or concurrently if `parallel` is set)."""
 
             def __init__(self, execution_context: ExecutionContext, group_name: str, config: Optional[Dict[str, Any]] = None) -> None:
                 super().__init__(execution_context, group_name, config)
                 self.run_spec = run_spec
                 self.name = name
+                self.parallel = parallel
+                self.max_parallel = max_parallel
 
             def get_needs_dependency_management(self) -> bool:
                 """A commands step does not need dependency management."""
                 return False
 
             def run(self) -> int:
-                for command in parse_run_commands(self.run_spec, self.execution_context.inputs, self.name):
+                commands = parse_run_commands(self.run_spec, self.execution_context.inputs, self.name)
+                if self.parallel and len(commands) > 1:
+                    self._run_commands_in_parallel(commands)
+                    return 0
+                for command in commands:
                     self.execution_context.create_process_executor(
                         command,  # type: ignore
                         cwd=self.project_root_dir,
+                        log_file=self.log_file,
                     ).execute()
                 return 0
 
+            def _run_commands_in_parallel(self, commands: List[List[str]]) -> None:
+                """Run all commands, at most `max_parallel` at a time, and report every failed command afterwards."""
+                process_executors = []
+                for index, command in enumerate(commands):
+                    process_executor = self.execution_context.create_process_executor(
+                        command,  # type: ignore
+                        cwd=self.project_root_dir,
+                        log_file=self.log_file,
+                    )
+                    # Tag every output line so the interleaved outputs of the commands stay readable
+                    prefix = f"[{index + 1}/{len(commands)} {Path(command[0]).stem}] "
+
+                    def add_prefix(record: "Record", prefix: str = prefix) -> None:
+                        record["message"] = prefix + record["message"]
+
+                    process_executor.logger = process_executor.logger.patch(add_prefix)
+                    process_executors.append(process_executor)
+                # All commands are supervised by one event loop, which inherits the step context (see StepProcessGroup)
+                errors = execute_concurrently(process_executors, self.max_parallel)
+                failures = [f"  {shlex.join(command)}: {error}" for command, error in zip(commands, errors) if error is not None]
+                if failures:
+                    raise UserNotificationException(f"Step '{self.name}': {len(failures)} of {len(commands)} commands failed:\n" + "\n".join(failures))
+
             def get_name(self) -> str:
                 return self.name
 
@@ -137,7 +183,16 @@ class RunCommandClassFactory(StepClassFactory[PipelineStep[TExecutionContext]]):
 
 
 class PipelineStepsExecutor(Generic[TExecutionContext]):
-    """Executes a list of pipeline steps sequentially."""
+    """
+    Executes a list of pipeline steps.
+
+    By default the steps run sequentially. With ``jobs > 1`` the steps are scheduled as a dependency graph
+    (see :attr:`PipelineStepReference.needs`) on a pool of worker threads, so independent steps overlap.
+
+    By default, a failed step stops the run: no new step starts, the running ones are waited for and the error is raised.
+    With ``fail_fast`` the running steps are cancelled as well, killing their subprocess trees. With ``keep_going``
+    all the steps which do not need a failed step still run and all the failures are reported at the end.
+    """
 
     def __init__(
         self,
@@ -145,28 +200,357 @@ class PipelineStepsExecutor(Generic[TExecutionContext]):
         steps_references: List[PipelineStepReference[PipelineStep[TExecutionContext]]],
         force_run: bool = False,
         dry_run: bool = False,
+        jobs: int = 1,
+        artifact_cache: Optional[ArtifactCache] = None,
+        resources: Optional[Dict[str, int]] = None,
+        fail_fast: bool = False,
+        keep_going: bool = False,
+        steps_to_execute: Optional[Set[int]] = None,
     ) -> None:
         self.logger = logger.bind()
         self.execution_context = execution_context
         self.steps_references = steps_references
         self.force_run = force_run
         self.dry_run = dry_run
+        self.jobs = jobs
+        self.artifact_cache = artifact_cache
+        #: Tokens available per resource in a concurrent run (see :class:`ResourceTokens`)
+        self.resources = resources
+        if fail_fast and keep_going:
+            raise UserNotificationException("The fail-fast and keep-going policies exclude each other.")
+        self.fail_fast = fail_fast
+        self.keep_going = keep_going
+        #: Indices of the steps to execute (None: all). The other steps are instantiated and update the execution context only.
+        self.steps_to_execute = steps_to_execute
+        #: The steps instantiated in the last run, by index
+        self.steps: Dict[int, PipelineStep[TExecutionContext]] = {}
+        self.state_store: Optional[RunStateStore] = None
+        self.timing_report = TimingReport(jobs)
+        self.history: List[StepDuration] = []
 
     @property
     def artifacts_locator(self) -> ProjectArtifactsLocator:
         return self.execution_context.create_artifacts_locator()
 
     def run(self) -> None:
-        for step_reference in self.steps_references:
+        self.timing_report = TimingReport(self.jobs)
+        self.history = []
+        self.steps = {}
+        try:
+            # The run state of all steps is loaded once and shared by all steps of this run
+            with RunStateStore(self.artifacts_locator.build_dir / RUN_STATE_DB_FILE) as self.state_store:
+                completed = False
+                try:
+                    if self.jobs > 1:
+                        self._run_concurrently()
+                    else:
+                        self._run_sequentially()
+                    completed = True
+                finally:
+                    # The durations of the steps which ran, also if a later step failed (see `pypeline report`)
+                    self.state_store.add_history(self.history)
+                    # A complete run looked up all the files of the pipeline: the other hashes are of deleted or renamed files
+                    self.state_store.file_hashes.save(prune=completed and self.steps_to_execute is None)
+        finally:
+            self.state_store = None
+            # Also written for a failed run, to see where the time went
+            report_file = self.artifacts_locator.build_dir / TIMING_REPORT_FILE
+            self.timing_report.write(report_file)
+            self.logger.debug(f"Step timings written to {report_file}")
+        self._log_import_times()
+
+    def _log_import_times(self) -> None:
+        """Report the time spent importing step classes, slowest first (only steps that were instantiated are imported)."""
+        import_times = sorted(
+            ((reference.name, reference.import_duration) for reference in self.steps_references if reference.import_duration is not None),
+            key=lambda item: item[1],
+            reverse=True,
+        )
+        if import_times:
+            details = ", ".join(f"{name} {duration:.2f}s" for name, duration in import_times)
+            self.logger.info(f"Imported {len(import_times)} step classes in {sum(duration for _, duration in import_times):.2f}s: {details}")
+
+    def _run_sequentially(self) -> None:
+        needs = self._resolve_needs()
+        failures: Dict[int, BaseException] = {}
+        skipped: List[int] = []
+        for index, step_reference in enumerate(self.steps_references):
+            if self._skip_if_needs_failed(index, needs, failures, skipped):
+                continue
+            step = self.steps[index] = self._create_step(step_reference)
+            try:
+                self._execute_step(index, step, self._create_step_executor(index, step))
+            except Exception as e:
+                if not self.keep_going:
+                    raise
+                self.logger.error(f"Step '{step_reference.name}' failed: {e}")
+                failures[index] = e
+                continue
+            # Independent if the step was executed or not, every step shall update the context
+            self._update_execution_context(step_reference, step)
+        self._raise_failures(failures, skipped)
+
+    def _create_step(self, step_reference: PipelineStepReference[PipelineStep[TExecutionContext]]) -> PipelineStep[TExecutionContext]:
+        with span(f"create {step_reference.name}", "step"):
             step = step_reference._class(self.execution_context, step_reference.group_name, step_reference.config)
             # Create the step output directory, to make sure that files can be created.
             step.output_dir.mkdir(parents=True, exist_ok=True)
-            # Execute the step is necessary. If the step is not dirty, it will not be executed
-            Executor(step.output_dir, self.force_run, self.dry_run).execute(step)
-            # Independent if the step was executed or not, every step shall update the context
+        return step
+
+    def _update_execution_context(self, step_reference: PipelineStepReference[PipelineStep[TExecutionContext]], step: PipelineStep[TExecutionContext]) -> None:
+        with span(f"update_execution_context {step_reference.name}", "step"):
             step.update_execution_context()
 
-        return
+    def _create_step_executor(self, index: int, step: PipelineStep[TExecutionContext]) -> StepExecutor:
+        return StepExecutor(step.output_dir, self.force_run, self.dry_run, self.artifact_cache, self.state_store, self.steps_references[index].timeout_sec)
+
+    def _execute_step(self, index: int, step: PipelineStep[TExecutionContext], step_executor: StepExecutor) -> None:
+        if self.steps_to_execute is not None and index not in self.steps_to_execute:
+            return
+        step_reference = self.steps_references[index]
+        with span(step_reference.name, "step", group=step_reference.group_name) as span_args:
+            try:
+                # Execute the step is necessary. If the step is not dirty, it will not be executed
+                step_executor.execute(step)
+            finally:
+                if step_executor.metrics:
+                    span_args["outcome"] = step_executor.metrics.outcome
+                    step_executor.metrics.import_time = step_reference.import_duration
+                    self.timing_report.add(index, step_executor.metrics)
+                    self._add_to_history(step_reference, step, step_executor.metrics)
+
+    def _add_to_history(self, step_reference: PipelineStepReference[PipelineStep[TExecutionContext]], step: PipelineStep[TExecutionContext], metrics: StepMetrics) -> None:
+        # Only successful executions: skipped, restored and failed steps say nothing about how long the step takes
+        if metrics.outcome == "executed" and metrics.run_time is not None:
+            self.history.append(StepDuration(step_reference.group_name or "", step_reference.name, get_config_hash(step), get_machine_name(), metrics.started_at, metrics.run_time))
+
+    def _run_concurrently(self) -> None:
+        """
+        Run the steps as a dependency graph on a worker pool.
+
+        Steps are instantiated and their ``update_execution_context`` is applied on this thread, strictly
+        in pipeline order: a finished step only publishes its context once every earlier step has published,
+        and a step only starts once all its dependencies have published. A step sees the context of the steps
+        before its last need, never more: a context is only published once the later steps that started (or
+        may start) without it have finished, see :func:`may_publish`. So no step is running while the context
+        changes. Only ``run`` happens on the workers.
+
+        Among the steps ready to start, the ones on the longest remaining path (estimated from the recorded durations)
+        start first, see :class:`CriticalPathPriorities`, as long as the resource tokens they declare are available,
+        see :class:`ResourceTokens`.
+
+        With ``keep_going``, the failed steps and the steps skipped because they need a failed step are passed over
+        when publishing the contexts.
+        """
+        needs = self._resolve_needs()
+        dependencies = self._resolve_dependencies(needs)
+        priorities = self._create_priorities(dependencies)
+        resource_tokens = self._create_resource_tokens()
+        steps = self.steps
+        step_executors: Dict[int, StepExecutor] = {}
+        pending = list(range(len(self.steps_references)))
+        running: Dict[Future[None], int] = {}
+        finished: Set[int] = set()
+        failures: Dict[int, BaseException] = {}
+        skipped: List[int] = []
+        published = 0
+        with ThreadPoolExecutor(max_workers=self.jobs, thread_name_prefix="pypeline") as pool:
+            while True:
+                while published in finished or (self.keep_going and (published in failures or published in skipped)):
+                    if published in finished:
+                        if not may_publish(published, dependencies, finished.union(failures, skipped)):
+                            break
+                        self._update_execution_context(self.steps_references[published], steps[published])
+                    published += 1
+                if published == len(self.steps_references):
+                    break
+                if not failures or self.keep_going:
+                    ready = priorities.sort([index for index in pending if dependencies[index] <= published])
+                    ready_to_skip = [index for index in ready if self._skip_if_needs_failed(index, needs, failures, skipped)]
+                    if ready_to_skip:
+                        for index in ready_to_skip:
+                            pending.remove(index)
+                        continue
+                    for index in resource_tokens.admit(ready, self.jobs - len(running)):
+                        steps[index] = self._create_step(self.steps_references[index])
+                        step_executors[index] = self._create_step_executor(index, steps[index])
+                        running[pool.submit(self._execute_step, index, steps[index], step_executors[index])] = index
+                        pending.remove(index)
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = running.pop(future)
+                    resource_tokens.release(index)
+                    if (error := future.exception()) is None:
+                        finished.add(index)
+                        continue
+                    failures[index] = error
+                    if isinstance(error, StepCancelledError):
+                        self.logger.warning(f"{error}")
+                        continue
+                    self.logger.error(f"Step '{self.steps_references[index].name}' failed: {error}")
+                    if self.fail_fast:
+                        for running_index in running.values():
+                            step_executors[running_index].cancel(f"step '{self.steps_references[index].name}' failed")
+        self._raise_failures(failures, skipped)
+
+    def _skip_if_needs_failed(self, index: int, needs: List[List[int]], failures: Dict[int, BaseException], skipped: List[int]) -> bool:
+        """Skip a step needing a step which failed or was skipped (only with ``keep_going``, otherwise the run stopped already)."""
+        failed_needs = [need for need in needs[index] if need in failures or need in skipped]
+        if not failed_needs:
+            return False
+        skipped.append(index)
+        failed_names = ", ".join(self.steps_references[need].name for need in failed_needs)
+        self.logger.warning(f"Step '{self.steps_references[index].name}' is skipped because it needs the failed step(s): {failed_names}")
+        return True
+
+    def _raise_failures(self, failures: Dict[int, BaseException], skipped: List[int]) -> None:
+        if not failures:
+            return
+        if not self.keep_going:
+            # The first failure; the other errors are the steps it cancelled or which failed while it was handled
+            raise next((error for error in failures.values() if not isinstance(error, StepCancelledError)), next(iter(failures.values())))
+        failed_names = ", ".join(self.steps_references[index].name for index in sorted(failures))
+        message = f"{len(failures)} step(s) failed: {failed_names}."
+        if skipped:
+            message += f" {len(skipped)} step(s) did not run because they need a failed step: {', '.join(self.steps_references[index].name for index in sorted(skipped))}."
+        raise UserNotificationException(message)
+
+    def _create_priorities(self, dependencies: List[int]) -> "CriticalPathPriorities":
+        estimates = estimate_durations(self.state_store.get_history()) if self.state_store else {}
+        return CriticalPathPriorities(dependencies, [estimates.get((reference.group_name or "", reference.name)) for reference in self.steps_references])
+
+    def _create_resource_tokens(self) -> ResourceTokens:
+        return ResourceTokens([reference.resources for reference in self.steps_references], self.resources, [reference.name for reference in self.steps_references])
+
+    def explain_schedule(self) -> List["ScheduledStep"]:
+        """
+        Plan the run with the recorded step durations, without running anything.
+
+        With ``jobs == 1`` the steps run in pipeline order; otherwise as scheduled by :meth:`_run_concurrently`.
+        """
+        with RunStateStore(self.artifacts_locator.build_dir / RUN_STATE_DB_FILE) as self.state_store:
+            dependencies = self._resolve_dependencies() if self.jobs > 1 else list(range(len(self.steps_references)))
+            priorities = self._create_priorities(dependencies)
+        self.state_store = None
+        times = priorities.simulate(self.jobs, self._create_resource_tokens() if self.jobs > 1 else None)
+        return [
+            ScheduledStep(reference.group_name, reference.name, priorities.durations[index], priorities.estimates[index] is not None, priorities.ranks[index], *times[index])
+            for index, reference in enumerate(self.steps_references)
+        ]
+
+    def _resolve_needs(self) -> List[List[int]]:
+        """
+        For every step, return the indices of the steps it needs.
+
+        A step without ``needs`` needs all previous steps. Declared needs that are not scheduled in this run
+        (e.g. filtered out with ``--step --single``) are considered satisfied.
+        """
+        result: List[List[int]] = []
+        latest_index: Dict[str, int] = {}
+        for index, step_reference in enumerate(self.steps_references):
+            if step_reference.needs is None:
+                result.append(list(range(index)))
+            else:
+                result.append(sorted({latest_index[name] for name in step_reference.needs if name in latest_index}))
+            latest_index[step_reference.name] = index
+        return result
+
+    def _resolve_dependencies(self, needs: Optional[List[List[int]]] = None) -> List[int]:
+        """For every step, return the number of leading steps that must have published their context before it can start."""
+        return [max(step_needs, default=-1) + 1 for step_needs in (needs if needs is not None else self._resolve_needs())]
+
+    def get_dependent_steps(self, indices: Set[int]) -> Set[int]:
+        """Return the given step indices and the indices of all the steps needing them, directly or not."""
+        result = set(indices)
+        for index, step_needs in enumerate(self._resolve_needs()):
+            if result.intersection(step_needs):
+                result.add(index)
+        return result
+
+
+@dataclass
+class ScheduledStep:
+    """Planned start and finish of a step, in seconds from the start of the run (see :meth:`PipelineStepsExecutor.explain_schedule`)."""
+
+    group_name: Optional[str]
+    step_name: str
+    #: Expected duration of the step
+    duration: float
+    #: The duration is the median of the recorded runs of the step (otherwise: the median of the other steps)
+    recorded: bool
+    #: Expected duration of the longest path from the start of the step to the end of the run
+    critical_path: float
+    start: float
+    finish: float
+
+
+class CriticalPathPriorities:
+    """
+    Priorities of the steps of a concurrent run, by longest remaining path (list scheduling as in HEFT).
+
+    ``dependencies[i]`` is the number of leading steps step ``i`` waits for (see
+    :meth:`PipelineStepsExecutor._resolve_dependencies`) and ``estimates[i]`` its expected duration, if known.
+    The rank of a step is its duration plus the largest rank of the steps waiting for it: the expected time from its
+    start to the end of the run. Starting the ready steps with the highest rank first keeps the long poles (e.g. a
+    documentation build) from starting last, behind many short steps. Steps without a recorded duration are assumed
+    to take the median of the known ones; with no durations at all, the steps start in pipeline order.
+    """
+
+    #: Assumed duration of every step if none has been recorded yet
+    DEFAULT_DURATION = 1.0
+
+    def __init__(self, dependencies: List[int], estimates: List[Optional[float]]) -> None:
+        self.dependencies = dependencies
+        self.estimates = estimates
+        known = [estimate for estimate in estimates if estimate is not None]
+        default = percentile(known, 0.5) if known else self.DEFAULT_DURATION
+        self.durations = [default if estimate is None else estimate for estimate in estimates]
+        self.ranks = [0.0] * len(dependencies)
+        for index in reversed(range(len(dependencies))):
+            successors_rank = max((self.ranks[successor] for successor in range(index + 1, len(dependencies)) if dependencies[successor] > index), default=0.0)
+            self.ranks[index] = self.durations[index] + successors_rank
+
+    def sort(self, indices: List[int]) -> List[int]:
+        """Highest rank first; steps with the same rank in pipeline order."""
+        return sorted(indices, key=lambda index: (-self.ranks[index], index))
+
+    def simulate(self, jobs: int, resource_tokens: Optional[ResourceTokens] = None) -> List[Tuple[float, float]]:
+        """Expected start and finish time of each step on ``jobs`` workers, admitted by ``resource_tokens`` (if given)."""
+        times: List[Tuple[float, float]] = [(0.0, 0.0)] * len(self.dependencies)
+        pending = list(range(len(self.dependencies)))
+        running: List[Tuple[float, int]] = []
+        finished: Set[int] = set()
+        published = 0
+        now = 0.0
+        while pending or running:
+            ready = self.sort([index for index in pending if self.dependencies[index] <= published])
+            for index in resource_tokens.admit(ready, jobs - len(running)) if resource_tokens else ready[: jobs - len(running)]:
+                times[index] = (now, now + self.durations[index])
+                running.append((now + self.durations[index], index))
+                pending.remove(index)
+            if not running:
+                break
+            running.sort()
+            now, index = running.pop(0)
+            if resource_tokens:
+                resource_tokens.release(index)
+            finished.add(index)
+            while published in finished and may_publish(published, self.dependencies, finished):
+                published += 1
+        return times
+
+
+def may_publish(index: int, dependencies: List[int], done: Set[int]) -> bool:
+    """
+    Whether the finished step ``index`` may publish its context, its predecessors having published theirs.
+
+    ``dependencies`` are the numbers of leading steps each step waits for (see
+    :meth:`PipelineStepsExecutor._resolve_dependencies`). A later step which only waits for the steps before
+    ``index`` started, or may start, with the context without it: the context must not change under it.
+    """
+    return all(later in done for later in range(index + 1, len(dependencies)) if dependencies[later] <= index)
 
 
 class PipelineScheduler(Generic[TExecutionContext]):
@@ -185,8 +569,24 @@ class PipelineScheduler(Generic[TExecutionContext]):
         self.logger = logger.bind()
 
     def get_steps_to_run(self, step_names: Optional[List[str]] = None, single: bool = False) -> List[PipelineStepReference[PipelineStep[TExecutionContext]]]:
+        self.validate_needs(self.pipeline)
         return self.create_pipeline_loader(self.filter_steps(self.pipeline, step_names, single), self.project_root_dir).load_steps_references()
 
+    @staticmethod
+    def validate_needs(pipeline_config: PipelineConfig) -> None:
+        """Every name listed in a step's `needs` must refer to a step defined before it, which keeps the dependency graph acyclic."""
+        seen_steps: set[str] = set()
+        all_steps = {step_config.class_name or step_config.step for _, steps_config in PipelineConfigIterator(pipeline_config) for step_config in steps_config}
+        for _, steps_config in PipelineConfigIterator(pipeline_config):
+            for step_config in steps_config:
+                step_name = step_config.class_name or step_config.step
+                for needed in step_config.needs or []:
+                    if needed not in seen_steps:
+                        reason = "is defined after it" if needed in all_steps else "does not exist"
+                        raise UserNotificationException(f"Step '{step_name}' needs step '{needed}' which {reason}. A step can only need steps defined before it.")
+                if step_name:
+                    seen_steps.add(step_name)
+
     @staticmethod
     def filter_steps(pipeline_config: PipelineConfig, step_names: Optional[List[str]], single: bool) -> PipelineConfig:
         """
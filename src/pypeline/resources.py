@@ -0,0 +1,59 @@
+import os
+from typing import Dict, List, Optional, Set
+
+from py_app_dev.core.logging import logger
+
+
+def get_default_capacities() -> Dict[str, int]:
+    """Tokens available per resource if the project does not configure them: ``cpu`` is the number of CPUs."""
+    return {"cpu": os.cpu_count() or 1}
+
+
+class ResourceTokens:
+    """
+    Admission of the steps of a concurrent run by the resource tokens they declare (``resources`` in the step config).
+
+    A step only starts when all the tokens it requests are free; they are returned when it finishes. A resource has
+    the capacity configured in the project ``resources`` (``cpu`` defaults to the number of CPUs, any other resource
+    to 1, i.e. exclusive use). A step requesting more than the capacity gets the whole capacity, instead of never
+    starting. Steps without ``resources`` only count against ``--jobs``.
+
+    Steps are admitted in priority order. Once a step does not fit, the resources it requests are reserved for it:
+    steps after it needing one of them wait, so that many small steps cannot starve a large one. Steps needing only
+    other resources can still start.
+    """
+
+    def __init__(self, requests: List[Optional[Dict[str, int]]], capacities: Optional[Dict[str, int]] = None, step_names: Optional[List[str]] = None) -> None:
+        self.capacities = {**get_default_capacities(), **(capacities or {})}
+        step_names = step_names or [f"#{index + 1}" for index in range(len(requests))]
+        self.requests = [self._fit(step_name, request or {}) for step_name, request in zip(step_names, requests)]
+        self.available = dict(self.capacities)
+
+    def _fit(self, step_name: str, request: Dict[str, int]) -> Dict[str, int]:
+        fitted = {}
+        for name, amount in request.items():
+            capacity = self.capacities.setdefault(name, 1)
+            if amount > capacity:
+                logger.warning(f"Step '{step_name}' requests {amount} '{name}' tokens but only {capacity} are available. It will use all of them.")
+            fitted[name] = min(amount, capacity)
+        return fitted
+
+    def admit(self, candidates: List[int], free_workers: int) -> List[int]:
+        """Take the tokens of the candidate steps (indices in priority order) which can start now, at most ``free_workers``."""
+        admitted: List[int] = []
+        reserved: Set[str] = set()
+        for index in candidates:
+            if len(admitted) >= free_workers:
+                break
+            request = self.requests[index]
+            if reserved.intersection(request) or any(self.available[name] < amount for name, amount in request.items()):
+                reserved.update(request)
+                continue
+            for name, amount in request.items():
+                self.available[name] -= amount
+            admitted.append(index)
+        return admitted
+
+    def release(self, index: int) -> None:
+        for name, amount in self.requests[index].items():
+            self.available[name] += amount
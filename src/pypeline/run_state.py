@@ -0,0 +1,247 @@
+import json
+import sqlite3
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from py_app_dev.core.runnable import RunInfoStatus
+
+from .hashing import FileHashCache
+
+#: Run state database, in the project build directory.
+RUN_STATE_DB_FILE = "pypeline_state.db"
+
+#: Durations kept per step series (step, group, configuration and machine) in the run history
+HISTORY_MAX_RUNS = 200
+
+#: Columns added to existing databases after their creation (name -> definition)
+_ADDED_COLUMNS = {"step_runs": {"timed_out": "INTEGER NOT NULL DEFAULT 0"}}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS step_runs (
+    group_name TEXT NOT NULL,
+    step_id TEXT NOT NULL,
+    step_name TEXT NOT NULL,
+    step_config TEXT,
+    run_info TEXT,
+    started_at REAL,
+    duration REAL,
+    exit_status INTEGER,
+    timed_out INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (group_name, step_id)
+);
+CREATE TABLE IF NOT EXISTS step_history (
+    group_name TEXT NOT NULL,
+    step_name TEXT NOT NULL,
+    config_hash TEXT NOT NULL,
+    machine TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    duration REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS step_history_series ON step_history (group_name, step_name, config_hash, machine, started_at);
+CREATE TABLE IF NOT EXISTS file_hashes (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    hash TEXT NOT NULL
+);
+"""
+
+
+@dataclass
+class StepRunRecord:
+    """What is known about the last execution of a step."""
+
+    #: Output group of the step ('' for steps without group)
+    group_name: str
+    #: Dependency tracking id of the step (``get_id()``)
+    step_id: str
+    #: Step name as referenced in the pipeline configuration
+    step_name: str
+    #: Step ``config`` from the pipeline configuration
+    step_config: Optional[Dict[str, Any]] = None
+    #: Input and output hashes and the step configuration, in the ``.deps.json`` format. None if the step must run again (e.g. it failed).
+    run_info: Optional[Dict[str, Any]] = None
+    #: Start time of the last execution (seconds since the epoch)
+    started_at: Optional[float] = None
+    #: Duration of the last execution in seconds
+    duration: Optional[float] = None
+    #: Exit status of the last execution (None if it raised an exception)
+    exit_status: Optional[int] = None
+    #: The last execution was stopped because it exceeded the step ``timeout_sec``
+    timed_out: bool = False
+
+
+@dataclass
+class StepDuration:
+    """Duration of one execution of a step, kept in the run history."""
+
+    #: Output group of the step ('' for steps without group)
+    group_name: str
+    step_name: str
+    #: Hash of the step configuration (and commands): durations are only compared for the same configuration
+    config_hash: str
+    #: Name of the machine the step ran on
+    machine: str
+    #: Start time (seconds since the epoch)
+    started_at: float
+    #: Duration of ``run()`` in seconds
+    duration: float
+
+
+def check_run_info(
+    previous_info: Dict[str, Any], current_config: Optional[Dict[str, Any]], current_inputs: Iterable[Path], get_file_hash: Callable[[Path], Optional[str]]
+) -> Tuple[RunInfoStatus, Optional[str]]:
+    """
+    Compare recorded run info with the current state, using the same rules as the py_app_dev executor.
+
+    Return the status and what changed: the path of the changed file or ``config``.
+    """
+    if "config" in previous_info and current_config != previous_info["config"]:
+        return RunInfoStatus.CONFIG_CHANGED, "config"
+    previous_inputs = set(previous_info.get("inputs", {}).keys())
+    changed_inputs = previous_inputs.symmetric_difference(str(path) for path in current_inputs)
+    if changed_inputs:
+        return RunInfoStatus.INPUT_FILES_CHANGED, sorted(changed_inputs)[0]
+    if not any(previous_info.get(file_type) for file_type in ["inputs", "outputs"]):
+        return RunInfoStatus.NOTHING_TO_CHECK, None
+    for file_type in ["inputs", "outputs"]:
+        for path_str, previous_hash in previous_info.get(file_type, {}).items():
+            path = Path(path_str)
+            if not path.exists():
+                return RunInfoStatus.FILE_NOT_FOUND, path_str
+            if get_file_hash(path) != previous_hash:
+                return RunInfoStatus.FILE_CHANGED, path_str
+    return RunInfoStatus.MATCH, None
+
+
+def _from_json(value: Optional[str]) -> Optional[Dict[str, Any]]:
+    return json.loads(value) if value is not None else None
+
+
+class RunStateStore:
+    """
+    Per-project SQLite database with the run state of all steps and the file hash cache.
+
+    Replaces the ``.deps.json`` and ``file_hashes.json`` files in the step output directories: the records are
+    loaded once when the store is opened and every step update is a single transaction. It is safe to use
+    from the worker threads of a concurrent run.
+    """
+
+    def __init__(self, db_file: Path) -> None:
+        self.db_file = db_file
+        self._lock = threading.Lock()
+        db_file.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(db_file, check_same_thread=False)
+        with self._connection:
+            self._connection.executescript(_SCHEMA)
+            self._add_missing_columns()
+        self._records = {(record.group_name, record.step_id): record for record in self._load_records()}
+        self.file_hashes = _StoredFileHashCache(self)
+
+    def _add_missing_columns(self) -> None:
+        """Databases created by older versions lack the columns added since; they are added in place."""
+        for table, columns in _ADDED_COLUMNS.items():
+            existing_columns = {row[1] for row in self._connection.execute(f"PRAGMA table_info({table})")}
+            for name, definition in columns.items():
+                if name not in existing_columns:
+                    self._connection.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+
+    def _load_records(self) -> List[StepRunRecord]:
+        rows = self._connection.execute("SELECT group_name, step_id, step_name, step_config, run_info, started_at, duration, exit_status, timed_out FROM step_runs").fetchall()
+        return [
+            StepRunRecord(group_name, step_id, step_name, _from_json(step_config), _from_json(run_info), started_at, duration, exit_status, bool(timed_out))
+            for group_name, step_id, step_name, step_config, run_info, started_at, duration, exit_status, timed_out in rows
+        ]
+
+    @property
+    def records(self) -> List[StepRunRecord]:
+        with self._lock:
+            return list(self._records.values())
+
+    def get_record(self, group_name: Optional[str], step_id: str) -> Optional[StepRunRecord]:
+        with self._lock:
+            return self._records.get((group_name or "", step_id))
+
+    def find_records(self, group_name: Optional[str], step_name: str) -> List[StepRunRecord]:
+        """All records of a step name in a group (a step class can have several ids, e.g. one per manifest)."""
+        return [record for record in self.records if record.group_name == (group_name or "") and record.step_name == step_name]
+
+    def save_record(self, record: StepRunRecord) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO step_runs (group_name, step_id, step_name, step_config, run_info, started_at, duration, exit_status, timed_out)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    record.group_name,
+                    record.step_id,
+                    record.step_name,
+                    json.dumps(record.step_config) if record.step_config is not None else None,
+                    json.dumps(record.run_info) if record.run_info is not None else None,
+                    record.started_at,
+                    record.duration,
+                    record.exit_status,
+                    record.timed_out,
+                ),
+            )
+            self._records[(record.group_name, record.step_id)] = record
+
+    def add_history(self, durations: List[StepDuration]) -> None:
+        """Append step durations to the run history, keeping the last :data:`HISTORY_MAX_RUNS` of each series."""
+        series = {(duration.group_name, duration.step_name, duration.config_hash, duration.machine) for duration in durations}
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT INTO step_history (group_name, step_name, config_hash, machine, started_at, duration) VALUES (?, ?, ?, ?, ?, ?)",
+                [(d.group_name, d.step_name, d.config_hash, d.machine, d.started_at, d.duration) for d in durations],
+            )
+            self._connection.executemany(
+                "DELETE FROM step_history WHERE rowid IN (SELECT rowid FROM step_history"
+                " WHERE group_name = ? AND step_name = ? AND config_hash = ? AND machine = ? ORDER BY started_at DESC LIMIT -1 OFFSET ?)",
+                [(*key, HISTORY_MAX_RUNS) for key in series],
+            )
+
+    def get_history(self) -> List[StepDuration]:
+        """All recorded step durations, oldest first."""
+        with self._lock:
+            rows = self._connection.execute("SELECT group_name, step_name, config_hash, machine, started_at, duration FROM step_history ORDER BY started_at").fetchall()
+        return [StepDuration(*row) for row in rows]
+
+    def _load_file_hashes(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            rows = self._connection.execute("SELECT path, size, mtime_ns, inode, hash FROM file_hashes").fetchall()
+        return {path: {"size": size, "mtime_ns": mtime_ns, "inode": inode, "hash": file_hash} for path, size, mtime_ns, inode, file_hash in rows}
+
+    def _write_file_hashes(self, entries: Dict[str, Dict[str, Any]], changed: Set[str], removed: Set[str]) -> None:
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO file_hashes VALUES (?, ?, ?, ?, ?)",
+                [(path, entries[path]["size"], entries[path]["mtime_ns"], entries[path]["inode"], entries[path]["hash"]) for path in changed],
+            )
+            self._connection.executemany("DELETE FROM file_hashes WHERE path = ?", [(path,) for path in removed])
+
+    def close(self) -> None:
+        self.file_hashes.save()
+        with self._lock:
+            self._connection.close()
+
+    def __enter__(self) -> "RunStateStore":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+
+class _StoredFileHashCache(FileHashCache):
+    """File hash cache kept in the run state database; only changed and removed entries are written back."""
+
+    def __init__(self, store: RunStateStore) -> None:
+        super().__init__(store.db_file)
+        self.store = store
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        return self.store._load_file_hashes()
+
+    def _write(self, entries: Dict[str, Dict[str, Any]], changed: Set[str], removed: Set[str]) -> None:
+        self.store._write_file_hashes(entries, changed, removed)
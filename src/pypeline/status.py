@@ -0,0 +1,91 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from py_app_dev.core.runnable import RunInfoStatus
+
+from .domain.pipeline import PipelineConfig, PipelineConfigIterator, PipelineStepConfig
+from .hashing import FileHashCache
+from .run_state import RunStateStore, StepRunRecord, check_run_info
+from .step_executor import StepExecutor
+
+
+@dataclass
+class StepStatus:
+    """Whether a step would run, computed from its recorded run state."""
+
+    group_name: Optional[str]
+    step_name: str
+    up_to_date: bool
+    #: Why the step would run (or that it is up to date)
+    reason: str
+    #: What changed: the path of the changed input or output, or ``config``
+    changed: Optional[str] = None
+    #: Duration of the last execution in seconds
+    last_duration: Optional[float] = None
+
+
+class PipelineStatus:
+    """
+    Compute which steps of a pipeline are dirty without importing or instantiating any step.
+
+    Only the pipeline configuration and the run state database are read. The files recorded by the last execution of
+    each step are hashed in parallel (validated by ``stat()`` through the file hash cache). Inputs a step would newly
+    declare are not known without instantiating it, so only the recorded inputs are checked; ``run`` is authoritative.
+    """
+
+    def __init__(self, pipeline: PipelineConfig, state_store: RunStateStore, jobs: Optional[int] = None) -> None:
+        self.pipeline = pipeline
+        self.state_store = state_store
+        self.jobs = jobs or os.cpu_count() or 1
+
+    def get_steps_status(self) -> List[StepStatus]:
+        steps_config = [
+            (step_config.resolve_output_group(group_name), step_config) for group_name, group_steps in PipelineConfigIterator(self.pipeline) for step_config in group_steps
+        ]
+        with ThreadPoolExecutor(max_workers=self.jobs, thread_name_prefix="pypeline-status") as pool:
+            return list(pool.map(lambda item: self._get_step_status(*item), steps_config))
+
+    def _get_step_status(self, group_name: Optional[str], step_config: PipelineStepConfig) -> StepStatus:
+        step_name = step_config.class_name or step_config.step or ""
+        records = self.state_store.find_records(group_name, step_name)
+        if not records:
+            return StepStatus(group_name, step_name, False, RunInfoStatus.NO_INFO.message)
+        # A step can have several records (e.g. one per manifest file); the latest one is the current one
+        record = max(records, key=lambda record: record.started_at or 0)
+        status = StepStatus(group_name, step_name, False, "", last_duration=record.duration)
+        if record.run_info is None:
+            if record.timed_out:
+                status.reason = "The last execution timed out."
+            elif step_config.run or record.exit_status is not None:
+                status.reason = "Always runs: the step has no dependency management."
+            else:
+                status.reason = "The last execution failed."
+            return status
+        if record.step_config != step_config.config:
+            status.reason, status.changed = RunInfoStatus.CONFIG_CHANGED.message, "config"
+            return status
+        run_info_status, status.changed = check_run_info(record.run_info, record.run_info.get("config"), self._recorded_inputs(record), self._file_hash_function(record))
+        status.up_to_date = not run_info_status.should_run
+        status.reason = run_info_status.message
+        return status
+
+    @staticmethod
+    def _recorded_inputs(record: StepRunRecord) -> List[Path]:
+        return [Path(path) for path in (record.run_info or {}).get("inputs", {})]
+
+    def _file_hash_function(self, record: StepRunRecord) -> Callable[[Path], Optional[str]]:
+        hash_cache: FileHashCache = self.state_store.file_hashes
+        fingerprints = (record.run_info or {}).get("fingerprints", {})
+
+        def get_file_hash(path: Path) -> Optional[str]:
+            file_hash = hash_cache.get_hash(path)
+            if file_hash is None and path.is_dir():
+                if str(path) in fingerprints:
+                    return f"{StepExecutor.TREE_HASH_PREFIX}{hash_cache.get_tree_hash(path, fingerprints[str(path)])}"
+                return "IS_DIR"
+            return file_hash
+
+        return get_file_hash
@@ -0,0 +1,320 @@
+import contextvars
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from py_app_dev.core.logging import logger
+from py_app_dev.core.runnable import Executor, RunInfoStatus, Runnable
+
+from .artifact_cache import ArtifactCache
+from .domain.pipeline import PipelineStep
+from .hashing import FileHashCache
+from .metrics import ChildrenUsage, StepMetrics
+from .process_executor import StepCancelledError, StepProcessGroup, StepTimeoutError, current_process_group
+from .run_state import RunStateStore, StepRunRecord, check_run_info
+from .tracing import span
+
+
+class StepExecutor(Executor):
+    """
+    Dependency-checking executor for pipeline steps.
+
+    Same skip decisions as the py_app_dev executor, but the input and output hashes come from a persistent
+    :class:`FileHashCache`, so a no-op run only needs a ``stat()`` per file instead of reading every file.
+
+    With a :class:`RunStateStore` the run info, the duration and the exit status of the step are recorded in the
+    project run state database. Without one, the run info is written to a ``.deps.json`` file and the hashes to a
+    ``file_hashes.json`` file in the cache directory, as before.
+
+    Directories are recorded as ``IS_DIR`` (existence only) unless the step opts them into a tree
+    fingerprint with :meth:`PipelineStep.get_output_fingerprint`; those are recorded as ``TREE:<hash>``.
+
+    With an :class:`ArtifactCache`, a step that must run is first looked up in the cache and restored on a hit.
+
+    With a ``timeout_sec``, the step runs on a watchdog thread. Its subprocesses get the remaining time of the step
+    as timeout; when the time is up, their process trees are killed and a :class:`StepTimeoutError` is raised, even
+    if the step hangs in Python code (the step thread is then abandoned). The timeout is recorded in the run state.
+
+    :meth:`cancel` stops a running step the same way, from another thread: its subprocess trees are killed and it fails
+    with a :class:`StepCancelledError`. A step cancelled before it starts running does not run.
+
+    The timings and resource usage of the last executed step are available in :attr:`metrics`.
+    """
+
+    HASH_CACHE_FILE = "file_hashes.json"
+    TREE_HASH_PREFIX = "TREE:"
+    #: Seconds a timed-out step is given to return after its subprocesses were killed
+    TIMEOUT_GRACE_SEC = 5.0
+
+    def __init__(
+        self,
+        cache_dir: Path,
+        force_run: bool = False,
+        dry_run: bool = False,
+        artifact_cache: Optional[ArtifactCache] = None,
+        state_store: Optional[RunStateStore] = None,
+        timeout_sec: Optional[float] = None,
+    ) -> None:
+        super().__init__(cache_dir, force_run, dry_run)
+        self.hash_cache: FileHashCache = state_store.file_hashes if state_store else FileHashCache(cache_dir / self.HASH_CACHE_FILE)
+        self.artifact_cache = artifact_cache
+        self.state_store = state_store
+        self.timeout_sec = timeout_sec
+        self.runnable: Optional[Runnable] = None
+        self.metrics: Optional[StepMetrics] = None
+        self._started_at: Optional[float] = None
+        self._duration: Optional[float] = None
+        self._exit_status: Optional[int] = None
+        self._timed_out = False
+        self._process_group: Optional[StepProcessGroup] = None
+        self._cancel_reason: Optional[str] = None
+        self._cancel_lock = threading.Lock()
+
+    def cancel(self, reason: str) -> None:
+        """Stop the step, e.g. because another step failed. Can be called from any thread."""
+        with self._cancel_lock:
+            self._cancel_reason = reason
+            process_group = self._process_group
+        if process_group:
+            process_group.cancel(reason)
+
+    def get_file_hash(self, path: Path) -> Optional[str]:  # type: ignore[override]
+        start = time.perf_counter()
+        try:
+            file_hash = self.hash_cache.get_hash(path)
+            if file_hash is None and path.is_dir():
+                fingerprint = self.runnable.get_output_fingerprint(path) if isinstance(self.runnable, PipelineStep) else None
+                if fingerprint:
+                    return f"{self.TREE_HASH_PREFIX}{self.hash_cache.get_tree_hash(path, fingerprint.ignore)}"
+                return "IS_DIR"
+            return file_hash
+        finally:
+            if self.metrics:
+                self.metrics.hash_time += time.perf_counter() - start
+
+    def _get_hashes(self, paths: List[Path]) -> Dict[str, str]:
+        return {str(path): self.get_file_hash(path) or "NOT_FOUND" for path in paths}
+
+    def _get_fingerprints(self, runnable: Runnable, output_hashes: Dict[str, str]) -> Dict[str, List[str]]:
+        fingerprints = {}
+        if isinstance(runnable, PipelineStep):
+            for path_str, output_hash in output_hashes.items():
+                fingerprint = runnable.get_output_fingerprint(Path(path_str)) if output_hash.startswith(self.TREE_HASH_PREFIX) else None
+                if fingerprint:
+                    fingerprints[path_str] = fingerprint.ignore
+        return fingerprints
+
+    def _get_record(self, runnable: Runnable) -> Optional[StepRunRecord]:
+        if self.state_store is None or not isinstance(runnable, PipelineStep):
+            return None
+        return self.state_store.get_record(runnable.group_name, runnable.get_id())
+
+    def _save_record(self, runnable: Runnable, run_info: Optional[Dict[str, Any]]) -> None:
+        if self.state_store is None or not isinstance(runnable, PipelineStep):
+            return
+        self.state_store.save_record(
+            StepRunRecord(
+                group_name=runnable.group_name or "",
+                step_id=runnable.get_id(),
+                step_name=runnable.__class__.__name__,
+                step_config=runnable.config,
+                run_info=run_info,
+                started_at=self._started_at,
+                duration=self._duration,
+                exit_status=self._exit_status,
+                timed_out=self._timed_out,
+            )
+        )
+
+    def load_run_info(self, runnable: Runnable) -> Optional[Dict[str, Any]]:
+        """Run info recorded by the last execution, from the run state store or the step ``.deps.json`` file."""
+        record = self._get_record(runnable)
+        if record:
+            return record.run_info
+        # Without a record yet (first run with the store), the run info of older versions is reused
+        run_info_path = self.get_runnable_run_info_file(runnable)
+        if run_info_path.exists():
+            return json.loads(run_info_path.read_text())
+        return None
+
+    def store_run_info(self, runnable: Runnable, outputs: Optional[List[Path]] = None) -> None:
+        """Record the input and output hashes. ``outputs`` replaces the runnable outputs, e.g. for outputs restored from the artifact cache."""
+        file_info: Dict[str, Any] = {
+            "inputs": self._get_hashes(runnable.get_inputs()),
+            "outputs": self._get_hashes(runnable.get_outputs() if outputs is None else outputs),
+        }
+        config = runnable.get_config()
+        if config is not None:
+            file_info["config"] = config
+        fingerprints = self._get_fingerprints(runnable, file_info["outputs"])
+        if fingerprints:
+            # Lets the run state be checked without the step instance (see PipelineStatus)
+            file_info["fingerprints"] = fingerprints
+        if self.state_store is not None and isinstance(runnable, PipelineStep):
+            self._save_record(runnable, file_info)
+            return
+        run_info_path = self.get_runnable_run_info_file(runnable)
+        run_info_path.parent.mkdir(parents=True, exist_ok=True)
+        run_info_path.write_text(json.dumps(file_info, indent=4))
+
+    def previous_run_info_matches(self, runnable: Runnable) -> RunInfoStatus:
+        if self.force_run:
+            return RunInfoStatus.FORCED_RUN
+        previous_info = self.load_run_info(runnable)
+        if previous_info is None:
+            return RunInfoStatus.NO_INFO
+        return check_run_info(previous_info, runnable.get_config(), runnable.get_inputs(), self.get_file_hash)[0]
+
+    def execute(self, runnable: Runnable) -> int:
+        self.runnable = runnable
+        self.metrics = StepMetrics(runnable.group_name if isinstance(runnable, PipelineStep) else None, runnable.get_name())
+        start = time.perf_counter()
+        try:
+            return self._execute(runnable)
+        except StepCancelledError:
+            self.metrics.outcome = "cancelled"
+            raise
+        except BaseException:
+            self.metrics.outcome = "failed"
+            raise
+        finally:
+            # A cache of its own only serves this step; the one of the run state store is pruned at the end of the run
+            self.hash_cache.save(prune=self.state_store is None)
+            self.metrics.wall_time = time.perf_counter() - start
+
+    def _execute(self, runnable: Runnable) -> int:
+        if not runnable.needs_dependency_management:
+            logger.info(f"Runnable '{runnable.get_name()}' does not need dependency management. Executing directly.")
+            if self.dry_run:
+                self._set_outcome("dry-run")
+                return 0
+            exit_code = self._run(runnable)
+            self._save_record(runnable, None)
+            return exit_code
+
+        check_start = time.perf_counter()
+        with span("check dependencies", "dependencies") as span_args:
+            run_info_status = self.previous_run_info_matches(runnable)
+            span_args["status"] = run_info_status.name
+        if self.metrics:
+            self.metrics.check_time = time.perf_counter() - check_start
+        if not run_info_status.should_run:
+            logger.info(f"Runnable '{runnable.get_name()}' execution skipped. {run_info_status.message}")
+            return 0
+        if self.dry_run:
+            logger.info(f"Runnable '{runnable.get_name()}' must run. {run_info_status.message}")
+            self._set_outcome("dry-run")
+            return 0
+
+        cache_key = None
+        if self.artifact_cache and isinstance(runnable, PipelineStep):
+            cache_key = self.artifact_cache.create_key(runnable, self._get_hashes(runnable.get_inputs()))
+            self._started_at = time.time()
+            with span("restore from artifact cache", "artifact_cache") as span_args:
+                restored_outputs = None if self.force_run else self.artifact_cache.restore(runnable, cache_key)
+                span_args["hit"] = restored_outputs is not None
+            if restored_outputs is not None:
+                logger.info(f"Runnable '{runnable.get_name()}' restored from the artifact cache. {run_info_status.message}")
+                self._duration, self._exit_status = time.time() - self._started_at, 0
+                self._set_outcome("restored")
+                self.store_run_info(runnable, restored_outputs)
+                return 0
+
+        logger.info(f"Runnable '{runnable.get_name()}' must run. {run_info_status.message}")
+        exit_code = self._run(runnable)
+        with span("store run info", "dependencies"):
+            self.store_run_info(runnable)
+        if self.artifact_cache and cache_key and exit_code == 0 and isinstance(runnable, PipelineStep):
+            with span("store in artifact cache", "artifact_cache"):
+                self.artifact_cache.store(runnable, cache_key)
+        return exit_code
+
+    def _run(self, runnable: Runnable) -> int:
+        if isinstance(runnable, PipelineStep):
+            # The commands of the step append to its log file: keep only the output of this run
+            runnable.log_file.unlink(missing_ok=True)
+        process_group = StepProcessGroup(runnable.get_name(), self.timeout_sec)
+        with self._cancel_lock:
+            self._process_group = process_group
+            if self._cancel_reason is not None:
+                process_group.cancel(self._cancel_reason)
+        if process_group.cancel_reason is not None:
+            raise process_group.expired_error()
+        self._started_at = time.time()
+        self._set_outcome("executed")
+        children_usage = ChildrenUsage.snapshot()
+        start = time.perf_counter()
+        try:
+            if self.timeout_sec:
+                self._exit_status = self._run_with_timeout(runnable, process_group)
+            else:
+                self._exit_status = self._run_in_process_group(runnable, process_group)
+        except BaseException as e:
+            # No run info: a failed step must run again, even if its inputs did not change
+            self._duration, self._exit_status = time.perf_counter() - start, None
+            self._timed_out = isinstance(e, StepTimeoutError)
+            self._save_record(runnable, None)
+            raise
+        finally:
+            if self.metrics:
+                self.metrics.run_time = time.perf_counter() - start
+                self.metrics.record_children_usage(children_usage, ChildrenUsage.snapshot())
+        self._duration = time.perf_counter() - start
+        return self._exit_status
+
+    def _run_and_measure(self, runnable: Runnable) -> int:
+        # Runs on the thread executing the step, so its CPU time is the one of the step Python code
+        cpu_start = time.thread_time()
+        try:
+            return runnable.run()
+        finally:
+            if self.metrics:
+                self.metrics.cpu_time = time.thread_time() - cpu_start
+
+    def _set_outcome(self, outcome: str) -> None:
+        if self.metrics:
+            self.metrics.outcome = outcome
+
+    @staticmethod
+    def _create_context(process_group: StepProcessGroup) -> contextvars.Context:
+        # The step sees the process group; copies of its context (e.g. for parallel commands) inherit it
+        context = contextvars.copy_context()
+        context.run(current_process_group.set, process_group)
+        return context
+
+    def _run_in_process_group(self, runnable: Runnable, process_group: StepProcessGroup) -> int:
+        exit_code = self._create_context(process_group).run(self._run_and_measure, runnable)
+        if process_group.expired:
+            # Cancelled, even if the step ignored the failure of its killed subprocesses
+            raise process_group.expired_error()
+        return exit_code
+
+    def _run_with_timeout(self, runnable: Runnable, process_group: StepProcessGroup) -> int:
+        timeout_sec = process_group.timeout_sec
+        context = self._create_context(process_group)
+        result: Dict[str, Any] = {}
+
+        def run_step() -> None:
+            try:
+                result["exit_code"] = context.run(self._run_and_measure, runnable)
+            except BaseException as e:
+                result["error"] = e
+
+        step_thread = threading.Thread(target=run_step, name=f"pypeline-{runnable.get_name()}", daemon=True)
+        step_thread.start()
+        try:
+            step_thread.join(timeout_sec)
+        finally:
+            if step_thread.is_alive():
+                # Timed out (or interrupted): kill the subprocesses so that the step can return
+                process_group.expire()
+        if step_thread.is_alive() or process_group.expired:
+            step_thread.join(self.TIMEOUT_GRACE_SEC)
+            if step_thread.is_alive():
+                logger.warning(f"Step '{runnable.get_name()}' did not return after its timeout. It is abandoned.")
+            raise process_group.expired_error()
+        if "error" in result:
+            raise result["error"]
+        return result["exit_code"]
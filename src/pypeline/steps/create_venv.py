@@ -350,6 +350,7 @@ class CreateVEnv(PipelineStep[ExecutionContext]):
             self.execution_context.create_process_executor(
                 [self.python_executable, target_script.as_posix()],
                 cwd=self.project_root_dir,
+                log_file=self.log_file,
             ).execute()
         else:
             # Managed Mode: Internal logic (Config generation + Args + File creation)
@@ -414,6 +415,7 @@ class CreateVEnv(PipelineStep[ExecutionContext]):
             self.execution_context.create_process_executor(
                 [self.python_executable, target_script.as_posix(), *bootstrap_args],
                 cwd=self.project_root_dir,
+                log_file=self.log_file,
             ).execute()
 
         return 0
@@ -1,6 +1,6 @@
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Any, Generic, TypeVar
+from typing import Any, ClassVar, Generic, TypeVar
 
 from poks.domain import PoksConfig as _PoksConfig
 from poks.poks import Poks
@@ -8,9 +8,9 @@ from py_app_dev.core.config import BaseConfigJSONMixin, ConfigFile, merge_named_
 from py_app_dev.core.exceptions import UserNotificationException
 from py_app_dev.core.logging import logger
 
+from .. import package_version_file
 from ..domain.execution_context import ExecutionContext
-from ..domain.pipeline import PipelineStep
-from ..main import package_version_file
+from ..domain.pipeline import PipelineStep, TreeFingerprint
 
 
 @dataclass
@@ -39,6 +39,9 @@ TContext = TypeVar("TContext", bound=ExecutionContext)
 
 
 class PoksInstall(PipelineStep[TContext], Generic[TContext]):
+    #: Entries left out of the install directory fingerprints. Override to customize.
+    OUTPUT_FINGERPRINT_IGNORE: ClassVar[list[str]] = ["__pycache__", "*.pyc"]
+
     def __init__(self, execution_context: TContext, group_name: str, config: dict[str, Any] | None = None) -> None:
         super().__init__(execution_context, group_name, config)
         self.logger = logger.bind()
@@ -157,6 +160,16 @@ class PoksInstall(PipelineStep[TContext], Generic[TContext]):
             outputs.extend(self.execution_info.install_dirs)
         return outputs
 
+    def get_cache_outputs(self) -> list[Path] | None:
+        if not self.execution_info.install_dirs:
+            return None
+        return [self._output_config_file, self._execution_info_file, self._resolve_root_dir()]
+
+    def get_output_fingerprint(self, path: Path) -> TreeFingerprint | None:
+        if path.is_relative_to(self._resolve_root_dir()):
+            return TreeFingerprint(ignore=self.OUTPUT_FINGERPRINT_IGNORE)
+        return None
+
     def update_execution_context(self) -> None:
         if self._execution_info_file.exists():
             execution_info = PoksInstallExecutionInfo.from_json_file(self._execution_info_file)
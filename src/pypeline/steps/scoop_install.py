@@ -1,16 +1,16 @@
 import platform
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Any, Generic, TypeVar
+from typing import Any, ClassVar, Generic, TypeVar
 
 from py_app_dev.core.config import BaseConfigJSONMixin, ConfigFile, merge_named_elements
 from py_app_dev.core.exceptions import UserNotificationException
 from py_app_dev.core.logging import logger
 from py_app_dev.core.scoop_wrapper import ScoopFileElement, ScoopWrapper
 
+from .. import package_version_file
 from ..domain.execution_context import ExecutionContext
-from ..domain.pipeline import PipelineStep
-from ..main import package_version_file
+from ..domain.pipeline import PipelineStep, TreeFingerprint
 
 
 @dataclass
@@ -47,6 +47,9 @@ TContext = TypeVar("TContext", bound=ExecutionContext)
 
 
 class ScoopInstall(PipelineStep[TContext], Generic[TContext]):
+    #: Entries left out of the app directory fingerprints. Override to customize.
+    OUTPUT_FINGERPRINT_IGNORE: ClassVar[list[str]] = ["__pycache__", "*.pyc"]
+
     def __init__(self, execution_context: TContext, group_name: str, config: dict[str, Any] | None = None) -> None:
         super().__init__(execution_context, group_name, config)
         self.logger = logger.bind()
@@ -151,6 +154,12 @@ class ScoopInstall(PipelineStep[TContext], Generic[TContext]):
         outputs.extend(self.execution_info.dependency_dirs)
         return outputs
 
+    def get_output_fingerprint(self, path: Path) -> TreeFingerprint | None:
+        # Every directory output is an installed app (or one of its PATH directories)
+        if not path.is_relative_to(self.output_dir):
+            return TreeFingerprint(ignore=self.OUTPUT_FINGERPRINT_IGNORE)
+        return None
+
     def update_execution_context(self) -> None:
         if self._execution_info_file.exists():
             execution_info = ScoopInstallExecutionInfo.from_json_file(self._execution_info_file)
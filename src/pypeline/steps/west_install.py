@@ -5,7 +5,7 @@ import re
 import traceback
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Any, Generic, TypeVar
+from typing import Any, ClassVar, Generic, TypeVar
 
 import yaml
 from mashumaro.config import BaseConfig
@@ -14,10 +14,12 @@ from py_app_dev.core.config import ConfigElement, ConfigFile, merge_named_elemen
 from py_app_dev.core.exceptions import UserNotificationException
 from py_app_dev.core.logging import logger
 
+from .. import package_version_file
+from ..checkout_store import CheckoutStore, is_commit
 from ..domain.execution_context import ExecutionContext
 from ..domain.external_project import ExternalProject
-from ..domain.pipeline import PipelineStep
-from ..main import package_version_file
+from ..domain.pipeline import PipelineStep, TreeFingerprint
+from ..process_executor import execute_concurrently
 
 
 @dataclass
@@ -67,6 +69,11 @@ class WestInstallResult(DataClassJSONMixin):
     #: One entry per installed project, persisted so consumers can be told where each
     #: dependency landed even when the step is skipped on a cache hit.
     installed_projects: list[ExternalProject] = field(default_factory=list)
+    #: Step-wide clone settings the projects were fetched with and the checkout store they were moved to;
+    #: changing them updates every project.
+    clone_depth: int | None = None
+    clone_filter: str | None = None
+    store_dir: str | None = None
 
     class Config(BaseConfig):
         """Mashumaro configuration for JSON serialization."""
@@ -110,12 +117,30 @@ class WestInstallConfig(DataClassJSONMixin):
     #: pinned at different revisions installs into separate directories instead of
     #: sharing (and re-checking-out) one path.
     revision_scoped_paths: bool = False
+    #: Number of 'west update' processes fetching the projects concurrently (default: one 'west update' for all projects)
+    fetch_jobs: int | None = None
+    #: Local cache of the project repositories, keyed by remote URL and shared by all workspaces pointing to it
+    #: (relative to the project root, '~' is expanded). West clones the projects from the cache and only fetches
+    #: what the cache is missing from the remotes.
+    cache_dir: str | None = None
+    #: Clone depth of the projects which do not set their own ``clone-depth`` (default: full history)
+    clone_depth: int | None = None
+    #: Partial clone filter passed to the fetches, e.g. ``blob:none`` (blobs are downloaded on demand) or ``tree:0``
+    clone_filter: str | None = None
+    #: Machine-wide store of the project checkouts (relative to the project root, '~' is expanded). The checkouts are
+    #: moved to the store, keyed by URL and commit, and the workspace links to them.
+    store_dir: str | None = None
+    #: Size in GB above which the least recently used checkouts no workspace links to are deleted from the store
+    store_max_size_gb: float | None = None
 
 
 TContext = TypeVar("TContext", bound=ExecutionContext)
 
 
 class WestInstall(PipelineStep[TContext], Generic[TContext]):
+    #: Entries left out of the dependency directory fingerprints. Override to customize.
+    OUTPUT_FINGERPRINT_IGNORE: ClassVar[list[str]] = [".git", "__pycache__", "*.pyc"]
+
     def __init__(self, execution_context: TContext, group_name: str, config: dict[str, Any] | None = None) -> None:
         super().__init__(execution_context, group_name, config)
         self.logger = logger.bind()
@@ -124,6 +149,7 @@ class WestInstall(PipelineStep[TContext], Generic[TContext]):
 
         self._west_workspace_dir = self._resolve_workspace_dir()
         self._manifest_files = self._collect_manifests()
+        self._checkout_store = CheckoutStore(self._resolve_user_path(self.user_config.store_dir)) if self.user_config.store_dir else None
 
     @property
     def _manifests(self) -> list[WestManifest]:
@@ -176,7 +202,7 @@ class WestInstall(PipelineStep[TContext], Generic[TContext]):
         return self.__class__.__name__
 
     def get_id(self) -> str:
-        """Return unique identifier for dependency tracking (.deps.json filename)."""
+        """Return unique identifier for dependency tracking (key of the step run state record)."""
         if self.user_config.manifest_file:
             manifest_hash = hashlib.md5(self.user_config.manifest_file.encode(), usedforsecurity=False).hexdigest()[:8]
             return f"{self.get_name()}_{manifest_hash}"
@@ -190,12 +216,22 @@ class WestInstall(PipelineStep[TContext], Generic[TContext]):
             config["manifest_file"] = self.user_config.manifest_file
         if self.user_config.revision_scoped_paths:
             config["revision_scoped_paths"] = str(self.user_config.revision_scoped_paths)
+        if self.user_config.clone_depth:
+            config["clone_depth"] = str(self.user_config.clone_depth)
+        if self.user_config.clone_filter:
+            config["clone_filter"] = self.user_config.clone_filter
+        if self.user_config.store_dir:
+            config["store_dir"] = self.user_config.store_dir
         return config if config else None
 
     def _merge_manifests(self) -> WestManifest:
         merged = self._do_merge_manifests(self._manifests)
         if self.user_config.revision_scoped_paths:
             self._append_revision_to_paths(merged)
+        if self.user_config.clone_depth:
+            for project in merged.projects:
+                if project.clone_depth is None:
+                    project.clone_depth = self.user_config.clone_depth
         return merged
 
     def _append_revision_to_paths(self, manifest: WestManifest) -> None:
@@ -241,14 +277,116 @@ class WestInstall(PipelineStep[TContext], Generic[TContext]):
                 self._west_workspace_dir.joinpath("do_not_care").as_posix(),
             ],
             cwd=self.project_root_dir,
+            log_file=self.log_file,
         ).execute()
 
-    def _run_west_update(self) -> None:
-        """Update/download dependencies."""
-        self.execution_context.create_process_executor(
-            ["west", "update"],
-            cwd=self._west_workspace_dir,
-        ).execute()
+    def _run_west_update(self, manifest: WestManifest, projects: list[WestDependency]) -> None:
+        """Update/download the given dependencies of the manifest."""
+        for project in projects:
+            # A link to a checkout store (e.g. the store was disabled): west must not update the shared checkout
+            if (self._west_workspace_dir / project.path).is_symlink():
+                (self._west_workspace_dir / project.path).unlink()
+        if not self.user_config.fetch_jobs:
+            update_all = len(projects) == len(manifest.projects)
+            self.execution_context.create_process_executor(
+                self._west_update_command(None if update_all else [project.name for project in projects]),
+                cwd=self._west_workspace_dir,
+                log_file=self.log_file,
+            ).execute()
+            return
+        # One 'west update' per project: west fetches the projects of one command one after the other
+        commands = [self._west_update_command([project.name]) for project in projects]
+        executors = [self.execution_context.create_process_executor(command, cwd=self._west_workspace_dir, log_file=self.log_file) for command in commands]
+        errors = execute_concurrently(executors, self.user_config.fetch_jobs)
+        failures = [f"  {' '.join(str(arg) for arg in command)}: {error}" for command, error in zip(commands, errors) if error is not None]
+        if failures:
+            raise UserNotificationException(f"{len(failures)} of {len(commands)} 'west update' commands failed:\n" + "\n".join(failures))
+
+    def _west_update_command(self, project_names: list[str] | None = None) -> list[str | Path]:
+        command: list[str | Path] = ["west", "update"]
+        if self.user_config.cache_dir:
+            command.extend(["--auto-cache", self._cache_dir.as_posix()])
+        if self.user_config.clone_filter:
+            # West fetches every project by URL: git records the URL as the promisor remote of the partial clone
+            command.append(f"--fetch-opt=--filter={self.user_config.clone_filter}")
+        command.extend(project_names or [])
+        return command
+
+    @property
+    def _cache_dir(self) -> Path:
+        return self._resolve_user_path(self.user_config.cache_dir or "")
+
+    def _resolve_user_path(self, path: str) -> Path:
+        return self.project_root_dir / Path(path).expanduser()
+
+    def _get_projects_to_update(self, manifest: WestManifest) -> list[WestDependency]:
+        """
+        Projects to update: the ones not installed by the previous run with the same URL, revision, path and clone settings.
+
+        A branch or a tag may point to another commit since, so the projects not pinned to a commit are always updated,
+        like a plain 'west update' does. All projects are updated on the first run and when the run is forced.
+        """
+        previous_result = self._load_previous_install_result()
+        if self.execution_context.force_run or previous_result is None or self._get_install_settings(previous_result) != self._get_install_settings(self.user_config):
+            return list(manifest.projects)
+        installed = {project.name: project for project in previous_result.installed_projects}
+        projects: list[WestDependency] = []
+        for project in manifest.projects:
+            previous = installed.get(project.name)
+            dep_dir = self._west_workspace_dir / project.path
+            if (
+                previous is None
+                or not is_commit(project.revision)
+                or previous.url != self._get_project_url(manifest, project)
+                or previous.revision != project.revision
+                or previous.path != dep_dir
+                or not dep_dir.exists()
+            ):
+                projects.append(project)
+        return projects
+
+    @staticmethod
+    def _get_install_settings(settings: WestInstallResult | WestInstallConfig) -> tuple[int | None, str | None, str | None]:
+        return settings.clone_depth, settings.clone_filter, settings.store_dir
+
+    def _load_previous_install_result(self) -> WestInstallResult | None:
+        if not self._install_result_file.exists() or not (self._west_workspace_dir / ".west").exists():
+            return None
+        try:
+            return WestInstallResult.from_json_file(self._install_result_file)
+        except UserNotificationException:
+            self.logger.warning(f"Could not read {self._install_result_file}, updating all projects.")
+            return None
+
+    def _link_stored_checkouts(self, store: CheckoutStore, manifest: WestManifest, projects: list[WestDependency]) -> list[WestDependency]:
+        """Link the projects whose commit is in the store. Return the projects west has to fetch."""
+        projects_to_fetch: list[WestDependency] = []
+        for project in projects:
+            dep_dir = self._west_workspace_dir / project.path
+            url = self._get_project_url(manifest, project)
+            commit = store.resolve_commit(url, project.revision) if url else None
+            entry_dir = store.find(url, commit) if url and commit else None
+            if entry_dir:
+                self.logger.info(f"{project.name}: using {commit} from the checkout store")
+                store.link(entry_dir, dep_dir)
+            else:
+                # West must never update a checkout of the store: it is shared with other workspaces
+                store.unlink(dep_dir)
+                projects_to_fetch.append(project)
+        return projects_to_fetch
+
+    def _move_checkouts_to_store(self, store: CheckoutStore, manifest: WestManifest, projects: list[WestDependency]) -> None:
+        for project in projects:
+            dep_dir = self._west_workspace_dir / project.path
+            url = self._get_project_url(manifest, project)
+            if url and dep_dir.is_dir() and not dep_dir.is_symlink():
+                store.link(store.add(url, store.get_commit(dep_dir), dep_dir), dep_dir)
+
+    @staticmethod
+    def _get_project_url(manifest: WestManifest, project: WestDependency) -> str | None:
+        """URL west clones the project from: ``<url-base>/<name>``."""
+        url_base = next((remote.url_base for remote in manifest.remotes if remote.name == project.remote), None)
+        return f"{url_base.rstrip('/')}/{project.name}" if url_base else None
 
     def run(self) -> int:
         self.logger.debug(f"Run {self.get_name()} step. Output dir: {self.output_dir}")
@@ -261,8 +399,19 @@ class WestInstall(PipelineStep[TContext], Generic[TContext]):
                 self.logger.info("No West dependencies to install.")
                 return 0
 
+            projects_to_update = self._get_projects_to_update(merged_manifest)
             self._run_west_init()
-            self._run_west_update()
+            if self._checkout_store:
+                projects_to_update = self._link_stored_checkouts(self._checkout_store, merged_manifest, projects_to_update)
+            if projects_to_update:
+                self.logger.info(f"Updating {len(projects_to_update)} of {len(merged_manifest.projects)} West dependencies")
+                self._run_west_update(merged_manifest, projects_to_update)
+            else:
+                self.logger.info("All West dependencies are up to date.")
+            if self._checkout_store:
+                self._move_checkouts_to_store(self._checkout_store, merged_manifest, projects_to_update)
+                if self.user_config.store_max_size_gb is not None:
+                    self._checkout_store.collect_garbage(int(self.user_config.store_max_size_gb * 1e9))
             self._record_install_result(merged_manifest)
             self.install_result.to_json_file(self._install_result_file)
 
@@ -283,11 +432,14 @@ class WestInstall(PipelineStep[TContext], Generic[TContext]):
             dep_dir = self._west_workspace_dir / project.path
             if dep_dir.exists():
                 dirs.append(dep_dir)
-                projects.append(ExternalProject(name=project.name, revision=project.revision, path=dep_dir))
+                projects.append(ExternalProject(name=project.name, revision=project.revision, path=dep_dir, url=self._get_project_url(manifest, project)))
                 self.logger.debug(f"Tracked dependency directory: {dep_dir}")
 
         self.install_result.installed_dirs = list(dict.fromkeys(dirs))
         self.install_result.installed_projects = projects
+        self.install_result.clone_depth = self.user_config.clone_depth
+        self.install_result.clone_filter = self.user_config.clone_filter
+        self.install_result.store_dir = self.user_config.store_dir
 
     def get_inputs(self) -> list[Path]:
         # The package version file re-runs the step on a pypeline upgrade: the west step's own
@@ -304,6 +456,21 @@ class WestInstall(PipelineStep[TContext], Generic[TContext]):
             outputs.append(self._west_workspace_dir)
         return outputs
 
+    def get_output_fingerprint(self, path: Path) -> TreeFingerprint | None:
+        # Only the dependency directories: the workspace itself defaults to the build dir, which holds the outputs of every step
+        if path != self._west_workspace_dir and path.is_relative_to(self._west_workspace_dir):
+            return TreeFingerprint(ignore=self.OUTPUT_FINGERPRINT_IGNORE)
+        return None
+
+    def get_cache_outputs(self) -> list[Path] | None:
+        # The dependencies are links to the checkout store of this machine
+        if not self.install_result.installed_projects or self._checkout_store:
+            return None
+        # The west workspace metadata is restored along with the dependencies, so a later 'west update' works on the restored workspace
+        outputs = [self._output_manifest_file, self._install_result_file, self._west_workspace_dir / ".west"]
+        outputs.extend(project.path for project in self.install_result.installed_projects)
+        return outputs
+
     def update_execution_context(self) -> None:
         if not self._install_result_file.exists():
             return
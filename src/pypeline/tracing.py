@@ -0,0 +1,95 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+
+class Tracer:
+    """
+    Collects the spans of a pipeline run and writes them in the Chrome Trace Event format.
+
+    The file can be opened in Perfetto (https://ui.perfetto.dev) or ``chrome://tracing``. Every thread gets its own
+    track, so steps running concurrently and the commands of a parallel ``run:`` block are shown side by side.
+    """
+
+    def __init__(self) -> None:
+        self._start = time.perf_counter()
+        self._pid = os.getpid()
+        self._events: List[Dict[str, Any]] = []
+        self._thread_ids: Dict[Union[int, str], int] = {}
+        self._lock = threading.Lock()
+
+    def _thread_id(self, track: Optional[str]) -> int:
+        # Called with the lock held. Small thread ids keep the tracks readable; the thread name labels the track.
+        key: Union[int, str] = track or threading.get_ident()
+        if key not in self._thread_ids:
+            self._thread_ids[key] = len(self._thread_ids) + 1
+            self._events.append({"ph": "M", "name": "thread_name", "pid": self._pid, "tid": self._thread_ids[key], "args": {"name": track or threading.current_thread().name}})
+        return self._thread_ids[key]
+
+    def add_span(self, name: str, category: str, start: float, end: float, args: Optional[Dict[str, Any]] = None, track: Optional[str] = None) -> None:
+        """
+        Add a span of the current thread; ``start`` and ``end`` are ``time.perf_counter()`` values.
+
+        Spans overlapping on one thread without nesting (e.g. asyncio tasks) are put on their own ``track``.
+        """
+        event: Dict[str, Any] = {
+            "ph": "X",
+            "name": name,
+            "cat": category,
+            "ts": (start - self._start) * 1e6,
+            "dur": (end - start) * 1e6,
+            "pid": self._pid,
+        }
+        if args:
+            event["args"] = args
+        with self._lock:
+            event["tid"] = self._thread_id(track)
+            self._events.append(event)
+
+    @contextmanager
+    def span(self, name: str, category: str, track: Optional[str] = None, **args: Any) -> Iterator[Dict[str, Any]]:
+        """Record the enclosed block as a span. The yielded dict can be filled with arguments known only at the end."""
+        start = time.perf_counter()
+        try:
+            yield args
+        finally:
+            self.add_span(name, category, start, time.perf_counter(), args, track)
+
+    @property
+    def events(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._events)
+
+    def write(self, trace_file: Path) -> None:
+        trace_file.parent.mkdir(parents=True, exist_ok=True)
+        trace_file.write_text(json.dumps({"traceEvents": self.events, "displayTimeUnit": "ms"}))
+
+
+#: Tracer of the current run (None: tracing disabled). Process-wide, so that the worker threads record spans too.
+_active_tracer: Optional[Tracer] = None
+
+
+@contextmanager
+def tracing(tracer: Tracer) -> Iterator[Tracer]:
+    """Record the spans of everything run in the enclosed block with ``tracer``."""
+    global _active_tracer
+    previous_tracer, _active_tracer = _active_tracer, tracer
+    try:
+        yield tracer
+    finally:
+        _active_tracer = previous_tracer
+
+
+@contextmanager
+def span(name: str, category: str = "pypeline", track: Optional[str] = None, **args: Any) -> Iterator[Dict[str, Any]]:
+    """Record the enclosed block as a span of the active tracer; does nothing if tracing is disabled."""
+    tracer = _active_tracer
+    if tracer is None:
+        yield args
+        return
+    with tracer.span(name, category, track, **args) as span_args:
+        yield span_args
@@ -0,0 +1,315 @@
+import ctypes
+import ctypes.util
+import fnmatch
+import os
+import select
+import struct
+import sys
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from py_app_dev.core.exceptions import UserNotificationException
+from py_app_dev.core.logging import logger
+
+from .pypeline import PipelineStepsExecutor
+
+
+@dataclass(frozen=True)
+class WatchedDirectory:
+    path: Path
+    #: Also watch the files in the subdirectories
+    recursive: bool
+
+
+class FileWatcher(ABC):
+    """Reports the files changed, created or deleted in a set of directories."""
+
+    @abstractmethod
+    def watch(self, directories: Iterable[WatchedDirectory]) -> None:
+        """Start watching the given directories too."""
+
+    @abstractmethod
+    def get_changes(self, timeout: Optional[float] = None) -> Set[Path]:
+        """Wait up to ``timeout`` seconds (None: forever) for changes and return the changed paths (empty on timeout)."""
+
+    @abstractmethod
+    def close(self) -> None:
+        """Stop watching."""
+
+
+class PollingFileWatcher(FileWatcher):
+    """Compares the modification time and size of the watched files every ``interval`` seconds."""
+
+    def __init__(self, interval: float = 0.5) -> None:
+        self.interval = interval
+        self.directories: Set[WatchedDirectory] = set()
+        self._snapshot: Dict[Path, Tuple[int, int]] = {}
+
+    def watch(self, directories: Iterable[WatchedDirectory]) -> None:
+        new_directories = set(directories) - self.directories
+        self.directories.update(new_directories)
+        for directory in new_directories:
+            self._scan(directory.path, directory.recursive, self._snapshot)
+
+    def get_changes(self, timeout: Optional[float] = None) -> Set[Path]:
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            snapshot = self._take_snapshot()
+            changes = {path for path in snapshot.keys() | self._snapshot.keys() if snapshot.get(path) != self._snapshot.get(path)}
+            self._snapshot = snapshot
+            if changes:
+                return changes
+            if deadline is not None and time.monotonic() >= deadline:
+                return set()
+            time.sleep(self.interval if deadline is None else max(0.0, min(self.interval, deadline - time.monotonic())))
+
+    def _take_snapshot(self) -> Dict[Path, Tuple[int, int]]:
+        snapshot: Dict[Path, Tuple[int, int]] = {}
+        for directory in self.directories:
+            self._scan(directory.path, directory.recursive, snapshot)
+        return snapshot
+
+    def _scan(self, directory: Path, recursive: bool, snapshot: Dict[Path, Tuple[int, int]]) -> None:
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            return
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive:
+                        self._scan(Path(entry.path), recursive, snapshot)
+                    continue
+                stat = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            snapshot[Path(entry.path)] = (stat.st_mtime_ns, stat.st_size)
+
+    def close(self) -> None:
+        self.directories.clear()
+
+
+class InotifyFileWatcher(FileWatcher):
+    """
+    Linux file watcher based on inotify: the kernel reports the changes, no directory is scanned.
+
+    A recursive directory gets a watch for each of its subdirectories, also for the ones created later. If the kernel
+    event queue overflows, all watched directories are reported as changed.
+    """
+
+    IN_MODIFY = 0x2
+    IN_ATTRIB = 0x4
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+    IN_ISDIR = 0x40000000
+    WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    EVENT_HEADER = struct.Struct("iIII")
+
+    def __init__(self) -> None:
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux")
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._watches: Dict[int, WatchedDirectory] = {}
+        self._watched_paths: Set[Path] = set()
+
+    def watch(self, directories: Iterable[WatchedDirectory]) -> None:
+        for directory in directories:
+            self._add_watch(directory.path, directory.recursive)
+
+    def _add_watch(self, path: Path, recursive: bool) -> None:
+        if path not in self._watched_paths:
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), self.WATCH_MASK)
+            if wd < 0:
+                error = ctypes.get_errno()
+                if error == 28:  # ENOSPC: the limit of inotify watches (fs.inotify.max_user_watches) is reached
+                    raise OSError(error, f"Too many directories to watch: {path}")
+                return
+            self._watches[wd] = WatchedDirectory(path, recursive)
+            self._watched_paths.add(path)
+        if recursive:
+            for subdirectory in self._list_subdirectories(path):
+                self._add_watch(subdirectory, recursive)
+
+    @staticmethod
+    def _list_subdirectories(path: Path) -> List[Path]:
+        try:
+            return [Path(entry.path) for entry in os.scandir(path) if entry.is_dir(follow_symlinks=False)]
+        except OSError:
+            return []
+
+    def get_changes(self, timeout: Optional[float] = None) -> Set[Path]:
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+        changes: Set[Path] = set()
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                return changes
+            self._parse_events(data, changes)
+
+    def _parse_events(self, data: bytes, changes: Set[Path]) -> None:
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, name_length = self.EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + self.EVENT_HEADER.size : offset + self.EVENT_HEADER.size + name_length].rstrip(b"\0")
+            offset += self.EVENT_HEADER.size + name_length
+            if mask & self.IN_Q_OVERFLOW:
+                changes.update(directory.path for directory in self._watches.values())
+                continue
+            directory = self._watches.get(wd)
+            if directory is None:
+                continue
+            if mask & self.IN_IGNORED:
+                # The directory was deleted
+                del self._watches[wd]
+                self._watched_paths.discard(directory.path)
+                continue
+            path = directory.path / os.fsdecode(name) if name else directory.path
+            changes.add(path)
+            if mask & self.IN_ISDIR and mask & (self.IN_CREATE | self.IN_MOVED_TO) and directory.recursive:
+                # Files can be created in the new directory before it is watched: report it as a whole
+                self._add_watch(path, recursive=True)
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+def create_file_watcher(polling: bool = False, poll_interval: float = 0.5) -> FileWatcher:
+    """Create an inotify watcher on Linux, falling back to polling on other systems or if inotify is not usable."""
+    if not polling:
+        try:
+            return InotifyFileWatcher()
+        except OSError as e:
+            logger.info(f"File changes are polled: {e}")
+    return PollingFileWatcher(poll_interval)
+
+
+class WatchSession:
+    """
+    Run the pipeline, then re-run the steps affected by every batch of file changes.
+
+    The inputs of all steps (``get_inputs()``) and the ``globs`` (relative to the project directory) are watched.
+    Changes are collected until no file changed for ``debounce_sec`` seconds. Then the steps with a changed input and
+    the steps needing them run again; a change to a file matching one of the globs runs all steps. If a run fails,
+    the steps it should have run are run again with the next changes.
+
+    Every run uses a new executor from ``create_executor`` (and thus a fresh execution context), but the step classes
+    and the pipeline configuration stay loaded. The changes to the outputs of the steps and to the build directory are
+    ignored, so that a run does not trigger the next one.
+    """
+
+    def __init__(
+        self,
+        create_executor: Callable[[Optional[Set[int]]], PipelineStepsExecutor[Any]],
+        project_dir: Path,
+        file_watcher: FileWatcher,
+        globs: Optional[List[str]] = None,
+        debounce_sec: float = 0.3,
+    ) -> None:
+        self.create_executor = create_executor
+        self.project_dir = project_dir.absolute()
+        self.file_watcher = file_watcher
+        self.globs = globs or []
+        self.debounce_sec = debounce_sec
+        self.inputs: Dict[int, List[Path]] = {}
+        self.ignored: List[Path] = []
+
+    def run(self, max_runs: Optional[int] = None) -> None:
+        """Run until interrupted, or ``max_runs`` times."""
+        steps_to_execute: Optional[Set[int]] = None
+        runs = 0
+        while True:
+            executor = self.create_executor(steps_to_execute)
+            succeeded = self._run_pipeline(executor)
+            self._update_watched_paths(executor)
+            runs += 1
+            if max_runs is not None and runs >= max_runs:
+                return
+            steps_to_execute = self._wait_for_affected_steps(executor, set() if succeeded else steps_to_execute)
+
+    def _wait_for_affected_steps(self, executor: PipelineStepsExecutor[Any], pending: Optional[Set[int]]) -> Optional[Set[int]]:
+        """Wait for changes affecting a step and return the steps to run (None: all), including the ``pending`` ones."""
+        while True:
+            logger.info("Waiting for changes...")
+            changed_steps = self._get_changed_steps(self._wait_for_changes())
+            if changed_steps is None or pending is None:
+                return None
+            if changed_steps or pending:
+                return executor.get_dependent_steps(changed_steps | pending)
+
+    @staticmethod
+    def _run_pipeline(executor: PipelineStepsExecutor[Any]) -> bool:
+        try:
+            executor.run()
+        except UserNotificationException as e:
+            logger.error(f"{e}")
+            return False
+        return True
+
+    def _update_watched_paths(self, executor: PipelineStepsExecutor[Any]) -> None:
+        self.ignored = [executor.artifacts_locator.build_dir.absolute()]
+        for index, step in executor.steps.items():
+            self.inputs[index] = [path.absolute() for path in step.get_inputs()]
+            self.ignored.extend(path.absolute() for path in step.get_outputs())
+        directories = [self._get_watched_directory(path) for step_inputs in self.inputs.values() for path in step_inputs]
+        directories.extend(self._get_glob_directory(glob) for glob in self.globs)
+        self.file_watcher.watch(directory for directory in directories if directory is not None)
+
+    @staticmethod
+    def _get_watched_directory(path: Path) -> Optional[WatchedDirectory]:
+        if path.is_dir():
+            return WatchedDirectory(path, recursive=True)
+        # A file, maybe not created yet: watch its directory for it to be changed, replaced or created
+        return WatchedDirectory(path.parent, recursive=False) if path.parent.is_dir() else None
+
+    def _get_glob_directory(self, glob: str) -> Optional[WatchedDirectory]:
+        parts = Path(glob).parts
+        fixed_parts = []
+        for part in parts:
+            if any(character in part for character in "*?["):
+                break
+            fixed_parts.append(part)
+        directory = self.project_dir.joinpath(*fixed_parts)
+        if len(fixed_parts) == len(parts):
+            # No wildcard: a file or a directory
+            return self._get_watched_directory(directory)
+        return WatchedDirectory(directory, recursive=len(parts) - len(fixed_parts) > 1) if directory.is_dir() else None
+
+    def _wait_for_changes(self) -> Set[Path]:
+        changes: Set[Path] = set()
+        while not changes:
+            changes = self._get_relevant_changes(None)
+        while more_changes := self._get_relevant_changes(self.debounce_sec):
+            changes |= more_changes
+        return changes
+
+    def _get_relevant_changes(self, timeout: Optional[float]) -> Set[Path]:
+        return {path for path in self.file_watcher.get_changes(timeout) if not any(path.is_relative_to(ignored) for ignored in self.ignored)}
+
+    def _get_changed_steps(self, changes: Set[Path]) -> Optional[Set[int]]:
+        """Return the steps with a changed input, or None if all steps shall run."""
+        for path in changes:
+            relative_path = path.relative_to(self.project_dir).as_posix() if path.is_relative_to(self.project_dir) else path.as_posix()
+            if any(fnmatch.fnmatch(relative_path, glob) or path.is_relative_to(self.project_dir / glob) for glob in self.globs):
+                logger.info(f"'{relative_path}' changed: all steps run")
+                return None
+        changed_steps = set()
+        for index, step_inputs in self.inputs.items():
+            # A directory reported as a whole (e.g. a new one) contains the inputs under it
+            if any(path.is_relative_to(step_input) or step_input.is_relative_to(path) for path in changes for step_input in step_inputs):
+                changed_steps.add(index)
+        logger.info(f"{len(changes)} file(s) changed: {len(changed_steps)} step(s) affected")
+        return changed_steps
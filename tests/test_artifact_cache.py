@@ -0,0 +1,210 @@
+import io
+import json
+import tarfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, ClassVar, Dict, Iterator, List, Optional
+
+import pytest
+from py_app_dev.core.exceptions import UserNotificationException
+
+from pypeline.artifact_cache import ArtifactCache, ArtifactCacheBackend, HttpBackend, LocalDirectoryBackend, create_artifact_cache_backend
+from pypeline.domain.execution_context import ExecutionContext
+from pypeline.domain.pipeline import PipelineStep
+from pypeline.step_executor import StepExecutor
+
+
+class InstallStep(PipelineStep[ExecutionContext]):
+    """Installs a 'tool' built from the input file into the project directory."""
+
+    runs = 0
+
+    def __init__(self, execution_context: ExecutionContext, group_name: Optional[str], config: Optional[Dict[str, Any]] = None) -> None:
+        super().__init__(execution_context, group_name, config)
+        self.input_file = self.project_root_dir / "tool.txt"
+        self.install_dir = self.project_root_dir / ".tools"
+
+    def get_name(self) -> str:
+        return self.__class__.__name__
+
+    def run(self) -> int:
+        InstallStep.runs += 1
+        (self.install_dir / "bin").mkdir(parents=True, exist_ok=True)
+        (self.install_dir / "bin" / "tool").write_text(f"built from {self.input_file.read_text()}")
+        return 0
+
+    def get_inputs(self) -> List[Path]:
+        return [self.input_file]
+
+    def get_outputs(self) -> List[Path]:
+        return [self.install_dir / "bin" / "tool"]
+
+    def get_cache_outputs(self) -> Optional[List[Path]]:
+        return [self.install_dir]
+
+    def update_execution_context(self) -> None:
+        pass
+
+
+@pytest.fixture
+def install_step(tmp_path: Path) -> Iterator[InstallStep]:
+    project_dir = tmp_path / "project"
+    project_dir.mkdir()
+    (project_dir / "tool.txt").write_text("v1")
+    InstallStep.runs = 0
+    yield InstallStep(ExecutionContext(project_dir), None)
+
+
+def _execute(step: InstallStep, artifact_cache: ArtifactCache) -> None:
+    StepExecutor(step.output_dir, artifact_cache=artifact_cache).execute(step)
+
+
+def _clean_workspace(step: InstallStep) -> None:
+    """Simulate a fresh CI agent: same project directory, no outputs and no run info."""
+    (step.install_dir / "bin" / "tool").unlink()
+    (step.install_dir / "stale.txt").write_text("left over")
+    for run_info in step.output_dir.glob("*.deps.json"):
+        run_info.unlink()
+
+
+def test_outputs_are_restored_instead_of_running_the_step(tmp_path: Path, install_step: InstallStep) -> None:
+    artifact_cache = ArtifactCache(LocalDirectoryBackend(tmp_path / "cache"))
+    _execute(install_step, artifact_cache)
+    assert InstallStep.runs == 1
+
+    _clean_workspace(install_step)
+    _execute(install_step, artifact_cache)
+    assert InstallStep.runs == 1
+    assert (install_step.install_dir / "bin" / "tool").read_text() == "built from v1"
+    assert not (install_step.install_dir / "stale.txt").exists()
+
+    # The restored outputs were recorded: the next run is a plain up-to-date skip
+    _execute(install_step, ArtifactCache(LocalDirectoryBackend(tmp_path / "empty")))
+    assert InstallStep.runs == 1
+
+
+def test_changed_input_misses_the_cache(tmp_path: Path, install_step: InstallStep) -> None:
+    artifact_cache = ArtifactCache(LocalDirectoryBackend(tmp_path / "cache"))
+    _execute(install_step, artifact_cache)
+
+    install_step.input_file.write_text("v2")
+    _execute(install_step, artifact_cache)
+    assert InstallStep.runs == 2
+    assert (install_step.install_dir / "bin" / "tool").read_text() == "built from v2"
+
+
+def test_read_only_cache_does_not_store(tmp_path: Path, install_step: InstallStep) -> None:
+    _execute(install_step, ArtifactCache(LocalDirectoryBackend(tmp_path / "cache"), read_only=True))
+    assert not (tmp_path / "cache").exists()
+
+
+class FailingBackend(ArtifactCacheBackend):
+    def fetch(self, key: str, target_file: Path) -> bool:
+        raise OSError("connection refused")
+
+    def publish(self, key: str, archive_file: Path) -> None:
+        raise OSError("connection refused")
+
+
+def test_cache_errors_do_not_fail_the_step(install_step: InstallStep) -> None:
+    _execute(install_step, ArtifactCache(FailingBackend()))
+    assert InstallStep.runs == 1
+
+
+class ArtifactStoreHandler(BaseHTTPRequestHandler):
+    """Minimal stand-in for a remote artifact store: keeps PUT bodies in memory and serves them on GET."""
+
+    store: ClassVar[Dict[str, bytes]] = {}
+
+    def do_GET(self) -> None:
+        body = self.store.get(self.path)
+        self.send_response(200 if body is not None else 404)
+        self.end_headers()
+        if body is not None:
+            self.wfile.write(body)
+
+    def do_PUT(self) -> None:
+        self.store[self.path] = self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(201)
+        self.end_headers()
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+@pytest.fixture
+def artifact_server() -> Iterator[str]:
+    ArtifactStoreHandler.store = {}
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ArtifactStoreHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/cache"
+    server.shutdown()
+    server.server_close()
+
+
+def test_http_backend_round_trip(artifact_server: str, install_step: InstallStep) -> None:
+    artifact_cache = ArtifactCache(create_artifact_cache_backend(artifact_server))
+    assert isinstance(artifact_cache.backend, HttpBackend)
+    _execute(install_step, artifact_cache)
+    assert len(ArtifactStoreHandler.store) == 1
+
+    _clean_workspace(install_step)
+    _execute(install_step, artifact_cache)
+    assert InstallStep.runs == 1
+    assert (install_step.install_dir / "bin" / "tool").read_text() == "built from v1"
+
+
+def _add_member(tar: tarfile.TarFile, name: str, data: bytes = b"", link: Optional[str] = None, member_type: bytes = tarfile.REGTYPE) -> None:
+    member = tarfile.TarInfo(name)
+    member.type = member_type
+    member.size = len(data) if member_type == tarfile.REGTYPE else 0
+    member.linkname = link or ""
+    tar.addfile(member, io.BytesIO(data) if member_type == tarfile.REGTYPE else None)
+
+
+@pytest.mark.parametrize(
+    "name, link, member_type",
+    [
+        ("/etc/evil", None, tarfile.REGTYPE),
+        (".tools/../evil", None, tarfile.REGTYPE),
+        ("tool.txt", None, tarfile.REGTYPE),
+        (".tools/passwd", "/etc/passwd", tarfile.SYMTYPE),
+        (".tools/up", "../../evil", tarfile.SYMTYPE),
+        (".tools/input", "tool.txt", tarfile.LNKTYPE),
+        (".tools/fifo", None, tarfile.FIFOTYPE),
+    ],
+)
+def test_tampered_archive_is_rejected(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, install_step: InstallStep, name: str, link: Optional[str], member_type: bytes) -> None:
+    # Python versions without the extraction filters
+    monkeypatch.delattr(tarfile, "tar_filter", raising=False)
+    archive_file = tmp_path / "outputs.tar.gz"
+    with tarfile.open(archive_file, "w:gz") as tar:
+        _add_member(tar, ".pypeline-outputs.json", json.dumps([".tools"]).encode())
+        _add_member(tar, ".tools/bin/tool", b"built")
+        _add_member(tar, name, b"evil", link, member_type)
+
+    with pytest.raises(ValueError, match="archive member"):
+        ArtifactCache._extract(archive_file, install_step.project_root_dir)
+    assert (install_step.project_root_dir / "tool.txt").read_text() == "v1"
+    assert not (install_step.project_root_dir / ".tools").exists()
+
+
+def test_links_inside_the_outputs_are_restored(tmp_path: Path, install_step: InstallStep) -> None:
+    archive_file = tmp_path / "outputs.tar.gz"
+    with tarfile.open(archive_file, "w:gz") as tar:
+        _add_member(tar, ".pypeline-outputs.json", json.dumps([".tools"]).encode())
+        _add_member(tar, ".tools/bin/tool", b"built")
+        _add_member(tar, ".tools/current", link="bin", member_type=tarfile.SYMTYPE)
+
+    assert ArtifactCache._extract(archive_file, install_step.project_root_dir) == [install_step.install_dir]
+    assert (install_step.install_dir / "current" / "tool").read_text() == "built"
+
+
+def test_create_backend_for_a_directory(tmp_path: Path) -> None:
+    backend = create_artifact_cache_backend(tmp_path.as_uri())
+    assert isinstance(backend, LocalDirectoryBackend)
+    assert backend.root_dir == tmp_path
+    with pytest.raises(UserNotificationException, match="Unsupported artifact cache location"):
+        create_artifact_cache_backend("s3://bucket/cache")
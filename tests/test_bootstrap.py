@@ -9,6 +9,7 @@ from pypeline.bootstrap.run import (
     BootstrapConfig,
     CreateBootstrapEnvironment,
     CreateVirtualEnvironment,
+    Executor,
     PyPiSource,
     PyPiSourceParser,
     instantiate_os_specific_venv,
@@ -328,3 +329,36 @@ def test_get_inputs_includes_python_executable(tmp_path: Path) -> None:
     inputs = env.get_inputs()
 
     assert Path(os.path.realpath(sys.executable)) in inputs
+
+
+def test_executor_reuses_cached_file_hashes(tmp_path: Path) -> None:
+    input_file = tmp_path / "uv.lock"
+    input_file.write_text("content")
+    old = input_file.stat().st_mtime - 60
+    os.utime(input_file, (old, old))
+
+    executor = Executor(tmp_path)
+    first_hash = executor.get_file_hash(input_file)
+    executor.hash_cache.save()
+    assert (tmp_path / Executor.HASH_CACHE_FILE).exists()
+
+    with patch("pypeline.bootstrap.run.open", side_effect=AssertionError("file shall not be read")):
+        assert Executor(tmp_path).get_file_hash(input_file) == first_hash
+    assert Executor(tmp_path).get_file_hash(tmp_path / "missing.lock") == ""
+
+
+def test_executor_drops_the_hashes_it_did_not_look_up(tmp_path: Path) -> None:
+    old_lock, new_lock = tmp_path / "poetry.lock", tmp_path / "uv.lock"
+    for lock_file in (old_lock, new_lock):
+        lock_file.write_text("content")
+        old = lock_file.stat().st_mtime - 60
+        os.utime(lock_file, (old, old))
+    executor = Executor(tmp_path)
+    executor.get_file_hash(old_lock)
+    executor.hash_cache.save()
+
+    # The project moved to another lock file
+    executor = Executor(tmp_path)
+    executor.get_file_hash(new_lock)
+    executor.hash_cache.save()
+    assert list(Executor(tmp_path).hash_cache.entries) == [str(new_lock)]
@@ -0,0 +1,121 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from pypeline.checkout_store import CheckoutStore
+from pypeline.process_executor import StepCancelledError, StepProcessGroup, current_process_group
+
+requires_symlinks = pytest.mark.skipif(sys.platform == "win32", reason="Symbolic links require the developer mode")
+
+
+def _git(*args: str, cwd: Path) -> str:
+    return subprocess.run(["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args], cwd=cwd, capture_output=True, text=True, check=True).stdout.strip()  # noqa: S603, S607
+
+
+@pytest.fixture
+def repository(tmp_path: Path) -> Path:
+    """Repository with an annotated tag v1.0 and a lightweight tag v1.1 on the second commit."""
+    repository = tmp_path / "remote" / "lib"
+    repository.mkdir(parents=True)
+    _git("init", "--initial-branch=main", cwd=repository)
+    (repository / "lib.c").write_text("int lib;")
+    _git("add", ".", cwd=repository)
+    _git("commit", "-m", "first", cwd=repository)
+    _git("tag", "-a", "v1.0", "-m", "v1.0", cwd=repository)
+    (repository / "lib.c").write_text("int lib();")
+    _git("commit", "-am", "second", cwd=repository)
+    _git("tag", "v1.1", cwd=repository)
+    return repository
+
+
+def _checkout(repository: Path, revision: str, target_dir: Path) -> Path:
+    _git("clone", "--quiet", repository.as_uri(), str(target_dir), cwd=repository)
+    _git("checkout", "--quiet", "--detach", revision, cwd=target_dir)
+    return target_dir
+
+
+def test_resolve_commit_of_tags_branches_and_commits(repository: Path) -> None:
+    url = repository.as_uri()
+    first, second = _git("rev-parse", "v1.0^{commit}", cwd=repository), _git("rev-parse", "main", cwd=repository)
+
+    # The commit of an annotated tag, not the tag object
+    assert CheckoutStore.resolve_commit(url, "v1.0") == first
+    assert CheckoutStore.resolve_commit(url, "v1.1") == second
+    assert CheckoutStore.resolve_commit(url, "main") == second
+    assert CheckoutStore.resolve_commit(url, first) == first
+    assert CheckoutStore.resolve_commit(url, "v9.9") is None
+    assert CheckoutStore.resolve_commit((repository.parent / "missing").as_uri(), "main") is None
+
+
+def test_git_commands_are_killed_with_the_step(repository: Path) -> None:
+    process_group = StepProcessGroup("WestInstall")
+    process_group.cancel("step 'Build' failed")
+    token = current_process_group.set(process_group)
+    try:
+        with pytest.raises(StepCancelledError):
+            CheckoutStore.resolve_commit(repository.as_uri(), "main")
+    finally:
+        current_process_group.reset(token)
+
+
+@requires_symlinks
+def test_checkouts_are_shared_by_the_workspaces(repository: Path, tmp_path: Path) -> None:
+    store = CheckoutStore(tmp_path / "store")
+    url = repository.as_uri()
+    checkout = _checkout(repository, "v1.0", tmp_path / "workspace1" / "lib")
+    commit = store.get_commit(checkout)
+
+    entry_dir = store.add(url, commit, checkout)
+    store.link(entry_dir, checkout)
+    # The second workspace finds the commit and only links it
+    assert store.find(url, commit) == entry_dir
+    store.link(entry_dir, tmp_path / "workspace2" / "lib")
+
+    assert (tmp_path / "workspace1" / "lib" / "lib.c").read_text() == "int lib;"
+    assert os.readlink(tmp_path / "workspace2" / "lib") == str(entry_dir)
+    assert store.get_ref_count(entry_dir) == 2
+
+    # A deleted workspace releases its reference
+    (tmp_path / "workspace1" / "lib").unlink()
+    store.unlink(tmp_path / "workspace2" / "lib")
+    assert store.get_ref_count(entry_dir) == 1  # the reference of workspace1 is within its grace period
+    os.utime(next((entry_dir.parent / f"{commit}.refs").iterdir()), (0, 0))
+    assert store.get_ref_count(entry_dir) == 0
+
+
+def test_adding_a_commit_twice_keeps_the_first_checkout(repository: Path, tmp_path: Path) -> None:
+    store = CheckoutStore(tmp_path / "store")
+    first = _checkout(repository, "v1.1", tmp_path / "workspace1" / "lib")
+    second = _checkout(repository, "main", tmp_path / "workspace2" / "lib")
+
+    entry_dir = store.add(repository.as_uri(), store.get_commit(first), first)
+    assert store.add(repository.as_uri(), store.get_commit(second), second) == entry_dir
+
+    assert not first.exists()
+    assert not second.exists()
+    assert store.get_entries() == [entry_dir]
+
+
+@requires_symlinks
+def test_collect_garbage_deletes_unreferenced_entries_least_recently_used_first(repository: Path, tmp_path: Path) -> None:
+    store = CheckoutStore(tmp_path / "store")
+    url = repository.as_uri()
+    entries = {}
+    for index, revision in enumerate(["v1.0", "v1.1"]):
+        checkout = _checkout(repository, revision, tmp_path / f"workspace{index}" / "lib")
+        entries[revision] = store.add(url, store.get_commit(checkout), checkout)
+    os.utime(entries["v1.0"].with_name(f"{entries['v1.0'].name}.json"), (1, 1))
+    store.link(entries["v1.1"], tmp_path / "workspace" / "lib")
+
+    # Referenced entries are kept, the least recently used unreferenced ones are deleted until the size fits
+    assert store.collect_garbage(max_size=0) == [entries["v1.0"]]
+    assert store.find(url, entries["v1.0"].name) is None
+    assert not entries["v1.0"].exists()
+    assert store.get_entries() == [entries["v1.1"]]
+
+    store.unlink(tmp_path / "workspace" / "lib")
+    assert store.collect_garbage(max_size=10**9) == []
+    assert store.collect_garbage(max_size=0) == [entries["v1.1"]]
@@ -0,0 +1,95 @@
+import os
+import textwrap
+import time
+from pathlib import Path
+from typing import Tuple
+from unittest.mock import patch
+
+import pytest
+
+from pypeline.domain.config import ProjectConfig
+from pypeline.domain.config_cache import ProjectConfigCache
+
+
+def _age(*paths: Path) -> None:
+    # Files modified just before the cache entry is written are always compared by content
+    old = time.time() - 60
+    for path in paths:
+        os.utime(path, (old, old))
+
+
+@pytest.fixture
+def config_file(tmp_path: Path) -> Path:
+    tmp_path.joinpath("lint.yaml").write_text(
+        textwrap.dedent(
+            """\
+            pipeline:
+              - step: Lint
+                run: ruff check .
+            """
+        )
+    )
+    config_file = tmp_path / "pypeline.yaml"
+    config_file.write_text(
+        textwrap.dedent(
+            """\
+            pipeline:
+              - step: Build
+                run: make
+              - include: lint.yaml
+            """
+        )
+    )
+    _age(config_file, tmp_path / "lint.yaml")
+    return config_file
+
+
+def _load(tmp_path: Path, config_file: Path) -> Tuple[ProjectConfig, bool]:
+    """Load the configuration through the cache and tell whether it had to be parsed."""
+    with patch("pypeline.domain.config_cache.ProjectConfig.from_file_with_sources", wraps=ProjectConfig.from_file_with_sources) as parse:
+        config = ProjectConfigCache(tmp_path / "build" / "config.pickle").load(config_file)
+    return config, parse.called
+
+
+def test_cached_config_is_reused(tmp_path: Path, config_file: Path) -> None:
+    config, parsed = _load(tmp_path, config_file)
+    assert parsed
+
+    cached_config, parsed = _load(tmp_path, config_file)
+    assert not parsed
+    assert cached_config == config
+    assert [step.step for step in cached_config.pipeline] == ["Build", "Lint"]
+    assert cached_config.pipeline[1].location and cached_config.pipeline[1].location.file == tmp_path / "lint.yaml"
+
+
+def test_changed_included_file_invalidates_the_cache(tmp_path: Path, config_file: Path) -> None:
+    _load(tmp_path, config_file)
+    tmp_path.joinpath("lint.yaml").write_text("pipeline:\n  - step: Format\n    run: ruff format .\n")
+
+    config, parsed = _load(tmp_path, config_file)
+    assert parsed
+    assert [step.step for step in config.pipeline] == ["Build", "Format"]
+
+
+def test_touched_file_with_same_content_keeps_the_cache(tmp_path: Path, config_file: Path) -> None:
+    _load(tmp_path, config_file)
+    os.utime(tmp_path / "lint.yaml")
+
+    assert not _load(tmp_path, config_file)[1]
+
+
+def test_other_config_file_is_not_served_from_the_cache(tmp_path: Path, config_file: Path) -> None:
+    _load(tmp_path, config_file)
+
+    config, parsed = _load(tmp_path, tmp_path / "lint.yaml")
+    assert parsed
+    assert [step.step for step in config.pipeline] == ["Lint"]
+
+
+def test_unreadable_cache_is_ignored(tmp_path: Path, config_file: Path) -> None:
+    _load(tmp_path, config_file)
+    tmp_path.joinpath("build", "config.pickle").write_bytes(b"not a pickle")
+
+    config, parsed = _load(tmp_path, config_file)
+    assert parsed
+    assert [step.step for step in config.pipeline] == ["Build", "Lint"]
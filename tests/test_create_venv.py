@@ -24,6 +24,7 @@ def test_create_venv_with_custom_script(execution_context: Mock, bootstrap_scrip
     execution_context.create_process_executor.assert_called_once_with(
         [sys.executable, bootstrap_path.as_posix()],
         cwd=execution_context.project_root_dir,
+        log_file=create_venv.log_file,
     )
 
 
@@ -78,6 +79,7 @@ def test_create_venv_with_internal_script(execution_context: Mock) -> None:
             Path(execution_context.project_root_dir).as_posix(),
         ],
         cwd=execution_context.project_root_dir,
+        log_file=create_venv.log_file,
     )
 
 
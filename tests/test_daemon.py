@@ -0,0 +1,229 @@
+import io
+import json
+import os
+import socket
+import sys
+import tempfile
+import textwrap
+import threading
+import time
+from pathlib import Path
+from typing import Iterator
+from unittest.mock import patch
+
+import pytest
+from py_app_dev.core.exceptions import UserNotificationException
+from py_app_dev.core.logging import logger
+
+from pypeline.client import PRIVATE_ENV_VARS, connect, get_client_env, get_socket_path, get_uid, is_daemon_running, read_messages, request_daemon, run_in_daemon, send_message
+from pypeline.daemon import PypelineDaemon, _client_process_state, add_project_dir, get_project_dir
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="The daemon uses Unix domain sockets")
+
+
+@pytest.fixture
+def socket_path() -> Iterator[Path]:
+    # Unix socket paths are limited to ~100 characters: the pytest temporary directories can be too long
+    with tempfile.TemporaryDirectory() as socket_dir:
+        yield Path(socket_dir) / "daemon.sock"
+
+
+@pytest.fixture
+def daemon(socket_path: Path) -> Iterator[PypelineDaemon]:
+    daemon = PypelineDaemon(socket_path)
+    daemon_thread = threading.Thread(target=daemon.serve_forever)
+    daemon_thread.start()
+    try:
+        while not is_daemon_running(socket_path):
+            assert daemon_thread.is_alive()
+        yield daemon
+    finally:
+        request_daemon({"command": "stop"}, socket_path)
+        daemon_thread.join(10)
+        # The daemon configures the global logger for every command
+        logger.remove()
+        logger.add(sys.__stderr__)
+
+
+def test_daemon_runs_commands_and_streams_their_output(daemon: PypelineDaemon, tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]) -> None:
+    tmp_path.joinpath("pypeline.yaml").write_text(
+        textwrap.dedent(
+            """\
+            pipeline:
+              - step: Greet
+                run: python -c "import os; print('hello', os.environ['GREETING'])"
+            """
+        )
+    )
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("GREETING", "from the client")
+
+    assert run_in_daemon(["run"], daemon.socket_path) == 0
+    assert "hello from the client" in capsys.readouterr().out
+    assert run_in_daemon(["run", "--step", "Missing", "--single"], daemon.socket_path) == 1
+    assert "Steps not found in pipeline configuration: Missing" in capsys.readouterr().out
+    assert run_in_daemon(["--version"], daemon.socket_path) == 0
+    assert capsys.readouterr().out.startswith("pypeline ")
+    assert run_in_daemon(["watch"], daemon.socket_path) == 1
+    assert "cannot run in the daemon" in capsys.readouterr().err
+
+    status = request_daemon({"command": "status"}, daemon.socket_path)
+    assert status and status["requests"] == 3
+
+
+@pytest.mark.parametrize(
+    "request_data, error",
+    [
+        (b"[]\n", "the request is not a JSON object"),
+        (json.dumps({"command": "build"}).encode() + b"\n", "unknown command 'build'"),
+        (json.dumps({"argv": ["run"], "env": {}}).encode() + b"\n", "'cwd' must be an existing directory"),
+        (json.dumps({"argv": "run", "cwd": ".", "env": {}}).encode() + b"\n", "'argv' must be a list of strings"),
+    ],
+)
+def test_invalid_requests_get_an_error_and_do_not_stop_the_daemon(daemon: PypelineDaemon, request_data: bytes, error: str) -> None:
+    connection = connect(daemon.socket_path)
+    assert connection
+    with connection:
+        connection.sendall(request_data)
+        messages = list(read_messages(connection))
+
+    assert messages == [{"stream": "stderr", "data": f"Invalid request to the pypeline daemon: {error}\n"}, {"exit_code": 1}]
+    assert is_daemon_running(daemon.socket_path)
+
+
+def test_silent_client_does_not_block_the_other_clients(daemon: PypelineDaemon) -> None:
+    daemon.request_timeout = 0.5
+    silent_connection = connect(daemon.socket_path)
+    assert silent_connection
+    with silent_connection:
+        start = time.monotonic()
+        assert is_daemon_running(daemon.socket_path)
+        assert time.monotonic() - start < 5
+
+
+def write_waiting_pipeline(project_dir: Path) -> None:
+    project_dir.joinpath("pypeline.yaml").write_text(
+        textwrap.dedent(
+            """\
+            pipeline:
+              - step: Wait
+                run: python -c "import time; print('waiting', flush=True); time.sleep(30)"
+              - step: Done
+                run: python -c "open('done.txt', 'w')"
+            """
+        )
+    )
+
+
+def start_waiting_command(socket_path: Path, project_dir: Path) -> socket.socket:
+    """Send a command to the daemon and return its connection once the first step runs."""
+    connection = connect(socket_path)
+    assert connection
+    send_message(connection, {"argv": ["run"], "cwd": str(project_dir), "env": {"PATH": os.environ["PATH"]}})
+    for message in read_messages(connection):
+        if "waiting" in message.get("data", ""):
+            break
+    return connection
+
+
+def wait_for_no_running_command(socket_path: Path, timeout: float = 20) -> None:
+    deadline = time.monotonic() + timeout
+    while (status := request_daemon({"command": "status"}, socket_path)) and status["running"]:
+        assert time.monotonic() < deadline
+        time.sleep(0.1)
+
+
+def test_disconnected_client_cancels_its_command(daemon: PypelineDaemon, tmp_path: Path) -> None:
+    write_waiting_pipeline(tmp_path)
+    # Interrupted once the first step runs
+    start_waiting_command(daemon.socket_path, tmp_path).close()
+
+    wait_for_no_running_command(daemon.socket_path)
+    assert not tmp_path.joinpath("done.txt").exists()
+
+
+def test_daemon_answers_status_and_stop_while_a_command_runs(daemon: PypelineDaemon, tmp_path: Path) -> None:
+    write_waiting_pipeline(tmp_path)
+    with start_waiting_command(daemon.socket_path, tmp_path) as connection:
+        start = time.monotonic()
+        status = request_daemon({"command": "status"}, daemon.socket_path)
+        assert status and status["requests"] == 1 and status["running"] == 1
+        assert request_daemon({"command": "stop"}, daemon.socket_path) == {"exit_code": 0}
+        assert time.monotonic() - start < 5
+
+        # The running command is cancelled and the daemon stops
+        assert list(read_messages(connection))[-1] == {"exit_code": 1}
+    while is_daemon_running(daemon.socket_path):
+        assert time.monotonic() - start < 20
+    assert not tmp_path.joinpath("done.txt").exists()
+
+
+def test_default_socket_is_in_a_directory_of_the_user(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.delenv("PYPELINE_DAEMON_SOCKET", raising=False)
+    monkeypatch.setenv("XDG_RUNTIME_DIR", "/run/user/1000")
+    assert get_socket_path() == Path("/run/user/1000/pypeline-daemon.sock")
+    monkeypatch.delenv("XDG_RUNTIME_DIR")
+    assert get_socket_path() == Path(tempfile.gettempdir()) / f"pypeline-{get_uid()}" / "daemon.sock"
+
+
+def test_daemon_creates_the_socket_directory_only_accessible_by_the_user(socket_path: Path) -> None:
+    socket_path = socket_path.parent / "private" / "daemon.sock"
+    private_daemon = PypelineDaemon(socket_path)
+    daemon_thread = threading.Thread(target=private_daemon.serve_forever)
+    daemon_thread.start()
+    try:
+        while not is_daemon_running(socket_path):
+            assert daemon_thread.is_alive()
+        assert socket_path.parent.stat().st_mode & 0o777 == 0o700
+        assert socket_path.stat().st_mode & 0o077 == 0
+    finally:
+        request_daemon({"command": "stop"}, socket_path)
+        daemon_thread.join(10)
+
+
+def test_daemon_does_not_replace_a_file_which_is_not_its_socket(socket_path: Path) -> None:
+    socket_path.write_text("not a socket")
+    with pytest.raises(UserNotificationException, match="not a daemon socket of the current user"):
+        PypelineDaemon(socket_path).serve_forever()
+    assert socket_path.read_text() == "not a socket"
+
+
+def test_client_ignores_a_socket_other_users_can_use(socket_path: Path) -> None:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(str(socket_path))
+        server.listen()
+        socket_path.chmod(0o666)
+        assert connect(socket_path) is None
+
+
+@pytest.mark.skipif(not hasattr(socket, "SO_PEERCRED"), reason="The peer credentials are not available")
+def test_client_and_daemon_reject_peers_of_other_users(daemon: PypelineDaemon) -> None:
+    with patch("pypeline.client.get_peer_uid", return_value=get_uid() + 1):
+        assert connect(daemon.socket_path) is None
+    with patch("pypeline.daemon.get_peer_uid", return_value=get_uid() + 1):
+        assert request_daemon({"command": "status"}, daemon.socket_path) is None
+    assert is_daemon_running(daemon.socket_path)
+
+
+def test_secrets_are_not_sent_to_the_daemon(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    daemon_value = "daemon value"
+    monkeypatch.setenv("PYPELINE_ARTIFACT_CACHE_TOKEN", daemon_value)
+    client_env = get_client_env()
+    assert not PRIVATE_ENV_VARS.intersection(client_env)
+
+    # The daemon uses its own token
+    with _client_process_state(tmp_path, client_env, io.StringIO(), io.StringIO()):
+        assert os.environ["PYPELINE_ARTIFACT_CACHE_TOKEN"] == daemon_value
+
+
+def test_client_without_daemon(socket_path: Path) -> None:
+    assert not is_daemon_running(socket_path)
+    assert run_in_daemon(["run"], socket_path) is None
+
+
+def test_project_dir_defaults_to_the_client_working_directory(tmp_path: Path) -> None:
+    assert add_project_dir(["run", "-j", "2"], tmp_path) == ["run", "-j", "2", "--project-dir", str(tmp_path)]
+    assert add_project_dir(["run", "--project-dir", "other"], tmp_path) == ["run", "--project-dir", "other"]
+    assert add_project_dir(["--version"], tmp_path) == ["--version"]
+    assert get_project_dir(["run", "--project-dir", "other"], tmp_path) == tmp_path / "other"
+    assert get_project_dir(["status"], tmp_path) == tmp_path
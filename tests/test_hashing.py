@@ -0,0 +1,216 @@
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from unittest.mock import patch
+
+import pytest
+
+from pypeline.domain.execution_context import ExecutionContext
+from pypeline.domain.pipeline import PipelineStep, TreeFingerprint
+from pypeline.hashing import FileHashCache, hash_file
+from pypeline.step_executor import StepExecutor
+
+
+def _make_old(path: Path) -> None:
+    """Move the modification time out of the racy window, as for a file that was not just written."""
+    old = time.time() - 60
+    os.utime(path, (old, old))
+
+
+@pytest.fixture
+def data_file(tmp_path: Path) -> Path:
+    data_file = tmp_path / "data.bin"
+    data_file.write_bytes(b"x" * 3_000_000)
+    _make_old(data_file)
+    return data_file
+
+
+def test_hash_file_streams_large_files(data_file: Path) -> None:
+    assert hash_file(data_file) == hashlib.sha256(data_file.read_bytes()).hexdigest()
+
+
+def test_unchanged_file_is_not_rehashed(tmp_path: Path, data_file: Path) -> None:
+    cache_file = tmp_path / "file_hashes.json"
+    first = FileHashCache(cache_file)
+    expected = first.get_hash(data_file)
+    first.save()
+
+    # A new cache instance (i.e. the next run) validates the file from stat() alone.
+    with patch("pypeline.hashing.hash_file") as hash_file_mock:
+        assert FileHashCache(cache_file).get_hash(data_file) == expected
+    hash_file_mock.assert_not_called()
+
+
+def test_modified_file_is_rehashed(tmp_path: Path, data_file: Path) -> None:
+    cache_file = tmp_path / "file_hashes.json"
+    cache = FileHashCache(cache_file)
+    previous = cache.get_hash(data_file)
+    cache.save()
+
+    data_file.write_bytes(b"y" * 10)
+    _make_old(data_file)
+    assert FileHashCache(cache_file).get_hash(data_file) == hashlib.sha256(b"y" * 10).hexdigest() != previous
+
+
+def test_save_with_prune_drops_the_entries_not_looked_up(tmp_path: Path, data_file: Path) -> None:
+    other_file = tmp_path / "other.bin"
+    other_file.write_bytes(b"o")
+    _make_old(other_file)
+    cache_file = tmp_path / "file_hashes.json"
+    first = FileHashCache(cache_file)
+    first.get_hash(data_file)
+    first.get_hash(other_file)
+    first.save()
+
+    # The next run only looks up one of the files
+    second = FileHashCache(cache_file)
+    second.get_hash(data_file)
+    second.save()
+    assert set(json.loads(cache_file.read_text())) == {str(data_file), str(other_file)}
+    second.save(prune=True)
+    assert set(json.loads(cache_file.read_text())) == {str(data_file)}
+
+
+def test_entry_of_a_deleted_file_is_dropped(tmp_path: Path, data_file: Path) -> None:
+    cache_file = tmp_path / "file_hashes.json"
+    cache = FileHashCache(cache_file)
+    cache.get_hash(data_file)
+    cache.save()
+
+    data_file.unlink()
+    cache = FileHashCache(cache_file)
+    assert cache.get_hash(data_file) is None
+    cache.save()
+    assert json.loads(cache_file.read_text()) == {}
+
+
+def test_recently_modified_file_is_not_cached(tmp_path: Path) -> None:
+    fresh_file = tmp_path / "fresh.txt"
+    fresh_file.write_text("fresh")
+    cache = FileHashCache(tmp_path / "file_hashes.json")
+    assert cache.get_hash(fresh_file)
+    assert str(fresh_file) not in cache.entries
+
+
+def test_missing_files_and_directories_have_no_hash(tmp_path: Path) -> None:
+    cache = FileHashCache(tmp_path / "file_hashes.json")
+    assert cache.get_hash(tmp_path / "missing.txt") is None
+    assert cache.get_hash(tmp_path) is None
+
+
+def test_corrupt_cache_file_is_ignored(tmp_path: Path, data_file: Path) -> None:
+    cache_file = tmp_path / "file_hashes.json"
+    cache_file.write_text("{not json")
+    assert FileHashCache(cache_file).get_hash(data_file) == hash_file(data_file)
+
+
+def test_step_executor_keeps_directory_marker(tmp_path: Path, data_file: Path) -> None:
+    executor = StepExecutor(tmp_path)
+    assert executor.get_file_hash(tmp_path) == "IS_DIR"
+    assert executor.get_file_hash(tmp_path / "missing.txt") is None
+    assert executor.get_file_hash(data_file) == hash_file(data_file)
+
+
+@pytest.fixture
+def tree(tmp_path: Path) -> Path:
+    tree = tmp_path / "tree"
+    (tree / "bin").mkdir(parents=True)
+    (tree / "bin" / "tool").write_text("tool v1")
+    (tree / "README").write_text("readme")
+    return tree
+
+
+def test_tree_hash_changes_with_any_entry(tmp_path: Path, tree: Path) -> None:
+    cache = FileHashCache(tmp_path / "file_hashes.json")
+    original = cache.get_tree_hash(tree)
+    assert original == cache.get_tree_hash(tree)
+
+    (tree / "bin" / "tool").write_text("tool v2")
+    modified = cache.get_tree_hash(tree)
+    assert modified != original
+
+    (tree / "bin" / "tool").rename(tree / "bin" / "tool2")
+    assert cache.get_tree_hash(tree) not in (original, modified)
+
+    (tree / "bin" / "tool2").rename(tree / "bin" / "tool")
+    (tree / "bin" / "tool").write_text("tool v1")
+    assert cache.get_tree_hash(tree) == original
+
+
+def test_tree_hash_skips_ignored_entries(tmp_path: Path, tree: Path) -> None:
+    cache = FileHashCache(tmp_path / "file_hashes.json")
+    original = cache.get_tree_hash(tree, ignore=[".git", "*.pyc", "bin/cache"])
+
+    (tree / ".git").mkdir()
+    (tree / ".git" / "HEAD").write_text("ref")
+    (tree / "bin" / "module.pyc").write_text("bytecode")
+    (tree / "bin" / "cache").write_text("cache")
+    assert cache.get_tree_hash(tree, ignore=[".git", "*.pyc", "bin/cache"]) == original
+    assert cache.get_tree_hash(tree) != original
+
+
+def test_tree_hash_reuses_cached_file_hashes(tmp_path: Path, tree: Path) -> None:
+    for file in (tree / "bin" / "tool", tree / "README"):
+        _make_old(file)
+    cache_file = tmp_path / "file_hashes.json"
+    first = FileHashCache(cache_file)
+    expected = first.get_tree_hash(tree)
+    first.save()
+
+    with patch("pypeline.hashing.hash_file") as hash_file_mock:
+        assert FileHashCache(cache_file).get_tree_hash(tree) == expected
+    hash_file_mock.assert_not_called()
+
+
+def test_tree_hash_requires_a_directory(tmp_path: Path, data_file: Path) -> None:
+    cache = FileHashCache(tmp_path / "file_hashes.json")
+    assert cache.get_tree_hash(data_file) is None
+    assert cache.get_tree_hash(tmp_path / "missing") is None
+
+
+class FingerprintedStep(PipelineStep[ExecutionContext]):
+    def __init__(self, execution_context: ExecutionContext, group_name: Optional[str], config: Optional[Dict[str, Any]] = None) -> None:
+        super().__init__(execution_context, group_name, config)
+        self.install_dir = self.project_root_dir / "tools"
+        self.runs = 0
+
+    def get_name(self) -> str:
+        return self.__class__.__name__
+
+    def run(self) -> int:
+        self.runs += 1
+        return 0
+
+    def get_inputs(self) -> List[Path]:
+        return []
+
+    def get_outputs(self) -> List[Path]:
+        return [self.install_dir]
+
+    def get_output_fingerprint(self, path: Path) -> Optional[TreeFingerprint]:
+        return TreeFingerprint(ignore=["*.log"]) if path == self.install_dir else None
+
+    def update_execution_context(self) -> None:
+        pass
+
+
+def test_step_executor_reruns_step_when_fingerprinted_output_changes(tmp_path: Path) -> None:
+    step = FingerprintedStep(ExecutionContext(tmp_path), None)
+    (step.install_dir / "bin").mkdir(parents=True)
+    (step.install_dir / "bin" / "tool").write_text("tool v1")
+
+    StepExecutor(step.output_dir).execute(step)
+    run_info = json.loads((step.output_dir / "FingerprintedStep.deps.json").read_text())
+    assert run_info["outputs"][str(step.install_dir)].startswith("TREE:")
+    assert run_info["fingerprints"] == {str(step.install_dir): ["*.log"]}
+    StepExecutor(step.output_dir).execute(step)
+    (step.install_dir / "install.log").write_text("ignored")
+    StepExecutor(step.output_dir).execute(step)
+    assert step.runs == 1
+
+    (step.install_dir / "bin" / "tool").write_text("tool v2")
+    StepExecutor(step.output_dir).execute(step)
+    assert step.runs == 2
@@ -0,0 +1,55 @@
+from typing import List
+
+import pytest
+
+from pypeline.history import HistoryReport, percentile
+from pypeline.run_state import StepDuration
+
+
+def _history(durations: List[float], step_name: str = "Test", config_hash: str = "abc", machine: str = "ci-1", start: int = 0) -> List[StepDuration]:
+    return [StepDuration("test", step_name, config_hash, machine, start + index, duration) for index, duration in enumerate(durations)]
+
+
+def test_percentile_interpolates_between_ranks() -> None:
+    assert percentile([3.0, 1.0, 2.0], 0.5) == 2.0
+    assert percentile([1.0, 2.0, 3.0, 4.0], 0.5) == 2.5
+    assert percentile([1.0, 2.0, 3.0, 4.0, 5.0], 0.95) == pytest.approx(4.8)
+    assert percentile([7.0], 0.95) == 7.0
+
+
+def test_slower_last_run_is_flagged() -> None:
+    trends = HistoryReport(_history([10.0, 11.0, 10.5, 10.0, 14.0]), threshold=0.2).get_trends("ci-1")
+
+    assert len(trends) == 1
+    trend = trends[0]
+    assert (trend.group_name, trend.step_name, trend.runs, trend.last, trend.baseline) == ("test", "Test", 5, 14.0, 10.25)
+    assert trend.regressed
+    assert trend.change == pytest.approx(14.0 / 10.25 - 1)
+
+
+@pytest.mark.parametrize(
+    "durations",
+    [
+        [10.0, 11.0, 10.5, 11.5],  # within the threshold
+        [0.1, 0.1, 0.1, 0.5],  # slower, but by less than a second
+        [10.0, 10.0, 20.0],  # too few runs to compare to
+    ],
+)
+def test_noise_is_not_flagged(durations: List[float]) -> None:
+    assert not HistoryReport(_history(durations)).get_trends("ci-1")[0].regressed
+
+
+def test_only_the_current_configuration_on_the_machine_is_compared() -> None:
+    history = [
+        *_history([30.0, 30.0, 30.0], machine="laptop"),
+        *_history([10.0, 10.0, 10.0, 10.0], config_hash="old", start=10),
+        *_history([20.0, 21.0], config_hash="new", start=20),
+    ]
+    trend = HistoryReport(history).get_trends("ci-1")[0]
+    # The new configuration has too few runs: a changed configuration is not a regression
+    assert (trend.runs, trend.p50, trend.baseline, trend.regressed) == (2, 20.5, None, False)
+
+
+def test_trends_are_computed_from_the_last_runs() -> None:
+    trend = HistoryReport(_history([100.0] * 10 + [10.0] * 5), last_runs=5).get_trends("ci-1")[0]
+    assert (trend.runs, trend.p95, trend.baseline, trend.regressed) == (5, 10.0, 10.0, False)
@@ -1,3 +1,5 @@
+import os
+import subprocess
 import sys
 import textwrap
 from pathlib import Path
@@ -9,6 +11,8 @@ from typer.testing import CliRunner
 
 from pypeline.domain.artifacts import ProjectArtifactsLocator
 from pypeline.main import __version__, app, package_version_file
+from pypeline.metrics import TIMING_REPORT_FILE
+from pypeline.run_state import RUN_STATE_DB_FILE, RunStateStore
 
 runner = CliRunner()
 
@@ -26,7 +30,9 @@ def test_run(artifacts_locator: ProjectArtifactsLocator) -> None:
         ],
     )
     assert result.exit_code == 0
-    assert artifacts_locator.build_dir.joinpath("custom/MyStep.deps.json").exists(), "Step dependencies file shall exist"
+    with RunStateStore(artifacts_locator.build_dir / RUN_STATE_DB_FILE) as state_store:
+        record = state_store.get_record("custom", "MyStep")
+    assert record and record.run_info is not None, "Step dependencies shall be recorded"
 
     result = runner.invoke(
         app,
@@ -35,6 +41,39 @@ def test_run(artifacts_locator: ProjectArtifactsLocator) -> None:
     assert result.exit_code == 0
 
 
+def test_status(artifacts_locator: ProjectArtifactsLocator) -> None:
+    project_dir = artifacts_locator.project_root_dir.as_posix()
+    assert runner.invoke(app, ["run", "--project-dir", project_dir, "--step", "MyStep", "--single"]).exit_code == 0
+
+    result = runner.invoke(app, ["status", "--project-dir", project_dir])
+    assert result.exit_code == 0
+    lines = {line.split()[0]: line for line in result.stdout.splitlines()}
+    assert "custom/MyStep" in lines
+    # A step that never ran is dirty
+    assert "dirty" in lines["commands/CheckPython"] and "No previous execution info found" in lines["commands/CheckPython"]
+
+
+def test_report(artifacts_locator: ProjectArtifactsLocator) -> None:
+    project_dir = artifacts_locator.project_root_dir.as_posix()
+    assert runner.invoke(app, ["report", "--project-dir", project_dir]).stdout.strip() == "No step durations recorded yet."
+    for _ in range(2):
+        assert runner.invoke(app, ["run", "--project-dir", project_dir, "--step", "MyStep", "--single", "--force-run"]).exit_code == 0
+
+    result = runner.invoke(app, ["report", "--project-dir", project_dir, "--fail-on-regression"])
+    assert result.exit_code == 0
+    lines = {line.split()[0]: line.split() for line in result.stdout.splitlines()}
+    assert lines["custom/MyStep"][1] == "2"
+
+
+def test_run_explain_schedule(artifacts_locator: ProjectArtifactsLocator) -> None:
+    result = runner.invoke(app, ["run", "--project-dir", artifacts_locator.project_root_dir.as_posix(), "--jobs", "2", "--explain-schedule"])
+    assert result.exit_code == 0
+    assert result.stdout.startswith("Schedule on 2 worker(s)")
+    assert "custom/MyStep" in result.stdout
+    # Nothing ran
+    assert not (artifacts_locator.build_dir / TIMING_REPORT_FILE).exists()
+
+
 def test_run_multiple_steps(artifacts_locator: ProjectArtifactsLocator) -> None:
     result = runner.invoke(
         app,
@@ -78,6 +117,12 @@ def test_run_no_step(artifacts_locator: ProjectArtifactsLocator) -> None:
     assert isinstance(result.exception, UserNotificationException)
 
 
+def test_run_fail_fast_and_keep_going_exclude_each_other(artifacts_locator: ProjectArtifactsLocator) -> None:
+    result = runner.invoke(app, ["run", "--project-dir", artifacts_locator.project_root_dir.as_posix(), "--fail-fast", "--keep-going"])
+    assert result.exit_code == 1
+    assert "exclude each other" in str(result.exception)
+
+
 def test_run_no_pypeline_config(tmp_path: Path) -> None:
     result = runner.invoke(app, ["run", "--project-dir", tmp_path.as_posix()], catch_exceptions=True)
     assert result.exit_code == 1
@@ -192,3 +237,35 @@ def test_package_version_file():
     file = package_version_file()
     assert file.exists(), "Package version file shall exist"
     assert __version__ in file.read_text()
+
+
+#: Import time budget of the CLI entry point, in milliseconds (it is about 50 ms on a developer machine)
+CLI_STARTUP_BUDGET_MS = 250
+
+
+def test_cli_startup_imports() -> None:
+    """The CLI entry point shall only import what every command needs; the commands import the rest when invoked."""
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join([str(Path(__file__).parents[1] / "src"), os.environ.get("PYTHONPATH", "")])}
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import pypeline.main"], capture_output=True, text=True, env=env, check=True)
+    # Lines look like 'import time: <self us> | <cumulative us> | <indentation><module>'
+    import_times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:"):
+            _, cumulative, module = line.split("|")
+            if cumulative.strip().isdigit():
+                import_times[module.strip()] = int(cumulative)
+    deferred_modules = [
+        "pypeline.pypeline",
+        "pypeline.step_executor",
+        "pypeline.domain.project_slurper",
+        "pypeline.kickstart.create",
+        "pypeline.artifact_cache",
+        "pypeline.run_state",
+        "pypeline.status",
+        "mashumaro",
+        "yaml",
+        "sqlite3",
+        "tarfile",
+    ]
+    assert [module for module in deferred_modules if module in import_times] == []
+    assert import_times["pypeline.main"] / 1000 < CLI_STARTUP_BUDGET_MS
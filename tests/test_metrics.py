@@ -0,0 +1,85 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from pypeline.domain.execution_context import ExecutionContext
+from pypeline.domain.pipeline import PipelineStep
+from pypeline.metrics import ChildrenUsage, StepMetrics, TimingReport
+from pypeline.step_executor import StepExecutor
+
+
+class CompileStep(PipelineStep[ExecutionContext]):
+    def get_name(self) -> str:
+        return self.__class__.__name__
+
+    def run(self) -> int:
+        # Some CPU in this thread and in a child process
+        sum(i * i for i in range(200_000))
+        subprocess.run([sys.executable, "-c", "bytearray(50 * 1024 * 1024)"], check=True)
+        self.output_dir.joinpath("main.exe").write_text("binary")
+        return 0
+
+    def get_inputs(self) -> List[Path]:
+        return [self.project_root_dir / "main.c"]
+
+    def get_outputs(self) -> List[Path]:
+        return [self.output_dir / "main.exe"]
+
+    def update_execution_context(self) -> None:
+        pass
+
+
+def test_step_metrics(tmp_path: Path) -> None:
+    (tmp_path / "main.c").write_text("int main() {}")
+    step = CompileStep(ExecutionContext(tmp_path), "compile")
+    step.output_dir.mkdir(parents=True)
+
+    executor = StepExecutor(step.output_dir)
+    executor.execute(step)
+    metrics = executor.metrics
+    assert metrics and metrics.outcome == "executed" and metrics.group_name == "compile"
+    assert metrics.run_time and metrics.wall_time >= metrics.run_time
+    assert metrics.cpu_time and metrics.cpu_time > 0
+    assert metrics.hash_time > 0
+    if os.name != "nt":
+        assert metrics.children_cpu_time and metrics.children_cpu_time > 0
+
+    executor = StepExecutor(step.output_dir)
+    executor.execute(step)
+    metrics = executor.metrics
+    assert metrics and metrics.outcome == "skipped"
+    assert metrics.run_time is None and metrics.check_time > 0
+
+
+def test_failed_step_metrics(tmp_path: Path) -> None:
+    step = CompileStep(ExecutionContext(tmp_path), None)
+    executor = StepExecutor(step.output_dir)
+    with pytest.raises(FileNotFoundError):
+        executor.execute(step)
+    assert executor.metrics and executor.metrics.outcome == "failed"
+
+
+@pytest.mark.skipif(os.name == "nt", reason="getrusage is not available on Windows")
+def test_children_usage_reports_new_peak_only() -> None:
+    metrics = StepMetrics(None, "Compile")
+    metrics.record_children_usage(ChildrenUsage(1.0, 100), ChildrenUsage(3.5, 100))
+    assert (metrics.children_cpu_time, metrics.children_max_rss) == (2.5, None)
+    metrics.record_children_usage(ChildrenUsage(1.0, 100), ChildrenUsage(1.0, 300))
+    assert metrics.children_max_rss == 300
+    assert ChildrenUsage.snapshot() is not None
+
+
+def test_timing_report_keeps_pipeline_order(tmp_path: Path) -> None:
+    report = TimingReport(jobs=2)
+    report.add(1, StepMetrics(None, "Test", outcome="executed"))
+    report.add(0, StepMetrics(None, "Build", outcome="skipped"))
+    report.write(tmp_path / "build" / "timings.json")
+
+    content = json.loads((tmp_path / "build" / "timings.json").read_text())
+    assert content["jobs"] == 2
+    assert [(step["step_name"], step["outcome"]) for step in content["steps"]] == [("Build", "skipped"), ("Test", "executed")]
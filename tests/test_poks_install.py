@@ -6,8 +6,8 @@ import pytest
 from poks.domain import PoksApp, PoksConfig
 from py_app_dev.core.exceptions import UserNotificationException
 
+from pypeline import package_version_file
 from pypeline.domain.execution_context import ExecutionContext
-from pypeline.main import package_version_file
 from pypeline.steps.poks_install import PoksInstall, PoksInstallExecutionInfo, PoksManifestFile
 
 
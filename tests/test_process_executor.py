@@ -0,0 +1,258 @@
+import asyncio
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, List
+from unittest.mock import patch
+
+import psutil
+import pytest
+from py_app_dev.core.exceptions import UserNotificationException
+
+from pypeline.process_executor import (
+    MAX_LINE_LENGTH,
+    StepCancelledError,
+    StepProcessGroup,
+    StepTimeoutError,
+    StreamingSubprocessExecutor,
+    current_process_group,
+    execute_concurrently,
+)
+
+
+def _python(code: str) -> List[str | Path]:
+    return [sys.executable, "-c", code]
+
+
+def test_output_is_streamed_to_the_log_file_and_only_the_tail_is_kept(tmp_path: Path) -> None:
+    log_file = tmp_path / "build" / "step.log"
+    executor = StreamingSubprocessExecutor(_python("for i in range(1000): print(f'line {i}')"), log_file=log_file, tail_lines=10)
+    executor.execute()
+
+    assert list(executor.tail) == [f"line {i}" for i in range(990, 1000)]
+    lines = log_file.read_text().splitlines()
+    assert lines[0].startswith("$ ")
+    assert lines[1:] == [f"line {i}" for i in range(1000)]
+
+
+def test_log_file_collects_all_commands(tmp_path: Path) -> None:
+    log_file = tmp_path / "step.log"
+    StreamingSubprocessExecutor(_python("print('first')"), log_file=log_file).execute()
+    StreamingSubprocessExecutor(_python("print('second')"), log_file=log_file).execute()
+    assert [line for line in log_file.read_text().splitlines() if not line.startswith("$ ")] == ["first", "second"]
+
+
+def test_failure_reports_the_last_output_lines(tmp_path: Path) -> None:
+    log_file = tmp_path / "step.log"
+    code = "import sys\nfor i in range(100): print(f'line {i}')\nprint('error: no space left', file=sys.stderr)\nsys.exit(3)"
+    with pytest.raises(UserNotificationException, match="return code 3") as exc_info:
+        StreamingSubprocessExecutor(_python(code), log_file=log_file, tail_lines=5).execute()
+    message = str(exc_info.value)
+    assert "error: no space left" in message
+    assert "line 96" in message and "line 95" not in message
+    assert str(log_file) in message
+
+
+def test_timeout_kills_a_silent_command() -> None:
+    with pytest.raises(UserNotificationException, match="timed out after 1 seconds"):
+        StreamingSubprocessExecutor(_python("import time\nprint('started', flush=True)\ntime.sleep(30)"), timeout=1).execute()
+
+
+def test_completed_process_holds_the_tail_of_the_output() -> None:
+    completed_process = StreamingSubprocessExecutor(_python("import sys\nprint('a')\nprint('b')\nsys.exit(1)"), tail_lines=1).execute(handle_errors=False)
+    assert completed_process
+    assert completed_process.returncode == 1
+    assert completed_process.stdout == "b"
+
+
+def test_step_process_group_limits_the_command_timeout() -> None:
+    process_group = StepProcessGroup("Fetch", 1)
+    token = current_process_group.set(process_group)
+    try:
+        with pytest.raises(StepTimeoutError, match="Step 'Fetch' timed out after 1 seconds"):
+            StreamingSubprocessExecutor(_python("import time\ntime.sleep(30)"), timeout=60).execute()
+    finally:
+        current_process_group.reset(token)
+
+
+def test_expired_step_process_group_kills_the_process_tree(tmp_path: Path) -> None:
+    pid_file = tmp_path / "grandchild.pid"
+    code = (
+        "import subprocess, sys, time\n"
+        "child = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])\n"
+        f"open({str(pid_file)!r}, 'w').write(str(child.pid))\n"
+        "time.sleep(60)"
+    )
+    process_group = StepProcessGroup("Fetch", 60)
+    errors: List[BaseException] = []
+
+    def run_command() -> None:
+        current_process_group.set(process_group)
+        try:
+            StreamingSubprocessExecutor(_python(code)).execute()
+        except BaseException as e:
+            errors.append(e)
+
+    command_thread = threading.Thread(target=run_command)
+    command_thread.start()
+    deadline = time.monotonic() + 10
+    while not (pid_file.exists() and pid_file.read_text()) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    process_group.expire()
+    command_thread.join(10)
+
+    assert not command_thread.is_alive()
+    assert len(errors) == 1 and isinstance(errors[0], StepTimeoutError)
+    grandchild_pid = int(pid_file.read_text())
+    assert not psutil.pid_exists(grandchild_pid) or psutil.Process(grandchild_pid).status() == psutil.STATUS_ZOMBIE
+
+
+@pytest.mark.parametrize("cancel", [False, True])
+def test_background_process_keeping_the_output_open_does_not_block_the_step(tmp_path: Path, cancel: bool) -> None:
+    pid_file = tmp_path / "background.pid"
+    # The command exits at once, its background process inherits the output pipe
+    code = f"import subprocess, sys\nbackground = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)'])\nopen({str(pid_file)!r}, 'w').write(str(background.pid))"
+    process_group = StepProcessGroup("Build", None if cancel else 1)
+    if cancel:
+        threading.Timer(0.5, process_group.cancel, ["step 'Test' failed"]).start()
+    token = current_process_group.set(process_group)
+    try:
+        start = time.monotonic()
+        with pytest.raises(StepCancelledError if cancel else StepTimeoutError):
+            StreamingSubprocessExecutor(_python(code)).execute()
+        assert time.monotonic() - start < 10
+    finally:
+        current_process_group.reset(token)
+        if pid_file.exists():
+            psutil.Process(int(pid_file.read_text())).kill()
+
+
+def test_cancelled_step_process_group_kills_the_command() -> None:
+    process_group = StepProcessGroup("Fetch")
+    assert process_group.remaining() is None
+    threading.Timer(0.5, process_group.cancel, ["step 'Build' failed"]).start()
+    token = current_process_group.set(process_group)
+    try:
+        start = time.monotonic()
+        with pytest.raises(StepCancelledError, match="Step 'Fetch' was cancelled: step 'Build' failed"):
+            StreamingSubprocessExecutor(_python("import time\ntime.sleep(30)")).execute()
+        assert time.monotonic() - start < 10
+    finally:
+        current_process_group.reset(token)
+
+
+def test_cancel_all_cancels_the_running_and_the_later_steps() -> None:
+    running = StepProcessGroup("Build")
+    try:
+        StepProcessGroup.cancel_all("the client disconnected")
+        later = StepProcessGroup("Test")
+        assert running.expired and later.expired
+        assert str(later.expired_error()) == "Step 'Test' was cancelled: the client disconnected. Its subprocesses were killed."
+    finally:
+        StepProcessGroup.reset_cancel_all()
+    assert StepProcessGroup("Lint").cancel_reason is None
+
+
+@pytest.mark.parametrize("capture_output, print_output", [(False, True), (True, False)])
+def test_step_process_group_applies_to_commands_without_streamed_output(capture_output: bool, print_output: bool) -> None:
+    process_group = StepProcessGroup("Fetch", 1)
+    token = current_process_group.set(process_group)
+    try:
+        completed_process = StreamingSubprocessExecutor(_python("print('done')"), capture_output=capture_output, print_output=print_output).execute(handle_errors=False)
+        assert completed_process
+        assert completed_process.stdout == ("done\n" if capture_output else "")
+        start = time.monotonic()
+        with pytest.raises(StepTimeoutError, match="Step 'Fetch' timed out after 1 seconds"):
+            StreamingSubprocessExecutor(_python("import time\ntime.sleep(30)"), capture_output=capture_output, print_output=print_output).execute()
+        assert time.monotonic() - start < 10
+    finally:
+        current_process_group.reset(token)
+
+    process_group = StepProcessGroup("Fetch")
+    threading.Timer(0.5, process_group.cancel, ["step 'Build' failed"]).start()
+    token = current_process_group.set(process_group)
+    try:
+        with pytest.raises(StepCancelledError, match="Step 'Fetch' was cancelled"):
+            StreamingSubprocessExecutor(_python("import time\ntime.sleep(30)"), capture_output=capture_output, print_output=print_output).execute()
+    finally:
+        current_process_group.reset(token)
+
+
+def test_async_engine_streams_to_the_log_file_and_keeps_the_tail(tmp_path: Path) -> None:
+    log_file = tmp_path / "step.log"
+    executor = StreamingSubprocessExecutor(_python("import sys; [print(f'line {i}') for i in range(1000)]; sys.stdout.write('no newline')"), log_file=log_file, tail_lines=2)
+    asyncio.run(executor.execute_async())
+
+    assert list(executor.tail) == ["line 999", "no newline"]
+    assert log_file.read_text().splitlines()[1:] == [*(f"line {i}" for i in range(1000)), "no newline"]
+
+
+def test_async_engine_splits_overlong_lines() -> None:
+    executor = StreamingSubprocessExecutor(_python(f"print('x' * {MAX_LINE_LENGTH * 2 + 10})"))
+    asyncio.run(executor.execute_async())
+    assert [len(line) for line in executor.tail] == [MAX_LINE_LENGTH, MAX_LINE_LENGTH, 10]
+
+
+def test_async_engine_reports_failures_and_timeouts() -> None:
+    with pytest.raises(UserNotificationException, match=r"return code 3\.\nLast 1 output lines:\nboom"):
+        asyncio.run(StreamingSubprocessExecutor(_python("import sys\nprint('boom')\nsys.exit(3)")).execute_async())
+    with pytest.raises(UserNotificationException, match="timed out after 1 seconds"):
+        asyncio.run(StreamingSubprocessExecutor(_python("import time\ntime.sleep(30)"), timeout=1).execute_async())
+    completed_process = asyncio.run(StreamingSubprocessExecutor(_python("import sys\nsys.exit(2)")).execute_async(handle_errors=False))
+    assert completed_process and completed_process.returncode == 2
+
+
+def test_async_engine_applies_the_step_timeout() -> None:
+    process_group = StepProcessGroup("Fetch", 1)
+    token = current_process_group.set(process_group)
+    try:
+        with pytest.raises(StepTimeoutError, match="Step 'Fetch' timed out"):
+            asyncio.run(StreamingSubprocessExecutor(_python("import time\ntime.sleep(30)")).execute_async())
+    finally:
+        current_process_group.reset(token)
+
+
+def test_cancelled_command_is_killed(tmp_path: Path) -> None:
+    pid_file = tmp_path / "child.pid"
+
+    async def cancel_after_start() -> None:
+        task = asyncio.create_task(StreamingSubprocessExecutor(_python(f"import os, time\nopen({str(pid_file)!r}, 'w').write(str(os.getpid()))\ntime.sleep(60)")).execute_async())
+        while not (pid_file.exists() and pid_file.read_text()):
+            await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(asyncio.wait_for(cancel_after_start(), 10))
+    pid = int(pid_file.read_text())
+    assert not psutil.pid_exists(pid) or psutil.Process(pid).status() == psutil.STATUS_ZOMBIE
+
+
+def test_commands_are_executed_concurrently_without_a_thread_per_command(tmp_path: Path) -> None:
+    # Every command waits until all of them have started
+    count = 8
+    code = f"import os, time\nopen(os.path.join({str(tmp_path)!r}, str(os.getpid())), 'w').close()\nwhile len(os.listdir({str(tmp_path)!r})) < {count}: time.sleep(0.05)"
+    threads_before = threading.active_count()
+    threads_during: List[int] = []
+    executors = [StreamingSubprocessExecutor(_python(code), timeout=30) for _ in range(count)]
+    original_pump = StreamingSubprocessExecutor._pump_output_async
+
+    async def pump_and_count_threads(self: StreamingSubprocessExecutor, *args: Any) -> None:
+        threads_during.append(threading.active_count())
+        await original_pump(self, *args)
+
+    with patch.object(StreamingSubprocessExecutor, "_pump_output_async", pump_and_count_threads):
+        errors = execute_concurrently([*executors, StreamingSubprocessExecutor(_python("import sys\nsys.exit(1)"))])
+
+    assert errors[:count] == [None] * count
+    assert isinstance(errors[count], UserNotificationException)
+    # Before Python 3.12 asyncio waits for each child process on a helper thread; the output is read by the event loop
+    assert max(threads_during) - threads_before <= (2 if sys.version_info >= (3, 12) else count + 2)
+
+
+def test_max_parallel_limits_the_running_commands(tmp_path: Path) -> None:
+    # A command fails if another one is running at the same time
+    lock_dir = tmp_path / "lock"
+    code = f"import os, time\nos.mkdir({str(lock_dir)!r})\ntime.sleep(0.2)\nos.rmdir({str(lock_dir)!r})"
+    assert execute_concurrently([StreamingSubprocessExecutor(_python(code)) for _ in range(3)], max_parallel=1) == [None] * 3
@@ -1,7 +1,11 @@
+import json
 import os
+import sys
 import textwrap
+import threading
+import time
 from pathlib import Path
-from typing import List, Optional, OrderedDict, Type, cast
+from typing import ClassVar, Dict, List, Optional, OrderedDict, Type, cast
 from unittest.mock import Mock
 
 import pytest
@@ -11,7 +15,11 @@ from pypeline.domain.artifacts import ProjectArtifactsLocator
 from pypeline.domain.config import ProjectConfig
 from pypeline.domain.execution_context import ExecutionContext
 from pypeline.domain.pipeline import PipelineConfig, PipelineStep, PipelineStepConfig, PipelineStepReference
-from pypeline.pypeline import PipelineScheduler, PipelineStepsExecutor, RunCommandClassFactory
+from pypeline.history import get_machine_name
+from pypeline.metrics import TIMING_REPORT_FILE
+from pypeline.process_executor import StreamingSubprocessExecutor
+from pypeline.pypeline import CriticalPathPriorities, PipelineScheduler, PipelineStepsExecutor, RunCommandClassFactory
+from pypeline.run_state import RUN_STATE_DB_FILE, RunStateStore, StepDuration
 from tests.conftest import assert_element_of_type
 
 
@@ -247,6 +255,10 @@ def test_pipeline_create_run_command_step_class(execution_context: ExecutionCont
     )
     executor.run()
     assert not len(list(execution_context.project_root_dir.glob("build/my_cmd/*.deps.json"))), "Step dependencies file shall not exist"
+    with RunStateStore(execution_context.project_root_dir / "build" / RUN_STATE_DB_FILE) as state_store:
+        record = state_store.get_record("my_cmd", "Echo")
+    # Always running steps only record their last execution, no dependencies
+    assert record and record.run_info is None and record.exit_status == 0
 
 
 @pytest.mark.parametrize(
@@ -301,7 +313,10 @@ class MyCustomPipelineStep(PipelineStep[ExecutionContext]):
 def test_pipeline_executor(execution_context: ExecutionContext) -> None:
     executor = PipelineStepsExecutor(execution_context, [PipelineStepReference("MyStep", cast(Type[PipelineStep[ExecutionContext]], MyCustomPipelineStep))])
     executor.run()
-    assert execution_context.project_root_dir.joinpath("build/MyStep/MyCustomPipelineStep.deps.json").exists(), "Step dependencies file shall exist"
+    with RunStateStore(execution_context.project_root_dir / "build" / RUN_STATE_DB_FILE) as state_store:
+        record = state_store.get_record("MyStep", "MyCustomPipelineStep")
+    assert record and record.run_info == {"inputs": {}, "outputs": {}}, "Step dependencies shall be recorded"
+    assert record.exit_status == 0 and record.duration is not None
 
 
 class MyExecutionContext(ExecutionContext):
@@ -771,3 +786,443 @@ def test_filter_steps_missing_step_raises_exception(sample_steps: List[PipelineS
         PipelineScheduler.filter_steps(sample_steps[:2], ["MissingStep"], True)
 
     assert "Steps not found in pipeline configuration: MissingStep" in str(exc_info.value)
+
+
+class RecordingStep(PipelineStep[ExecutionContext]):
+    """Waits on the barrier given in its config (if any) and records the order of the context updates."""
+
+    barrier: Optional[threading.Barrier] = None
+    started: ClassVar[List[str]] = []
+    #: The published steps each step saw when it ran
+    seen: ClassVar[Dict[str, List[str]]] = {}
+
+    def run(self) -> int:
+        self.started.append(self.get_name())
+        self.seen[self.get_name()] = _published_steps(self.execution_context)
+        if self.config and self.config.get("sleep"):
+            time.sleep(self.config["sleep"])
+        if self.config and self.config.get("wait_for_sibling"):
+            assert self.barrier is not None
+            self.barrier.wait(timeout=5)
+        if self.config and self.config.get("command"):
+            StreamingSubprocessExecutor(self.config["command"]).execute()
+        if self.config and self.config.get("fail"):
+            raise UserNotificationException(f"{self.get_name()} failed")
+        return 0
+
+    def get_name(self) -> str:
+        return self.__class__.__name__
+
+    def get_inputs(self) -> List[Path]:
+        return []
+
+    def get_outputs(self) -> List[Path]:
+        return []
+
+    def get_needs_dependency_management(self) -> bool:
+        return False
+
+    def update_execution_context(self) -> None:
+        self.execution_context.data_registry.insert(self.get_name(), self.get_name())
+
+
+def _recording_step_reference(name: str, needs: Optional[List[str]] = None, **config: object) -> PipelineStepReference[PipelineStep[ExecutionContext]]:
+    step_class = cast(Type[PipelineStep[ExecutionContext]], type(name, (RecordingStep,), {}))
+    return PipelineStepReference(None, step_class, dict(config), needs)
+
+
+def _published_steps(execution_context: ExecutionContext) -> List[str]:
+    return execution_context.data_registry.find_data(str)
+
+
+def test_pipeline_executor_runs_independent_steps_concurrently(tmp_path: Path) -> None:
+    RecordingStep.barrier = threading.Barrier(2)
+    execution_context = ExecutionContext(tmp_path)
+    steps_references = [
+        _recording_step_reference("Lint", needs=[], wait_for_sibling=True),
+        _recording_step_reference("Docs", needs=[], wait_for_sibling=True),
+        _recording_step_reference("Report"),
+    ]
+    # Sequentially, the first step would wait forever for its sibling to reach the barrier.
+    PipelineStepsExecutor[ExecutionContext](execution_context, steps_references, jobs=2).run()
+    assert _published_steps(execution_context) == ["Lint", "Docs", "Report"]
+
+
+def test_pipeline_executor_publishes_context_in_pipeline_order(tmp_path: Path) -> None:
+    execution_context = ExecutionContext(tmp_path)
+    steps_references = [
+        _recording_step_reference("Slow", needs=[], sleep=0.3),
+        _recording_step_reference("Fast", needs=[]),
+        _recording_step_reference("AfterFast", needs=["Fast"]),
+    ]
+    PipelineStepsExecutor[ExecutionContext](execution_context, steps_references, jobs=3).run()
+    assert _published_steps(execution_context) == ["Slow", "Fast", "AfterFast"]
+
+
+def test_pipeline_executor_context_of_a_step_does_not_depend_on_timing(tmp_path: Path) -> None:
+    execution_context = ExecutionContext(tmp_path)
+    steps_references = [
+        _recording_step_reference("Slow", needs=[], sleep=0.3),
+        _recording_step_reference("Fast", needs=[]),
+        _recording_step_reference("AfterSlow", needs=["Slow"], sleep=0.1),
+        _recording_step_reference("AfterFast", needs=["Fast"]),
+    ]
+    PipelineStepsExecutor[ExecutionContext](execution_context, steps_references, jobs=4).run()
+    # Fast finished first but is only published once AfterSlow, which started without it, finished
+    assert RecordingStep.seen["AfterSlow"] == ["Slow"]
+    assert RecordingStep.seen["AfterFast"] == ["Slow", "Fast"]
+    assert _published_steps(execution_context) == ["Slow", "Fast", "AfterSlow", "AfterFast"]
+
+
+def test_pipeline_executor_concurrent_failure_stops_scheduling(tmp_path: Path) -> None:
+    execution_context = ExecutionContext(tmp_path)
+    steps_references = [
+        _recording_step_reference("Broken", needs=[], fail=True),
+        _recording_step_reference("Sibling", needs=[], sleep=0.1),
+        _recording_step_reference("Dependent", needs=["Broken"]),
+    ]
+    with pytest.raises(UserNotificationException, match="Broken failed"):
+        PipelineStepsExecutor[ExecutionContext](execution_context, steps_references, jobs=2).run()
+    assert "Dependent" not in _published_steps(execution_context)
+
+
+def test_pipeline_executor_fail_fast_cancels_the_running_steps(tmp_path: Path) -> None:
+    execution_context = ExecutionContext(tmp_path)
+    steps_references = [
+        _recording_step_reference("Slow", needs=[], command=[sys.executable, "-c", "import time; time.sleep(30)"]),
+        _recording_step_reference("Broken", needs=[], sleep=0.5, fail=True),
+        _recording_step_reference("Later", needs=[]),
+    ]
+    executor = PipelineStepsExecutor[ExecutionContext](execution_context, steps_references, jobs=2, fail_fast=True)
+    start = time.monotonic()
+    with pytest.raises(UserNotificationException, match="Broken failed"):
+        executor.run()
+    assert time.monotonic() - start < 10
+    outcomes = {step["step_name"]: step["outcome"] for step in json.loads((tmp_path / "build" / TIMING_REPORT_FILE).read_text())["steps"]}
+    assert outcomes == {"Slow": "cancelled", "Broken": "failed"}
+
+
+def test_pipeline_executor_keep_going_runs_the_steps_not_needing_a_failure(tmp_path: Path) -> None:
+    execution_context = ExecutionContext(tmp_path)
+    steps_references = [
+        _recording_step_reference("Broken", needs=[], fail=True),
+        _recording_step_reference("AlsoBroken", needs=[], fail=True),
+        _recording_step_reference("Independent", needs=[], sleep=0.2),
+        _recording_step_reference("Dependent", needs=["Broken"]),
+        _recording_step_reference("Transitive", needs=["Dependent", "Independent"]),
+        _recording_step_reference("AfterIndependent", needs=["Independent"]),
+        _recording_step_reference("Report"),
+    ]
+    with pytest.raises(UserNotificationException) as exc_info:
+        PipelineStepsExecutor[ExecutionContext](execution_context, steps_references, jobs=2, keep_going=True).run()
+    assert str(exc_info.value) == (
+        "2 step(s) failed: Broken, AlsoBroken. 3 step(s) did not run because they need a failed step: Dependent, Transitive, Report."
+    )
+    assert _published_steps(execution_context) == ["Independent", "AfterIndependent"]
+
+
+def test_pipeline_executor_keep_going_runs_sequentially_too(tmp_path: Path) -> None:
+    execution_context = ExecutionContext(tmp_path)
+    steps_references = [
+        _recording_step_reference("Broken", needs=[], fail=True),
+        _recording_step_reference("Independent", needs=[]),
+        _recording_step_reference("Report"),
+    ]
+    with pytest.raises(UserNotificationException, match=r"^1 step\(s\) failed: Broken\. 1 step\(s\) did not run because they need a failed step: Report\.$"):
+        PipelineStepsExecutor[ExecutionContext](execution_context, steps_references, keep_going=True).run()
+    assert _published_steps(execution_context) == ["Independent"]
+
+
+def test_pipeline_executor_failure_policies_exclude_each_other(tmp_path: Path) -> None:
+    with pytest.raises(UserNotificationException, match="exclude each other"):
+        PipelineStepsExecutor[ExecutionContext](ExecutionContext(tmp_path), [], fail_fast=True, keep_going=True)
+
+
+def test_pipeline_executor_without_needs_keeps_sequential_order(tmp_path: Path) -> None:
+    execution_context = ExecutionContext(tmp_path)
+    steps_references = [
+        _recording_step_reference("First", sleep=0.1),
+        _recording_step_reference("Second"),
+    ]
+    executor = PipelineStepsExecutor[ExecutionContext](execution_context, steps_references, jobs=4)
+    assert executor._resolve_dependencies() == [0, 1]
+    executor.run()
+    assert _published_steps(execution_context) == ["First", "Second"]
+
+
+def test_critical_path_priorities_start_the_long_pole_first() -> None:
+    # Three lint steps and a docs build, all independent, and a report waiting for all of them
+    priorities = CriticalPathPriorities([0, 0, 0, 0, 4], [30.0, 30.0, 30.0, 720.0, None])
+
+    # Without a recorded duration, the report is assumed to take the median of the other steps
+    assert priorities.durations[4] == 30.0
+    assert priorities.ranks == [60.0, 60.0, 60.0, 750.0, 30.0]
+    assert priorities.sort([0, 1, 2, 3]) == [3, 0, 1, 2]
+    assert priorities.simulate(2) == [(0.0, 30.0), (30.0, 60.0), (60.0, 90.0), (0.0, 720.0), (720.0, 750.0)]
+    # In pipeline order the docs build would only start after two lint steps
+    assert CriticalPathPriorities([0, 0, 0, 0, 4], [None] * 5).sort([0, 1, 2, 3]) == [0, 1, 2, 3]
+
+
+def test_simulated_schedule_holds_back_contexts_like_the_executor() -> None:
+    # Slow, Fast, AfterSlow and AfterFast as in test_pipeline_executor_context_of_a_step_does_not_depend_on_timing
+    priorities = CriticalPathPriorities([0, 0, 1, 2], [3.0, 1.0, 1.0, 1.0])
+
+    # Fast is only published once AfterSlow finished
+    assert priorities.simulate(4) == [(0.0, 3.0), (0.0, 1.0), (3.0, 4.0), (4.0, 5.0)]
+
+
+def test_pipeline_executor_starts_steps_on_the_longest_path_first(tmp_path: Path) -> None:
+    execution_context = ExecutionContext(tmp_path)
+    with RunStateStore(execution_context.create_artifacts_locator().build_dir / RUN_STATE_DB_FILE) as state_store:
+        state_store.add_history([StepDuration("", name, "abc", get_machine_name(), 0, duration) for name, duration in [("Lint", 1.0), ("Format", 1.0), ("Docs", 100.0)]])
+    steps_references = [_recording_step_reference(name, needs=[]) for name in ["Lint", "Format", "Docs"]]
+    executor = PipelineStepsExecutor[ExecutionContext](execution_context, steps_references, jobs=2)
+
+    assert [(step.step_name, step.start, step.finish) for step in executor.explain_schedule()] == [("Lint", 0.0, 1.0), ("Format", 1.0, 2.0), ("Docs", 0.0, 100.0)]
+    RecordingStep.started = []
+    executor.run()
+    assert set(RecordingStep.started[:2]) == {"Docs", "Lint"}
+    assert _published_steps(execution_context) == ["Lint", "Format", "Docs"]
+
+
+def test_pipeline_config_needs_is_passed_to_references(tmp_path: Path) -> None:
+    config_file = tmp_path / "pypeline.yaml"
+    config_file.write_text(
+        textwrap.dedent("""\
+            pipeline:
+                - step: Lint
+                  run: echo "lint"
+                  needs: []
+                - step: Test
+                  run: echo "test"
+                  needs: [Lint]
+                - step: Docs
+                  run: echo "docs"
+            """)
+    )
+    references = PipelineScheduler[ExecutionContext](ProjectConfig.from_file(config_file).pipeline, tmp_path).get_steps_to_run()
+    assert [ref.needs for ref in references] == [[], ["Lint"], None]
+
+
+def test_pipeline_config_resources_are_passed_to_references(tmp_path: Path) -> None:
+    config_file = tmp_path / "pypeline.yaml"
+    config_file.write_text(
+        textwrap.dedent("""\
+            resources:
+                network: 2
+            pipeline:
+                - step: Fetch
+                  run: echo "fetch"
+                  resources: {network: 1}
+                - step: Build
+                  run: echo "build"
+                  resources: {cpu: 8}
+                - step: Docs
+                  run: echo "docs"
+            """)
+    )
+    project_config = ProjectConfig.from_file(config_file)
+    references = PipelineScheduler[ExecutionContext](project_config.pipeline, tmp_path).get_steps_to_run()
+    assert project_config.resources == {"network": 2}
+    assert [ref.resources for ref in references] == [{"network": 1}, {"cpu": 8}, None]
+
+    config_file.write_text('pipeline:\n  - step: Fetch\n    run: echo "fetch"\n    resources: {network: 0}\n')
+    with pytest.raises(UserNotificationException, match="invalid amount 0 of resource 'network'"):
+        PipelineScheduler[ExecutionContext](ProjectConfig.from_file(config_file).pipeline, tmp_path).get_steps_to_run()
+
+
+def test_pipeline_executor_admits_steps_by_resource_tokens(tmp_path: Path) -> None:
+    execution_context = ExecutionContext(tmp_path)
+    steps_references = [_recording_step_reference(name, needs=[], sleep=0.1) for name in ["FetchA", "FetchB", "Lint"]]
+    steps_references[0].resources = steps_references[1].resources = {"network": 1}
+    executor = PipelineStepsExecutor[ExecutionContext](execution_context, steps_references, jobs=3)
+
+    # The network is used exclusively: the second fetch waits for the first one, the lint step does not
+    assert [(step.step_name, step.start) for step in executor.explain_schedule()] == [("FetchA", 0.0), ("FetchB", 1.0), ("Lint", 0.0)]
+    RecordingStep.started = []
+    executor.run()
+    assert RecordingStep.started[-1] == "FetchB"
+    assert _published_steps(execution_context) == ["FetchA", "FetchB", "Lint"]
+
+
+@pytest.mark.parametrize(
+    "needs, error",
+    [
+        ("[DoesNotExist]", "does not exist"),
+        ("[Docs]", "is defined after it"),
+    ],
+)
+def test_pipeline_scheduler_rejects_invalid_needs(tmp_path: Path, needs: str, error: str) -> None:
+    config_file = tmp_path / "pypeline.yaml"
+    config_file.write_text(
+        textwrap.dedent(f"""\
+            pipeline:
+                - step: Lint
+                  run: echo "lint"
+                  needs: {needs}
+                - step: Docs
+                  run: echo "docs"
+            """)
+    )
+    with pytest.raises(UserNotificationException, match=error):
+        PipelineScheduler[ExecutionContext](ProjectConfig.from_file(config_file).pipeline, tmp_path).get_steps_to_run()
+
+
+RENDEZVOUS_SCRIPT = """\
+import sys, time
+from pathlib import Path
+
+own_flag, other_flag = Path(sys.argv[1]), Path(sys.argv[2])
+own_flag.touch()
+deadline = time.monotonic() + 10
+while not other_flag.exists():
+    if time.monotonic() > deadline:
+        sys.exit(1)
+    time.sleep(0.05)
+"""
+
+
+def _run_commands_step(tmp_path: Path, step_yaml: str) -> None:
+    config_file = tmp_path / "pypeline.yaml"
+    config_file.write_text("pipeline:\n" + textwrap.indent(textwrap.dedent(step_yaml), "    "))
+    steps_references = PipelineScheduler[ExecutionContext](ProjectConfig.from_file(config_file).pipeline, tmp_path).get_steps_to_run()
+    PipelineStepsExecutor[ExecutionContext](ExecutionContext(tmp_path), steps_references).run()
+
+
+def test_run_block_commands_run_concurrently(tmp_path: Path) -> None:
+    # Each command waits for the other one, so this only succeeds if they run at the same time.
+    tmp_path.joinpath("rendezvous.py").write_text(RENDEZVOUS_SCRIPT)
+    _run_commands_step(
+        tmp_path,
+        """\
+        - step: Linters
+          parallel: true
+          run: |
+            python rendezvous.py a.flag b.flag
+            python rendezvous.py b.flag a.flag
+        """,
+    )
+    assert tmp_path.joinpath("a.flag").exists() and tmp_path.joinpath("b.flag").exists()
+
+
+@pytest.mark.skipif(os.name == "nt", reason="The commands rely on POSIX shell quoting")
+def test_run_block_parallel_reports_all_failures(tmp_path: Path) -> None:
+    with pytest.raises(UserNotificationException, match="1 of 2 commands failed") as exc_info:
+        _run_commands_step(
+            tmp_path,
+            """\
+            - step: Linters
+              parallel: true
+              max_parallel: 1
+              run: |
+                python -c "import sys; sys.exit(3)"
+                python -c "import pathlib; pathlib.Path('done.flag').touch()"
+            """,
+        )
+    assert "sys.exit(3)" in str(exc_info.value)
+    assert tmp_path.joinpath("done.flag").exists(), "A failing command shall not prevent the others from running"
+
+
+def test_run_block_parallel_rejects_invalid_max_parallel(tmp_path: Path) -> None:
+    with pytest.raises(UserNotificationException, match="max_parallel"):
+        _run_commands_step(
+            tmp_path,
+            """\
+            - step: Linters
+              parallel: true
+              max_parallel: 0
+              run: echo "lint"
+            """,
+        )
+
+
+def test_pipeline_loader_imports_steps_lazily(tmp_path: Path) -> None:
+    tmp_path.joinpath("lazy_step.py").write_text(
+        textwrap.dedent(
+            """\
+            from pathlib import Path
+            from pypeline.domain.execution_context import ExecutionContext
+            from pypeline.domain.pipeline import PipelineStep
+
+            Path(__file__).with_name("imported.flag").touch()
+
+
+            class LazyStep(PipelineStep[ExecutionContext]):
+                def run(self) -> int:
+                    return 0
+
+                def get_inputs(self):
+                    return []
+
+                def get_outputs(self):
+                    return []
+
+                def update_execution_context(self) -> None:
+                    pass
+            """
+        )
+    )
+    pipeline_config = cast(PipelineConfig, [PipelineStepConfig(step="LazyStep", file="lazy_step.py")])
+    steps_references = PipelineScheduler[ExecutionContext].create_pipeline_loader(pipeline_config, tmp_path).load_steps_references()
+    assert steps_references[0].name == "LazyStep"
+    assert steps_references[0].import_duration is None
+    assert not tmp_path.joinpath("imported.flag").exists(), "The step module shall only be imported when the step is created"
+
+    assert steps_references[0]._class.__name__ == "LazyStep"
+    assert tmp_path.joinpath("imported.flag").exists()
+    assert steps_references[0].import_duration is not None
+
+
+@pytest.mark.parametrize(
+    "step_config, error",
+    [
+        (PipelineStepConfig(step="IDoNotExist", module="do.not.exist"), "Could not load module"),
+        (PipelineStepConfig(step="IDoNotExist", file="do_not_exist.py"), "Could not load file"),
+    ],
+)
+def test_pipeline_loader_rejects_missing_step_sources_upfront(tmp_path: Path, step_config: PipelineStepConfig, error: str) -> None:
+    with pytest.raises(UserNotificationException, match=error):
+        PipelineScheduler[ExecutionContext].create_pipeline_loader(cast(PipelineConfig, [step_config]), tmp_path).load_steps_references()
+
+
+@pytest.mark.skipif(os.name == "nt", reason="The commands rely on POSIX shell quoting")
+def test_run_block_output_goes_to_the_step_log_file(tmp_path: Path) -> None:
+    step_yaml = """\
+        - step: Greet
+          run: python -c "print('hello')"
+        """
+    _run_commands_step(tmp_path, step_yaml)
+    _run_commands_step(tmp_path, step_yaml)
+    # The log file only holds the output of the last run
+    assert [line for line in tmp_path.joinpath("build", "Greet.log").read_text().splitlines() if not line.startswith("$ ")] == ["hello"]
+
+
+@pytest.mark.skipif(os.name == "nt", reason="The commands rely on POSIX shell quoting")
+def test_run_block_timeout_kills_the_command(tmp_path: Path) -> None:
+    start = time.monotonic()
+    with pytest.raises(UserNotificationException, match="Step 'Fetch' timed out after 1 seconds"):
+        _run_commands_step(
+            tmp_path,
+            """\
+            - step: Fetch
+              timeout_sec: 1
+              run: python -c "import time; time.sleep(30)"
+            """,
+        )
+    assert time.monotonic() - start < 10
+    with RunStateStore(tmp_path / "build" / RUN_STATE_DB_FILE) as state_store:
+        record = state_store.get_record(None, "Fetch")
+    assert record and record.timed_out
+
+
+def test_pipeline_executor_writes_timing_report(tmp_path: Path) -> None:
+    _run_commands_step(
+        tmp_path,
+        """\
+        - step: Greet
+          run: python -c "print('hello')"
+        """,
+    )
+    report = json.loads(tmp_path.joinpath("build", TIMING_REPORT_FILE).read_text())
+    assert [(step["step_name"], step["outcome"]) for step in report["steps"]] == [("Greet", "executed")]
+    assert report["steps"][0]["run_time"] > 0
@@ -0,0 +1,34 @@
+import os
+
+from pypeline.resources import ResourceTokens
+
+
+def test_steps_are_admitted_while_tokens_are_available() -> None:
+    tokens = ResourceTokens([{"cpu": 4}, {"cpu": 4}, {"cpu": 4}, None], {"cpu": 8})
+
+    assert tokens.admit([0, 1, 2, 3], free_workers=4) == [0, 1, 3]
+    assert tokens.available["cpu"] == 0
+    tokens.release(0)
+    assert tokens.admit([2], free_workers=4) == [2]
+
+
+def test_admission_is_limited_by_the_free_workers() -> None:
+    assert ResourceTokens([None, None, None]).admit([0, 1, 2], free_workers=2) == [0, 1]
+
+
+def test_blocked_step_reserves_its_resources() -> None:
+    tokens = ResourceTokens([{"cpu": 2}, {"cpu": 4}, {"cpu": 1}, {"network": 1}], {"cpu": 4})
+    assert tokens.admit([0], free_workers=4) == [0]
+
+    # The 4 cpu step does not fit: the 1 cpu step behind it must not take the tokens it waits for
+    assert tokens.admit([1, 2, 3], free_workers=4) == [3]
+
+
+def test_resources_default_to_the_cpu_count_and_exclusive_use() -> None:
+    tokens = ResourceTokens([{"network": 1}, {"network": 1}, {"cpu": 10_000}])
+
+    assert tokens.capacities == {"cpu": os.cpu_count() or 1, "network": 1}
+    assert tokens.admit([0, 1], free_workers=2) == [0]
+    # A request above the capacity takes the whole capacity instead of never starting
+    assert tokens.requests[2] == {"cpu": os.cpu_count() or 1}
+    assert tokens.admit([2], free_workers=1) == [2]
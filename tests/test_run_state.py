@@ -0,0 +1,203 @@
+import os
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Type, cast
+from unittest.mock import patch
+
+import pytest
+from py_app_dev.core.runnable import RunInfoStatus
+
+from pypeline.domain.execution_context import ExecutionContext
+from pypeline.domain.pipeline import PipelineStep, PipelineStepReference
+from pypeline.hashing import hash_file
+from pypeline.process_executor import StepTimeoutError
+from pypeline.pypeline import PipelineStepsExecutor
+from pypeline.run_state import RUN_STATE_DB_FILE, RunStateStore, StepDuration, StepRunRecord, check_run_info
+from pypeline.step_executor import StepExecutor
+
+
+class CompileStep(PipelineStep[ExecutionContext]):
+    fail = False
+
+    def __init__(self, execution_context: ExecutionContext, group_name: Optional[str], config: Optional[Dict[str, Any]] = None) -> None:
+        super().__init__(execution_context, group_name, config)
+        self.source = self.project_root_dir / "main.c"
+        self.binary = self.output_dir / "main.exe"
+        self.runs = 0
+
+    def get_name(self) -> str:
+        return self.__class__.__name__
+
+    def run(self) -> int:
+        self.runs += 1
+        if self.fail:
+            raise RuntimeError("compiler crashed")
+        self.binary.write_text(f"compiled {self.source.read_text()}")
+        return 0
+
+    def get_inputs(self) -> List[Path]:
+        return [self.source]
+
+    def get_outputs(self) -> List[Path]:
+        return [self.binary]
+
+    def update_execution_context(self) -> None:
+        pass
+
+
+@pytest.fixture
+def step(tmp_path: Path) -> CompileStep:
+    (tmp_path / "main.c").write_text("int main() {}")
+    step = CompileStep(ExecutionContext(tmp_path), "compile", {"optimize": True})
+    step.output_dir.mkdir(parents=True)
+    return step
+
+
+def _execute(step: CompileStep, db_file: Path) -> None:
+    with RunStateStore(db_file) as state_store:
+        StepExecutor(step.output_dir, state_store=state_store).execute(step)
+
+
+def test_records_run_info_duration_and_exit_status(tmp_path: Path, step: CompileStep) -> None:
+    db_file = tmp_path / "build" / "state.db"
+    _execute(step, db_file)
+
+    with RunStateStore(db_file) as state_store:
+        record = state_store.get_record("compile", "CompileStep")
+    assert record
+    assert record.step_name == "CompileStep"
+    assert record.step_config == {"optimize": True}
+    assert record.run_info == {"inputs": {str(step.source): hash_file(step.source)}, "outputs": {str(step.binary): hash_file(step.binary)}}
+    assert record.exit_status == 0
+    assert record.duration is not None and record.started_at is not None
+    # Nothing is written to the step output directory anymore
+    assert [path.name for path in step.output_dir.iterdir()] == ["main.exe"]
+
+    _execute(step, db_file)
+    assert step.runs == 1
+
+
+def test_failed_step_runs_again(tmp_path: Path, step: CompileStep) -> None:
+    db_file = tmp_path / "build" / "state.db"
+    _execute(step, db_file)
+    step.source.write_text("int main() { return 1; }")
+    step.fail = True
+    with pytest.raises(RuntimeError):
+        _execute(step, db_file)
+
+    with RunStateStore(db_file) as state_store:
+        record = state_store.get_record("compile", "CompileStep")
+    assert record and record.run_info is None and record.exit_status is None
+
+    step.fail = False
+    _execute(step, db_file)
+    assert step.runs == 3
+
+
+def test_legacy_run_info_file_is_reused(tmp_path: Path, step: CompileStep) -> None:
+    # Run info written by an older version, before the run state database existed
+    StepExecutor(step.output_dir).execute(step)
+    assert (step.output_dir / "CompileStep.deps.json").exists()
+
+    _execute(step, tmp_path / "build" / "state.db")
+    assert step.runs == 1
+
+
+def test_file_hashes_are_kept_in_the_database(tmp_path: Path, step: CompileStep) -> None:
+    old = time.time() - 60
+    os.utime(step.source, (old, old))
+    db_file = tmp_path / "build" / "state.db"
+    _execute(step, db_file)
+
+    with RunStateStore(db_file) as state_store:
+        assert state_store.file_hashes.entries[str(step.source)]["hash"] == hash_file(step.source)
+    assert not (step.output_dir / StepExecutor.HASH_CACHE_FILE).exists()
+
+
+def test_complete_pipeline_run_drops_the_hashes_of_files_it_did_not_look_up(tmp_path: Path, step: CompileStep) -> None:
+    deleted_file = tmp_path / "deleted.c"
+    deleted_file.write_text("int deleted;")
+    for path in (step.source, deleted_file):
+        old = time.time() - 60
+        os.utime(path, (old, old))
+    db_file = tmp_path / "build" / RUN_STATE_DB_FILE
+    with RunStateStore(db_file) as state_store:
+        state_store.file_hashes.get_hash(deleted_file)
+    deleted_file.unlink()
+
+    step_reference = PipelineStepReference("compile", cast(Type[PipelineStep[ExecutionContext]], CompileStep))
+    PipelineStepsExecutor[ExecutionContext](ExecutionContext(tmp_path), [step_reference]).run()
+
+    with RunStateStore(db_file) as state_store:
+        assert set(state_store.file_hashes.entries) == {str(step.source)}
+
+
+def test_find_records_by_step_name(tmp_path: Path) -> None:
+    with RunStateStore(tmp_path / "state.db") as state_store:
+        state_store.save_record(StepRunRecord("", "WestInstall_1234", "WestInstall"))
+        state_store.save_record(StepRunRecord("", "WestInstall_5678", "WestInstall"))
+        state_store.save_record(StepRunRecord("other", "WestInstall", "WestInstall"))
+        assert [record.step_id for record in state_store.find_records(None, "WestInstall")] == ["WestInstall_1234", "WestInstall_5678"]
+
+
+def test_check_run_info_reports_what_changed(tmp_path: Path) -> None:
+    source = tmp_path / "main.c"
+    source.write_text("int main() {}")
+    previous_info = {"inputs": {str(source): hash_file(source)}, "outputs": {}, "config": {"optimize": "True"}}
+
+    assert check_run_info(previous_info, {"optimize": "True"}, [source], hash_file) == (RunInfoStatus.MATCH, None)
+    assert check_run_info(previous_info, {"optimize": "False"}, [source], hash_file) == (RunInfoStatus.CONFIG_CHANGED, "config")
+    assert check_run_info(previous_info, {"optimize": "True"}, [], hash_file) == (RunInfoStatus.INPUT_FILES_CHANGED, str(source))
+    source.write_text("int main() { return 1; }")
+    assert check_run_info(previous_info, {"optimize": "True"}, [source], hash_file) == (RunInfoStatus.FILE_CHANGED, str(source))
+    source.unlink()
+    assert check_run_info(previous_info, {"optimize": "True"}, [source], hash_file) == (RunInfoStatus.FILE_NOT_FOUND, str(source))
+
+
+class HangingStep(CompileStep):
+    def run(self) -> int:
+        self.runs += 1
+        time.sleep(5)
+        return 0
+
+
+def test_step_timeout_is_recorded(tmp_path: Path) -> None:
+    (tmp_path / "main.c").write_text("int main() {}")
+    step = HangingStep(ExecutionContext(tmp_path), "compile")
+    db_file = tmp_path / "build" / "state.db"
+    with RunStateStore(db_file) as state_store, patch.object(StepExecutor, "TIMEOUT_GRACE_SEC", 0.1):
+        with pytest.raises(StepTimeoutError, match=r"timed out after 0\.2 seconds"):
+            StepExecutor(step.output_dir, state_store=state_store, timeout_sec=0.2).execute(step)
+
+    with RunStateStore(db_file) as state_store:
+        record = state_store.get_record("compile", "HangingStep")
+    assert record and record.timed_out and record.run_info is None and record.exit_status is None
+
+
+def test_database_of_older_version_is_migrated(tmp_path: Path) -> None:
+    db_file = tmp_path / "state.db"
+    with sqlite3.connect(db_file) as connection:
+        connection.execute(
+            "CREATE TABLE step_runs (group_name TEXT NOT NULL, step_id TEXT NOT NULL, step_name TEXT NOT NULL, step_config TEXT, run_info TEXT,"
+            " started_at REAL, duration REAL, exit_status INTEGER, PRIMARY KEY (group_name, step_id))"
+        )
+        connection.execute("INSERT INTO step_runs VALUES ('', 'Compile', 'Compile', NULL, NULL, 1.0, 2.0, 0)")
+    connection.close()
+
+    with RunStateStore(db_file) as state_store:
+        assert state_store.get_record(None, "Compile") == StepRunRecord("", "Compile", "Compile", started_at=1.0, duration=2.0, exit_status=0)
+        state_store.save_record(StepRunRecord("", "Link", "Link", timed_out=True))
+    with RunStateStore(db_file) as state_store:
+        record = state_store.get_record(None, "Link")
+        assert record and record.timed_out
+
+
+def test_history_keeps_the_last_runs_of_each_series(tmp_path: Path) -> None:
+    with patch("pypeline.run_state.HISTORY_MAX_RUNS", 3), RunStateStore(tmp_path / "state.db") as state_store:
+        state_store.add_history([StepDuration("", "Test", "abc", "ci-1", started_at, 10.0 + started_at) for started_at in range(5)])
+        state_store.add_history([StepDuration("", "Docs", "abc", "ci-1", 5, 3.0)])
+
+    with RunStateStore(tmp_path / "state.db") as state_store:
+        history = state_store.get_history()
+    assert [(duration.step_name, duration.duration) for duration in history] == [("Test", 12.0), ("Test", 13.0), ("Test", 14.0), ("Docs", 3.0)]
@@ -6,8 +6,8 @@ import pytest
 from py_app_dev.core.exceptions import UserNotificationException
 from py_app_dev.core.scoop_wrapper import InstalledScoopApp, ScoopFileElement, ScoopWrapper
 
+from pypeline import package_version_file
 from pypeline.domain.execution_context import ExecutionContext
-from pypeline.main import package_version_file
 from pypeline.steps.scoop_install import ScoopInstall, ScoopInstallExecutionInfo, ScoopManifest, ScoopManifestFile
 
 
@@ -0,0 +1,73 @@
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import pytest
+from py_app_dev.core.runnable import RunInfoStatus
+
+from pypeline.domain.execution_context import ExecutionContext
+from pypeline.domain.pipeline import PipelineStep, PipelineStepConfig
+from pypeline.run_state import RunStateStore
+from pypeline.status import PipelineStatus
+from pypeline.step_executor import StepExecutor
+
+
+class Compile(PipelineStep[ExecutionContext]):
+    def __init__(self, execution_context: ExecutionContext, group_name: Optional[str], config: Optional[Dict[str, Any]] = None) -> None:
+        super().__init__(execution_context, group_name, config)
+        self.source = self.project_root_dir / "main.c"
+        self.binary = self.output_dir / "main.exe"
+
+    def get_name(self) -> str:
+        return self.__class__.__name__
+
+    def run(self) -> int:
+        self.binary.write_text("binary")
+        return 0
+
+    def get_inputs(self) -> List[Path]:
+        return [self.source]
+
+    def get_outputs(self) -> List[Path]:
+        return [self.binary]
+
+    def update_execution_context(self) -> None:
+        pass
+
+
+@pytest.fixture
+def state_store(tmp_path: Path) -> RunStateStore:
+    (tmp_path / "main.c").write_text("int main() {}")
+    step = Compile(ExecutionContext(tmp_path), None, {"optimize": True})
+    step.output_dir.mkdir(parents=True)
+    state_store = RunStateStore(tmp_path / "build" / "state.db")
+    StepExecutor(step.output_dir, state_store=state_store).execute(step)
+    return state_store
+
+
+def _status(state_store: RunStateStore, config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    # The module does not exist: the status must not import (or instantiate) any step
+    pipeline = [PipelineStepConfig(step="Compile", module="not.a.module", config=config), PipelineStepConfig(step="Link", module="not.a.module")]
+    return {status.step_name: status for status in PipelineStatus(pipeline, state_store).get_steps_status()}
+
+
+def test_step_up_to_date(state_store: RunStateStore) -> None:
+    status = _status(state_store, {"optimize": True})
+    assert status["Compile"].up_to_date
+    assert status["Compile"].reason == RunInfoStatus.MATCH.message
+    assert status["Compile"].last_duration is not None
+    assert not status["Link"].up_to_date
+    assert status["Link"].reason == RunInfoStatus.NO_INFO.message
+
+
+def test_changed_file_makes_step_dirty(tmp_path: Path, state_store: RunStateStore) -> None:
+    (tmp_path / "main.c").write_text("int main() { return 1; }")
+    status = _status(state_store, {"optimize": True})["Compile"]
+    assert not status.up_to_date
+    assert status.reason == RunInfoStatus.FILE_CHANGED.message
+    assert status.changed == str(tmp_path / "main.c")
+
+
+def test_changed_config_makes_step_dirty(state_store: RunStateStore) -> None:
+    status = _status(state_store, {"optimize": False})["Compile"]
+    assert not status.up_to_date
+    assert status.changed == "config"
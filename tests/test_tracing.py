@@ -0,0 +1,93 @@
+import json
+import textwrap
+import threading
+from pathlib import Path
+from typing import Any, Dict, List
+
+from typer.testing import CliRunner
+
+from pypeline import tracing
+from pypeline.main import app
+from pypeline.tracing import Tracer, span
+
+
+def _spans(events: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    return {event["name"]: event for event in events if event["ph"] == "X"}
+
+
+def test_spans_are_only_recorded_with_an_active_tracer() -> None:
+    tracer = Tracer()
+    with span("before"):
+        pass
+    with tracing.tracing(tracer):
+        with span("outer", "step", group="build") as span_args:
+            with span("inner"):
+                pass
+            span_args["outcome"] = "executed"
+    with span("after"):
+        pass
+
+    spans = _spans(tracer.events)
+    assert set(spans) == {"outer", "inner"}
+    outer, inner = spans["outer"], spans["inner"]
+    assert outer["cat"] == "step"
+    assert outer["args"] == {"group": "build", "outcome": "executed"}
+    assert outer["ts"] <= inner["ts"] and inner["ts"] + inner["dur"] <= outer["ts"] + outer["dur"]
+    assert tracing._active_tracer is None
+
+
+def test_every_thread_gets_a_named_track() -> None:
+    tracer = Tracer()
+
+    def work() -> None:
+        with span("worker span"):
+            pass
+
+    with tracing.tracing(tracer):
+        with span("main span"):
+            worker = threading.Thread(target=work, name="worker")
+            worker.start()
+            worker.join()
+
+    spans = _spans(tracer.events)
+    assert spans["main span"]["tid"] != spans["worker span"]["tid"]
+    thread_names = {event["tid"]: event["args"]["name"] for event in tracer.events if event["ph"] == "M"}
+    assert thread_names[spans["worker span"]["tid"]] == "worker"
+
+
+def test_run_writes_a_chrome_trace(tmp_path: Path) -> None:
+    tmp_path.joinpath("lint.yaml").write_text(
+        textwrap.dedent(
+            """\
+            pipeline:
+              - step: Lint
+                run: python -c "print('lint')"
+            """
+        )
+    )
+    tmp_path.joinpath("pypeline.yaml").write_text(
+        textwrap.dedent(
+            """\
+            pipeline:
+              - step: Greet
+                run: |
+                  python -c "print('hello')"
+                  python -c "print('world')"
+              - include: lint.yaml
+            """
+        )
+    )
+    trace_file = tmp_path / "build" / "trace.json"
+
+    result = CliRunner().invoke(app, ["run", "--project-dir", tmp_path.as_posix(), "--trace", trace_file.as_posix()])
+
+    assert result.exit_code == 0, result.output
+    events = json.loads(trace_file.read_text())["traceEvents"]
+    names = [event["name"] for event in events if event["ph"] == "X"]
+    assert {"load configuration", "load pypeline.yaml", "load lint.yaml", "Greet", "Lint", "update_execution_context Greet"} <= set(names)
+    assert len([event for event in events if event.get("cat") == "subprocess"]) == 3
+    spans = _spans(events)
+    assert spans["Greet"]["args"] == {"group": None, "outcome": "executed"}
+    # The included file is loaded while loading the including one
+    including, included = spans["load pypeline.yaml"], spans["load lint.yaml"]
+    assert including["ts"] <= included["ts"] <= including["ts"] + including["dur"]
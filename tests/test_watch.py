@@ -0,0 +1,138 @@
+import sys
+from pathlib import Path
+from typing import Callable, ClassVar, Iterable, List, Optional, Set, Type, cast
+
+import pytest
+
+from pypeline.domain.execution_context import ExecutionContext
+from pypeline.domain.pipeline import PipelineStep, PipelineStepReference
+from pypeline.pypeline import PipelineStepsExecutor
+from pypeline.watch import FileWatcher, InotifyFileWatcher, PollingFileWatcher, WatchedDirectory, WatchSession
+
+FILE_WATCHERS: List[Callable[[], FileWatcher]] = [lambda: PollingFileWatcher(0.05)]
+if sys.platform.startswith("linux"):
+    FILE_WATCHERS.append(InotifyFileWatcher)
+
+
+@pytest.mark.parametrize("create_file_watcher", FILE_WATCHERS)
+def test_file_watcher_reports_changed_created_and_deleted_files(tmp_path: Path, create_file_watcher: Callable[[], FileWatcher]) -> None:
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "main.c").write_text("int main;")
+    (tmp_path / "src" / "obsolete.c").write_text("")
+    (tmp_path / "docs").mkdir()
+    file_watcher = create_file_watcher()
+    try:
+        file_watcher.watch([WatchedDirectory(tmp_path / "src", recursive=True), WatchedDirectory(tmp_path, recursive=False)])
+        assert file_watcher.get_changes(0.1) == set()
+
+        (tmp_path / "src" / "main.c").write_text("int main();")
+        (tmp_path / "src" / "obsolete.c").unlink()
+        (tmp_path / "docs" / "index.md").write_text("not watched")
+        assert _collect_changes(file_watcher) >= {tmp_path / "src" / "main.c", tmp_path / "src" / "obsolete.c"}
+
+        # Files in a new subdirectory of a recursively watched directory are reported too
+        (tmp_path / "src" / "lib").mkdir()
+        _collect_changes(file_watcher)
+        (tmp_path / "src" / "lib" / "util.c").write_text("")
+        assert tmp_path / "src" / "lib" / "util.c" in _collect_changes(file_watcher)
+    finally:
+        file_watcher.close()
+
+
+def _collect_changes(file_watcher: FileWatcher) -> Set[Path]:
+    changes = file_watcher.get_changes(5)
+    while more_changes := file_watcher.get_changes(0.2):
+        changes |= more_changes
+    return changes
+
+
+class ScriptedFileWatcher(FileWatcher):
+    """Returns the given change sets one after the other; debouncing waits get nothing."""
+
+    def __init__(self, changes: List[Set[Path]]) -> None:
+        self.changes = changes
+        self.directories: Set[WatchedDirectory] = set()
+
+    def watch(self, directories: Iterable[WatchedDirectory]) -> None:
+        self.directories.update(directories)
+
+    def get_changes(self, timeout: Optional[float] = None) -> Set[Path]:
+        return self.changes.pop(0) if timeout is None else set()
+
+    def close(self) -> None:
+        pass
+
+
+class WatchedStep(PipelineStep[ExecutionContext]):
+    executed: ClassVar[List[str]] = []
+
+    def run(self) -> int:
+        self.executed.append(self.get_name())
+        return 0
+
+    def get_name(self) -> str:
+        return self.__class__.__name__
+
+    def get_inputs(self) -> List[Path]:
+        return [self.project_root_dir / self.config["input"]] if self.config else []
+
+    def get_outputs(self) -> List[Path]:
+        return [self.output_dir]
+
+    def get_needs_dependency_management(self) -> bool:
+        return False
+
+    def update_execution_context(self) -> None:
+        pass
+
+
+def _step_reference(name: str, needs: Optional[List[str]] = None, input: Optional[str] = None) -> PipelineStepReference[PipelineStep[ExecutionContext]]:
+    step_class = cast(Type[PipelineStep[ExecutionContext]], type(name, (WatchedStep,), {}))
+    return PipelineStepReference(None, step_class, {"input": input} if input else None, needs)
+
+
+def _create_watch_session(tmp_path: Path, changes: List[Set[Path]], globs: Optional[List[str]] = None) -> WatchSession:
+    WatchedStep.executed = []
+    (tmp_path / "src").mkdir()
+    steps_references = [
+        _step_reference("Compile", needs=[], input="src/main.c"),
+        _step_reference("Lint", needs=[], input="src"),
+        _step_reference("Link", needs=["Compile"]),
+        _step_reference("Docs", needs=[], input="docs/index.md"),
+        _step_reference("Report"),
+    ]
+
+    def create_executor(steps_to_execute: Optional[Set[int]]) -> PipelineStepsExecutor[ExecutionContext]:
+        return PipelineStepsExecutor[ExecutionContext](ExecutionContext(tmp_path), steps_references, steps_to_execute=steps_to_execute)
+
+    return WatchSession(create_executor, tmp_path, ScriptedFileWatcher(changes), globs)
+
+
+def test_watch_session_runs_the_steps_with_changed_inputs_and_their_dependents(tmp_path: Path) -> None:
+    session = _create_watch_session(
+        tmp_path,
+        [
+            # Changes made by the steps themselves are ignored
+            {tmp_path / "build" / "Compile" / "main.o"},
+            {tmp_path / "src" / "util.c"},
+            {tmp_path / "src" / "main.c"},
+        ],
+    )
+    session.run(max_runs=3)
+
+    assert WatchedStep.executed == [
+        *("Compile", "Lint", "Link", "Docs", "Report"),
+        *("Lint", "Report"),
+        *("Compile", "Lint", "Link", "Report"),
+    ]
+    # The directory of a missing input (docs) cannot be watched yet
+    assert session.file_watcher.directories == {WatchedDirectory(tmp_path / "src", recursive=True), WatchedDirectory(tmp_path / "src", recursive=False)}  # type: ignore[attr-defined]
+
+
+def test_watch_session_runs_all_steps_when_a_watched_glob_matches(tmp_path: Path) -> None:
+    session = _create_watch_session(tmp_path, [{tmp_path / "pypeline.yaml"}, {tmp_path / "config" / "app.cfg"}], globs=["config/*.cfg"])
+    (tmp_path / "config").mkdir()
+    session.run(max_runs=2)
+
+    assert WatchedStep.executed == ["Compile", "Lint", "Link", "Docs", "Report"] * 2
+    assert WatchedDirectory(tmp_path / "config", recursive=False) in session.file_watcher.directories  # type: ignore[attr-defined]
@@ -1,17 +1,19 @@
 import json
+import subprocess
+import sys
 from pathlib import Path
 from typing import Any
-from unittest.mock import Mock
+from unittest.mock import Mock, patch
 
 import pytest
 import yaml
 from py_app_dev.core.data_registry import DataRegistry
 from py_app_dev.core.exceptions import UserNotificationException
 
+from pypeline import package_version_file
 from pypeline.domain.artifacts import ProjectArtifactsLocator
 from pypeline.domain.execution_context import ExecutionContext
 from pypeline.domain.external_project import ExternalProject
-from pypeline.main import package_version_file
 from pypeline.steps.west_install import (
     WestDependency,
     WestInstall,
@@ -293,6 +295,7 @@ def west_execution_context(project: Path) -> Mock:
     context.data_registry = DataRegistry()
     context.user_config_files = []
     context.get_input.return_value = None
+    context.force_run = False
     return context
 
 
@@ -548,6 +551,8 @@ manifest:
 
     assert workspace_dir in step.installed_dirs
     assert dep_dir in step.installed_dirs
+    # Only the dependencies and the west metadata are cached, never the whole workspace (the build dir by default)
+    assert step.get_cache_outputs() == [step._output_manifest_file, step._install_result_file, workspace_dir / ".west", dep_dir]
 
 
 def test_west_install_get_inputs_includes_source_manifest(west_execution_context: Mock) -> None:
@@ -570,6 +575,17 @@ def test_west_install_get_outputs(west_execution_context: Mock) -> None:
     assert step._install_result_file in outputs
 
 
+def test_west_install_fingerprints_dependency_dirs_only(west_execution_context: Mock) -> None:
+    step = WestInstall(west_execution_context, "group_name")
+    workspace_dir = ProjectArtifactsLocator(west_execution_context.project_root_dir).build_dir
+
+    fingerprint = step.get_output_fingerprint(workspace_dir / "dep1")
+    assert fingerprint
+    assert ".git" in fingerprint.ignore
+    # The workspace defaults to the build dir, which also holds the outputs of the other steps
+    assert step.get_output_fingerprint(workspace_dir) is None
+
+
 def test_west_install_update_execution_context(west_execution_context: Mock) -> None:
     # Create result file with installed dirs
     step = WestInstall(west_execution_context, "group_name")
@@ -725,6 +741,208 @@ manifest:
     assert command == ["west", "update"]
 
 
+def test_west_install_west_update_uses_the_cache_dir(west_execution_context: Mock) -> None:
+    (west_execution_context.project_root_dir / "west.yaml").write_text(FETCH_MANIFEST)
+    west_execution_context.create_process_executor.return_value = Mock()
+
+    WestInstall(west_execution_context, "group_name", {"cache_dir": "~/.cache/west"}).run()
+
+    command = west_execution_context.create_process_executor.call_args_list[1][0][0]
+    assert command == ["west", "update", "--auto-cache", (Path.home() / ".cache/west").as_posix()]
+
+
+def test_west_install_fetch_jobs_updates_the_repositories_concurrently(west_execution_context: Mock) -> None:
+    (west_execution_context.project_root_dir / "west.yaml").write_text(FETCH_MANIFEST)
+    west_execution_context.create_process_executor.return_value = Mock()
+
+    with patch("pypeline.steps.west_install.execute_concurrently", return_value=[None, None]) as execute_concurrently:
+        WestInstall(west_execution_context, "group_name", {"fetch_jobs": 4, "cache_dir": "cache"}).run()
+
+    cache_dir = (west_execution_context.project_root_dir / "cache").as_posix()
+    update_commands = [call[0][0] for call in west_execution_context.create_process_executor.call_args_list[1:]]
+    assert update_commands == [
+        ["west", "update", "--auto-cache", cache_dir, "zephyr"],
+        ["west", "update", "--auto-cache", cache_dir, "hal"],
+    ]
+    assert execute_concurrently.call_args[0][1] == 4
+
+
+def test_west_install_fetch_jobs_reports_the_failed_updates(west_execution_context: Mock) -> None:
+    (west_execution_context.project_root_dir / "west.yaml").write_text(FETCH_MANIFEST)
+    west_execution_context.create_process_executor.return_value = Mock()
+
+    with patch("pypeline.steps.west_install.execute_concurrently", return_value=[None, RuntimeError("fetch failed")]):
+        with pytest.raises(UserNotificationException, match=r"1 of 2 'west update' commands failed:\n  west update hal: fetch failed"):
+            WestInstall(west_execution_context, "group_name", {"fetch_jobs": 2}).run()
+
+
+def _install_fetch_manifest(west_execution_context: Mock, manifest: str) -> WestInstall[ExecutionContext]:
+    """Run the step on the manifest, with the project directories west would create."""
+    (west_execution_context.project_root_dir / "west.yaml").write_text(manifest)
+    west_execution_context.create_process_executor.reset_mock()
+    step = WestInstall(west_execution_context, "group_name")
+    (step._west_workspace_dir / ".west").mkdir(parents=True, exist_ok=True)
+    for project in yaml.safe_load(manifest)["manifest"]["projects"]:
+        (step._west_workspace_dir / project["path"]).mkdir(parents=True, exist_ok=True)
+    step.run()
+    return step
+
+
+def _update_commands(west_execution_context: Mock) -> list[list[str]]:
+    return [call[0][0] for call in west_execution_context.create_process_executor.call_args_list if call[0][0][1] == "update"]
+
+
+def test_west_install_updates_only_the_changed_projects(west_execution_context: Mock) -> None:
+    west_execution_context.create_process_executor.return_value = Mock()
+    _install_fetch_manifest(west_execution_context, FETCH_MANIFEST)
+    assert _update_commands(west_execution_context) == [["west", "update"]]
+
+    manifest = FETCH_MANIFEST.replace(HAL_COMMIT, "d" * 40)
+    _install_fetch_manifest(west_execution_context, manifest)
+    assert _update_commands(west_execution_context) == [["west", "update", "hal"]]
+
+    manifest = manifest.replace("path: zephyr", "path: external/zephyr")
+    step = _install_fetch_manifest(west_execution_context, manifest)
+    assert _update_commands(west_execution_context) == [["west", "update", "zephyr"]]
+    assert [project.url for project in step.install_result.installed_projects] == ["https://github.com/org/zephyr", "https://github.com/org/hal"]
+
+    manifest = manifest.replace("https://github.com/org", "https://mirror.org/org")
+    _install_fetch_manifest(west_execution_context, manifest)
+    assert _update_commands(west_execution_context) == [["west", "update"]]
+
+    # Nothing changed: no update at all
+    _install_fetch_manifest(west_execution_context, manifest)
+    assert _update_commands(west_execution_context) == []
+
+    # Unless the run is forced
+    west_execution_context.force_run = True
+    _install_fetch_manifest(west_execution_context, manifest)
+    assert _update_commands(west_execution_context) == [["west", "update"]]
+
+
+@pytest.mark.parametrize("revision", ["main", "v1.0.0", "d" * 7])
+def test_west_install_always_updates_the_projects_not_pinned_to_a_commit(west_execution_context: Mock, revision: str) -> None:
+    west_execution_context.create_process_executor.return_value = Mock()
+    manifest = FETCH_MANIFEST.replace(HAL_COMMIT, revision)
+    _install_fetch_manifest(west_execution_context, manifest)
+
+    # The branch or tag may point to another commit since the last run
+    _install_fetch_manifest(west_execution_context, manifest)
+    assert _update_commands(west_execution_context) == [["west", "update", "hal"]]
+
+
+def test_west_install_updates_a_project_whose_directory_is_missing(west_execution_context: Mock) -> None:
+    west_execution_context.create_process_executor.return_value = Mock()
+    step = _install_fetch_manifest(west_execution_context, FETCH_MANIFEST)
+    (step._west_workspace_dir / "hal").rmdir()
+
+    step.run()
+
+    assert _update_commands(west_execution_context) == [["west", "update"], ["west", "update", "hal"]]
+
+
+def test_west_install_clone_defaults_apply_to_the_fetch(west_execution_context: Mock) -> None:
+    manifest = FETCH_MANIFEST.replace("      path: hal\n", "      path: hal\n      clone-depth: 5\n")
+    (west_execution_context.project_root_dir / "west.yaml").write_text(manifest)
+    west_execution_context.create_process_executor.return_value = Mock()
+    step = WestInstall(west_execution_context, "group_name", {"clone_depth": 1, "clone_filter": "blob:none"})
+
+    step.run()
+
+    # The step-wide depth only applies to the projects without their own
+    stored = yaml.safe_load(step._output_manifest_file.read_text())
+    assert [project.get("clone-depth") for project in stored["manifest"]["projects"]] == [1, 5]
+    assert _update_commands(west_execution_context) == [["west", "update", "--fetch-opt=--filter=blob:none"]]
+    result = WestInstallResult.from_json_file(step._install_result_file)
+    assert (result.clone_depth, result.clone_filter) == (1, "blob:none")
+    assert step.get_config() == {"clone_depth": "1", "clone_filter": "blob:none"}
+
+
+def test_west_install_changed_clone_settings_update_all_projects(west_execution_context: Mock) -> None:
+    west_execution_context.create_process_executor.return_value = Mock()
+    step = _install_fetch_manifest(west_execution_context, FETCH_MANIFEST)
+    west_execution_context.create_process_executor.reset_mock()
+
+    WestInstall(west_execution_context, "group_name", {"clone_filter": "tree:0"}).run()
+
+    assert _update_commands(west_execution_context) == [["west", "update", "--fetch-opt=--filter=tree:0"]]
+    assert WestInstallResult.from_json_file(step._install_result_file).clone_filter == "tree:0"
+
+
+def _create_west_simulator(west_execution_context: Mock, remote_dir: Path) -> list[list[str]]:
+    """Executors cloning the projects of the generated manifest on 'west update'. Return the list of update commands."""
+    update_commands: list[list[str]] = []
+
+    def create_process_executor(command: list[str], cwd: Path, log_file: Path | None = None) -> Mock:
+        executor = Mock()
+        if command[1] == "update":
+            update_commands.append(command)
+            # The generated manifest is next to the step log
+            manifest = yaml.safe_load((log_file or cwd).with_name("west.yaml").read_text())["manifest"]
+            projects = [project for project in manifest["projects"] if project["name"] in command[2:] or len(command) == 2]
+
+            def clone() -> None:
+                for project in projects:
+                    subprocess.run(["git", "clone", "--quiet", "--branch", project["revision"], (remote_dir / project["name"]).as_uri(), cwd / project["path"]], check=True)  # noqa: S603, S607
+
+            executor.execute.side_effect = clone
+        return executor
+
+    west_execution_context.create_process_executor.side_effect = create_process_executor
+    return update_commands
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Symbolic links require the developer mode")
+def test_west_install_links_the_checkouts_of_the_store(west_execution_context: Mock, tmp_path: Path) -> None:
+    remote_dir = tmp_path / "remote"
+    (remote_dir / "lib").mkdir(parents=True)
+    for command in (["init", "--quiet"], ["commit", "--quiet", "--allow-empty", "-m", "lib"], ["tag", "v1.0"]):
+        subprocess.run(["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *command], cwd=remote_dir / "lib", check=True)  # noqa: S603, S607
+    manifest = {"remotes": [{"name": "origin", "url-base": remote_dir.as_uri()}], "projects": [{"name": "lib", "remote": "origin", "revision": "v1.0", "path": "lib"}]}
+    (west_execution_context.project_root_dir / "west.yaml").write_text(yaml.dump({"manifest": manifest}))
+    update_commands = _create_west_simulator(west_execution_context, remote_dir)
+    config = {"store_dir": (tmp_path / "store").as_posix(), "revision_scoped_paths": True}
+
+    step = WestInstall(west_execution_context, "deps", {**config, "workspace_dir": "workspace1"})
+    step.run()
+    # A second workspace links the checkout of the first one
+    other_step = WestInstall(west_execution_context, "other_deps", {**config, "workspace_dir": "workspace2"})
+    other_step.run()
+
+    assert update_commands == [["west", "update"]]
+    lib_dirs = [step._west_workspace_dir / "lib/v1.0", other_step._west_workspace_dir / "lib/v1.0"]
+    assert all(lib_dir.is_symlink() for lib_dir in lib_dirs)
+    assert lib_dirs[0].resolve() == lib_dirs[1].resolve()
+    assert lib_dirs[0].resolve().is_relative_to(tmp_path / "store")
+    assert [project.path for project in other_step.install_result.installed_projects] == [lib_dirs[1]]
+    assert step.get_cache_outputs() is None
+
+    # Without the store west gets its own checkout again, the shared one is left alone
+    WestInstall(west_execution_context, "deps", {"workspace_dir": "workspace1", "revision_scoped_paths": True}).run()
+    assert update_commands[-1] == ["west", "update"]
+    assert not lib_dirs[0].is_symlink()
+    assert lib_dirs[1].resolve().is_dir()
+
+
+ZEPHYR_COMMIT = "a" * 40
+HAL_COMMIT = "b" * 40
+FETCH_MANIFEST = f"""
+manifest:
+  remotes:
+    - name: origin
+      url-base: https://github.com/org
+  projects:
+    - name: zephyr
+      remote: origin
+      revision: {ZEPHYR_COMMIT}
+      path: zephyr
+    - name: hal
+      remote: origin
+      revision: {HAL_COMMIT}
+      path: hal
+"""
+
+
 def test_west_install_result_file_created_after_run(west_execution_context: Mock) -> None:
     manifest_content = """
 manifest: